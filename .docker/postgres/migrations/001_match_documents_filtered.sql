@@ -0,0 +1,46 @@
+-- Índices de expressão para os filtros de metadata usados na busca vetorial
+CREATE INDEX IF NOT EXISTS documents_type_user_created_idx
+    ON documents ((metadata->>'type'), (metadata->>'user_id'), created_at DESC);
+
+-- Busca vetorial com filtros de tipo, usuário e período aplicados antes do ORDER BY/LIMIT.
+-- Filtros NULL são ignorados. O iterative scan do pgvector (>= 0.8.0) continua varrendo o
+-- índice até completar match_count linhas que passem nos filtros.
+CREATE
+OR REPLACE FUNCTION match_documents_filtered(
+    query_embedding VECTOR(384),
+    match_count INT DEFAULT 5,
+    similarity_threshold FLOAT DEFAULT 0.5,
+    filter_type TEXT DEFAULT NULL,
+    filter_user_id TEXT DEFAULT NULL,
+    created_after TIMESTAMPTZ DEFAULT NULL,
+    created_before TIMESTAMPTZ DEFAULT NULL
+)
+RETURNS TABLE (
+    id BIGINT,
+    content TEXT,
+    metadata JSONB,
+    similarity FLOAT,
+    created_at TIMESTAMPTZ
+)
+LANGUAGE sql STABLE
+SET ivfflat.iterative_scan = 'relaxed_order'
+AS $$
+WITH candidates AS MATERIALIZED (
+    SELECT d.id::BIGINT AS id,
+           d.content,
+           d.metadata,
+           1 - (d.embedding <=> query_embedding) AS similarity,
+           d.created_at
+    FROM documents d
+    WHERE (filter_type IS NULL OR d.metadata->>'type' = filter_type)
+      AND (filter_user_id IS NULL OR d.metadata->>'user_id' = filter_user_id)
+      AND (created_after IS NULL OR d.created_at >= created_after)
+      AND (created_before IS NULL OR d.created_at < created_before)
+    ORDER BY d.embedding <=> query_embedding
+    LIMIT match_count
+)
+SELECT *
+FROM candidates
+WHERE similarity > similarity_threshold
+ORDER BY similarity DESC;
+$$;
@@ -0,0 +1,90 @@
+-- Hash do conteúdo para deduplicação indexada (substitui a busca por igualdade no TEXT)
+ALTER TABLE documents
+    ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+CREATE
+OR REPLACE FUNCTION document_content_hash(p_content TEXT)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE STRICT AS $$
+SELECT encode(sha256(convert_to(p_content, 'UTF8')), 'hex');
+$$;
+
+-- Chave de deduplicação: o hash do conteúdo, exceto para mensagens de chat, que se repetem
+-- legitimamente ("ok", "obrigado") e incluem usuário, papel e horário (ver migration 008)
+CREATE
+OR REPLACE FUNCTION document_dedup_hash(p_doc_type TEXT, p_content TEXT, p_metadata JSONB)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+SELECT CASE
+           WHEN p_doc_type = 'chat_history' THEN document_content_hash(
+               concat_ws('|', COALESCE(p_metadata->>'user_id', ''), COALESCE(p_metadata->>'role', ''),
+                         COALESCE(p_metadata->>'timestamp', ''), p_content))
+           ELSE document_content_hash(p_content)
+       END;
+$$;
+
+-- Preenche o hash em qualquer caminho de escrita (inclusive inserts diretos na tabela)
+CREATE
+OR REPLACE FUNCTION documents_set_content_hash()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.content_hash := document_dedup_hash(NEW.metadata->>'type', NEW.content, NEW.metadata);
+RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS documents_content_hash_trigger ON documents;
+CREATE TRIGGER documents_content_hash_trigger
+    BEFORE INSERT OR UPDATE OF content ON documents
+    FOR EACH ROW EXECUTE FUNCTION documents_set_content_hash();
+
+-- Backfill das linhas existentes
+UPDATE documents
+SET content_hash = document_dedup_hash(metadata->>'type', content, metadata)
+WHERE content_hash IS NULL;
+
+-- Remove duplicatas antigas, mantendo a linha mais antiga de cada chave (mensagens de chat
+-- repetidas por usuários, papéis ou horários diferentes têm chaves diferentes e são mantidas)
+DELETE FROM documents d
+    USING documents older
+WHERE d.content_hash = older.content_hash
+  AND d.id > older.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS documents_content_hash_idx ON documents (content_hash);
+
+-- Upsert idempotente em uma única ida ao banco.
+-- Sem embedding: apenas verifica se o conteúdo já existe (retorna vazio se não existir,
+-- para que o chamador gere o embedding). Com embedding: insere ou, em caso de conflito,
+-- retorna a linha existente.
+CREATE
+OR REPLACE FUNCTION upsert_document(
+    p_content TEXT,
+    p_metadata JSONB DEFAULT '{}'::JSONB,
+    p_embedding VECTOR(384) DEFAULT NULL
+)
+RETURNS TABLE (
+    id BIGINT,
+    inserted BOOLEAN
+)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_hash TEXT := document_dedup_hash(p_metadata->>'type', p_content, COALESCE(p_metadata, '{}'::JSONB));
+BEGIN
+    IF p_embedding IS NOT NULL THEN
+        RETURN QUERY
+        INSERT INTO documents AS d (content, metadata, embedding)
+        VALUES (p_content, COALESCE(p_metadata, '{}'::JSONB), p_embedding)
+        ON CONFLICT (content_hash) DO NOTHING
+        RETURNING d.id::BIGINT, TRUE;
+        IF FOUND THEN
+            RETURN;
+        END IF;
+    END IF;
+
+    RETURN QUERY
+    SELECT d.id::BIGINT, FALSE
+    FROM documents d
+    WHERE d.content_hash = v_hash;
+END;
+$$;
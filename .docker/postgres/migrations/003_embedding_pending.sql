@@ -0,0 +1,24 @@
+-- Documentos gravados sem embedding (ex: histórico de chat), preenchidos depois em lote
+ALTER TABLE documents
+    ADD COLUMN IF NOT EXISTS embedding_pending BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE INDEX IF NOT EXISTS documents_embedding_pending_idx
+    ON documents (id)
+    WHERE embedding_pending;
+
+-- Grava os embeddings de um lote em uma única chamada.
+-- p_rows: [{"id": 1, "embedding": [0.1, ...]}, ...]
+CREATE
+OR REPLACE FUNCTION set_document_embeddings(p_rows JSONB)
+RETURNS INT
+LANGUAGE sql AS $$
+WITH updated AS (
+    UPDATE documents d
+    SET embedding = (r->>'embedding')::VECTOR(384),
+        embedding_pending = FALSE
+    FROM jsonb_array_elements(p_rows) r
+    WHERE d.id = (r->>'id')::BIGINT
+    RETURNING d.id
+)
+SELECT count(*)::INT FROM updated;
+$$;
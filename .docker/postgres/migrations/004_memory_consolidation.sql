@@ -0,0 +1,76 @@
+-- Memórias removidas pela consolidação, com referência à memória que as substituiu
+CREATE TABLE IF NOT EXISTS memory_provenance (
+    id BIGINT PRIMARY KEY,
+    superseded_by BIGINT NOT NULL,
+    content TEXT NOT NULL,
+    metadata JSONB,
+    created_at TIMESTAMP WITH TIME ZONE,
+    consolidated_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now())
+);
+
+CREATE INDEX IF NOT EXISTS memory_provenance_superseded_by_idx
+    ON memory_provenance (superseded_by);
+
+-- Usuários com memórias e o maior id de cada um (permite pular quem não tem memórias novas)
+CREATE
+OR REPLACE FUNCTION memory_user_stats()
+RETURNS TABLE (
+    user_id TEXT,
+    max_id BIGINT,
+    memory_count BIGINT
+)
+LANGUAGE sql STABLE AS $$
+SELECT metadata->>'user_id', max(id)::BIGINT, count(*)::BIGINT
+FROM documents
+WHERE metadata->>'type' = 'memory'
+GROUP BY metadata->>'user_id';
+$$;
+
+-- Consolida um grupo de memórias quase idênticas em uma transação: arquiva as removidas
+-- em memory_provenance, registra seus ids no metadata da memória mantida e as apaga.
+CREATE
+OR REPLACE FUNCTION consolidate_memories(
+    p_keep_id BIGINT,
+    p_remove_ids BIGINT[]
+)
+RETURNS INT
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_removed INT;
+BEGIN
+    INSERT INTO memory_provenance (id, superseded_by, content, metadata, created_at)
+    SELECT d.id, p_keep_id, d.content, d.metadata, d.created_at
+    FROM documents d
+    WHERE d.id = ANY (p_remove_ids)
+    ON CONFLICT (id) DO NOTHING;
+
+    -- Memórias já consolidadas anteriormente passam a apontar para a nova memória mantida
+    UPDATE memory_provenance
+    SET superseded_by = p_keep_id
+    WHERE superseded_by = ANY (p_remove_ids);
+
+    UPDATE documents d
+    SET metadata = d.metadata || jsonb_build_object(
+        'consolidated_ids',
+        COALESCE(d.metadata->'consolidated_ids', '[]'::JSONB) || (
+            SELECT COALESCE(jsonb_agg(x.removed_id), '[]'::JSONB)
+            FROM (
+                SELECT r.removed_id
+                FROM unnest(p_remove_ids) AS r(removed_id)
+                UNION
+                SELECT (jsonb_array_elements_text(o.metadata->'consolidated_ids'))::BIGINT
+                FROM documents o
+                WHERE o.id = ANY (p_remove_ids)
+            ) x
+        )
+    )
+    WHERE d.id = p_keep_id;
+
+    DELETE FROM documents d
+    WHERE d.id = ANY (p_remove_ids)
+      AND d.id <> p_keep_id
+      AND d.metadata->>'type' = 'memory';
+    GET DIAGNOSTICS v_removed = ROW_COUNT;
+    RETURN v_removed;
+END;
+$$;
@@ -0,0 +1,199 @@
+-- Particiona documents por tipo (memory, chat_history, search_result e knowledge, que
+-- recebe qualquer outro tipo), com índices e retenção independentes por partição.
+-- A coluna doc_type é a chave de partição; filtros por doc_type permitem ao planner
+-- descartar as demais partições.
+
+-- Tipo de um documento a partir do metadata (documentos sem tipo são da base de conhecimento)
+CREATE
+OR REPLACE FUNCTION document_type(p_metadata JSONB)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+SELECT COALESCE(p_metadata->>'type', 'knowledge');
+$$;
+
+-- A sequência passa a pertencer à nova tabela (senão seria removida junto com a antiga)
+ALTER SEQUENCE documents_id_seq OWNED BY NONE;
+
+CREATE TABLE documents_partitioned (
+    id BIGINT NOT NULL DEFAULT nextval('documents_id_seq'),
+    doc_type TEXT NOT NULL DEFAULT 'knowledge',
+    content TEXT NOT NULL,
+    metadata JSONB,
+    embedding VECTOR(384),
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    content_hash TEXT,
+    embedding_pending BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (id, doc_type)
+) PARTITION BY LIST (doc_type);
+
+CREATE TABLE documents_memory PARTITION OF documents_partitioned FOR VALUES IN ('memory');
+CREATE TABLE documents_chat_history PARTITION OF documents_partitioned FOR VALUES IN ('chat_history');
+CREATE TABLE documents_search_result PARTITION OF documents_partitioned FOR VALUES IN ('search_result');
+CREATE TABLE documents_knowledge PARTITION OF documents_partitioned DEFAULT;
+
+INSERT INTO documents_partitioned (id, doc_type, content, metadata, embedding, created_at,
+                                   content_hash, embedding_pending)
+SELECT id, document_type(metadata), content, metadata, embedding, created_at,
+       COALESCE(content_hash, document_content_hash(content)), embedding_pending
+FROM documents;
+
+DROP TABLE documents;
+ALTER TABLE documents_partitioned RENAME TO documents;
+ALTER SEQUENCE documents_id_seq OWNED BY documents.id;
+
+DROP TRIGGER IF EXISTS documents_content_hash_trigger ON documents;
+CREATE TRIGGER documents_content_hash_trigger
+    BEFORE INSERT OR UPDATE OF content ON documents
+    FOR EACH ROW EXECUTE FUNCTION documents_set_content_hash();
+
+-- Índices comuns a todas as partições
+CREATE UNIQUE INDEX documents_type_content_hash_idx ON documents (doc_type, content_hash);
+CREATE INDEX documents_user_created_idx ON documents ((metadata->>'user_id'), created_at DESC);
+CREATE INDEX documents_created_at_idx ON documents (created_at);
+CREATE INDEX documents_embedding_pending_idx ON documents (id) WHERE embedding_pending;
+
+-- Índices vetoriais por partição, dimensionados pelo volume de cada tipo
+CREATE INDEX documents_memory_embedding_idx
+    ON documents_memory USING ivfflat (embedding vector_cosine_ops) WITH (lists = 50);
+CREATE INDEX documents_chat_history_embedding_idx
+    ON documents_chat_history USING ivfflat (embedding vector_cosine_ops) WITH (lists = 200);
+CREATE INDEX documents_search_result_embedding_idx
+    ON documents_search_result USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+CREATE INDEX documents_knowledge_embedding_idx
+    ON documents_knowledge USING ivfflat (embedding vector_cosine_ops) WITH (lists = 50);
+
+-- Retenção por tipo (max_age NULL = mantido para sempre)
+CREATE TABLE IF NOT EXISTS document_retention (
+    doc_type TEXT PRIMARY KEY,
+    max_age INTERVAL
+);
+
+INSERT INTO document_retention (doc_type, max_age)
+VALUES ('chat_history', INTERVAL '90 days'),
+       ('search_result', INTERVAL '30 days'),
+       ('memory', NULL),
+       ('knowledge', NULL)
+ON CONFLICT (doc_type) DO NOTHING;
+
+-- Remove até p_batch_size documentos expirados de cada tipo com retenção definida.
+-- O chamador repete enquanto algum tipo retornar p_batch_size removidos.
+CREATE
+OR REPLACE FUNCTION purge_expired_documents(p_batch_size INT DEFAULT 5000)
+RETURNS TABLE (
+    purged_type TEXT,
+    removed BIGINT
+)
+LANGUAGE plpgsql AS $$
+DECLARE
+    r RECORD;
+BEGIN
+    FOR r IN SELECT dr.doc_type, dr.max_age FROM document_retention dr WHERE dr.max_age IS NOT NULL LOOP
+        WITH expired AS (
+            SELECT d.id
+            FROM documents d
+            WHERE d.doc_type = r.doc_type
+              AND d.created_at < now() - r.max_age
+            ORDER BY d.created_at
+            LIMIT p_batch_size
+        )
+        DELETE FROM documents d
+            USING expired e
+        WHERE d.doc_type = r.doc_type
+          AND d.id = e.id;
+        GET DIAGNOSTICS removed = ROW_COUNT;
+        purged_type := r.doc_type;
+        RETURN NEXT;
+    END LOOP;
+END;
+$$;
+
+-- Funções anteriores reescritas para filtrar pela chave de partição
+
+CREATE
+OR REPLACE FUNCTION match_documents_filtered(
+    query_embedding VECTOR(384),
+    match_count INT DEFAULT 5,
+    similarity_threshold FLOAT DEFAULT 0.5,
+    filter_type TEXT DEFAULT NULL,
+    filter_user_id TEXT DEFAULT NULL,
+    created_after TIMESTAMPTZ DEFAULT NULL,
+    created_before TIMESTAMPTZ DEFAULT NULL
+)
+RETURNS TABLE (
+    id BIGINT,
+    content TEXT,
+    metadata JSONB,
+    similarity FLOAT,
+    created_at TIMESTAMPTZ
+)
+LANGUAGE sql STABLE
+SET ivfflat.iterative_scan = 'relaxed_order'
+AS $$
+WITH candidates AS MATERIALIZED (
+    SELECT d.id::BIGINT AS id,
+           d.content,
+           d.metadata,
+           1 - (d.embedding <=> query_embedding) AS similarity,
+           d.created_at
+    FROM documents d
+    WHERE (filter_type IS NULL OR d.doc_type = filter_type)
+      AND (filter_user_id IS NULL OR d.metadata->>'user_id' = filter_user_id)
+      AND (created_after IS NULL OR d.created_at >= created_after)
+      AND (created_before IS NULL OR d.created_at < created_before)
+    ORDER BY d.embedding <=> query_embedding
+    LIMIT match_count
+)
+SELECT *
+FROM candidates
+WHERE similarity > similarity_threshold
+ORDER BY similarity DESC;
+$$;
+
+-- O mesmo conteúdo pode existir em tipos diferentes (ex: uma memória igual a uma mensagem)
+CREATE
+OR REPLACE FUNCTION upsert_document(
+    p_content TEXT,
+    p_metadata JSONB DEFAULT '{}'::JSONB,
+    p_embedding VECTOR(384) DEFAULT NULL
+)
+RETURNS TABLE (
+    id BIGINT,
+    inserted BOOLEAN
+)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_hash TEXT := document_content_hash(p_content);
+    v_type TEXT := document_type(p_metadata);
+BEGIN
+    IF p_embedding IS NOT NULL THEN
+        RETURN QUERY
+        INSERT INTO documents AS d (doc_type, content, metadata, embedding)
+        VALUES (v_type, p_content, COALESCE(p_metadata, '{}'::JSONB), p_embedding)
+        ON CONFLICT (doc_type, content_hash) DO NOTHING
+        RETURNING d.id::BIGINT, TRUE;
+        IF FOUND THEN
+            RETURN;
+        END IF;
+    END IF;
+
+    RETURN QUERY
+    SELECT d.id::BIGINT, FALSE
+    FROM documents d
+    WHERE d.doc_type = v_type
+      AND d.content_hash = v_hash;
+END;
+$$;
+
+CREATE
+OR REPLACE FUNCTION memory_user_stats()
+RETURNS TABLE (
+    user_id TEXT,
+    max_id BIGINT,
+    memory_count BIGINT
+)
+LANGUAGE sql STABLE AS $$
+SELECT metadata->>'user_id', max(id)::BIGINT, count(*)::BIGINT
+FROM documents
+WHERE doc_type = 'memory'
+GROUP BY metadata->>'user_id';
+$$;
@@ -0,0 +1,74 @@
+-- Índices vetoriais compactos sobre os mesmos embeddings: halfvec (float16, metade do
+-- tamanho) e quantização binária (1 bit por dimensão, 32x menor). A coluna embedding
+-- continua em precisão cheia e é usada para reordenar os candidatos do índice compacto.
+-- Requer pgvector >= 0.7 (binary_quantize, halfvec) e >= 0.8 para o iterative scan.
+CREATE INDEX IF NOT EXISTS documents_embedding_halfvec_idx
+    ON documents USING hnsw ((embedding::halfvec(384)) halfvec_cosine_ops);
+
+CREATE INDEX IF NOT EXISTS documents_embedding_binary_idx
+    ON documents USING hnsw ((binary_quantize(embedding)::bit(384)) bit_hamming_ops);
+
+-- Busca filtrada no índice compacto (quantization = 'halfvec' ou 'binary'), buscando
+-- match_count * rescore_factor candidatos e reordenando-os pela distância em precisão cheia.
+CREATE
+OR REPLACE FUNCTION match_documents_quantized(
+    query_embedding VECTOR(384),
+    match_count INT DEFAULT 5,
+    similarity_threshold FLOAT DEFAULT 0.5,
+    filter_type TEXT DEFAULT NULL,
+    filter_user_id TEXT DEFAULT NULL,
+    created_after TIMESTAMPTZ DEFAULT NULL,
+    created_before TIMESTAMPTZ DEFAULT NULL,
+    quantization TEXT DEFAULT 'halfvec',
+    rescore_factor INT DEFAULT 4
+)
+RETURNS TABLE (
+    id BIGINT,
+    content TEXT,
+    metadata JSONB,
+    similarity FLOAT,
+    created_at TIMESTAMPTZ
+)
+LANGUAGE plpgsql STABLE
+SET hnsw.iterative_scan = 'relaxed_order'
+AS $$
+BEGIN
+    IF quantization = 'binary' THEN
+        RETURN QUERY
+        WITH candidates AS MATERIALIZED (
+            SELECT d.id, d.content, d.metadata, d.embedding, d.created_at
+            FROM documents d
+            WHERE (filter_type IS NULL OR d.doc_type = filter_type)
+              AND (filter_user_id IS NULL OR d.metadata->>'user_id' = filter_user_id)
+              AND (created_after IS NULL OR d.created_at >= created_after)
+              AND (created_before IS NULL OR d.created_at < created_before)
+            ORDER BY binary_quantize(d.embedding)::bit(384) <~> binary_quantize(query_embedding)::bit(384)
+            LIMIT match_count * rescore_factor
+        )
+        SELECT c.id::BIGINT, c.content, c.metadata,
+               (1 - (c.embedding <=> query_embedding))::FLOAT, c.created_at
+        FROM candidates c
+        WHERE 1 - (c.embedding <=> query_embedding) > similarity_threshold
+        ORDER BY c.embedding <=> query_embedding
+        LIMIT match_count;
+    ELSE
+        RETURN QUERY
+        WITH candidates AS MATERIALIZED (
+            SELECT d.id, d.content, d.metadata, d.embedding, d.created_at
+            FROM documents d
+            WHERE (filter_type IS NULL OR d.doc_type = filter_type)
+              AND (filter_user_id IS NULL OR d.metadata->>'user_id' = filter_user_id)
+              AND (created_after IS NULL OR d.created_at >= created_after)
+              AND (created_before IS NULL OR d.created_at < created_before)
+            ORDER BY d.embedding::halfvec(384) <=> query_embedding::halfvec(384)
+            LIMIT match_count * rescore_factor
+        )
+        SELECT c.id::BIGINT, c.content, c.metadata,
+               (1 - (c.embedding <=> query_embedding))::FLOAT, c.created_at
+        FROM candidates c
+        WHERE 1 - (c.embedding <=> query_embedding) > similarity_threshold
+        ORDER BY c.embedding <=> query_embedding
+        LIMIT match_count;
+    END IF;
+END;
+$$;
@@ -0,0 +1,116 @@
+-- Troca os índices ivfflat (criados com a tabela vazia, com listas mal dimensionadas) por
+-- HNSW, que não depende de treino sobre os dados existentes, e reescreve as funções de
+-- busca para que o ORDER BY pela distância use o índice antes de aplicar o threshold.
+
+-- (Re)cria o índice HNSW de cada partição com os parâmetros informados.
+-- Ex: SELECT rebuild_vector_indexes(24, 128); -- mais recall, build mais lento
+CREATE
+OR REPLACE FUNCTION rebuild_vector_indexes(p_m INT DEFAULT 16, p_ef_construction INT DEFAULT 64)
+RETURNS VOID
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_partition TEXT;
+BEGIN
+    FOREACH v_partition IN ARRAY ARRAY['documents_memory', 'documents_chat_history',
+                                       'documents_search_result', 'documents_knowledge'] LOOP
+        EXECUTE format('DROP INDEX IF EXISTS %I', v_partition || '_embedding_idx');
+        EXECUTE format('CREATE INDEX %I ON %I USING hnsw (embedding vector_cosine_ops) '
+                       'WITH (m = %s, ef_construction = %s)',
+                       v_partition || '_embedding_idx', v_partition, p_m, p_ef_construction);
+    END LOOP;
+END;
+$$;
+
+SELECT rebuild_vector_indexes(16, 64);
+
+-- Consultas de histórico por tipo, usuário e data já são atendidas pela poda de partição em
+-- doc_type somada ao documents_user_created_idx de 005; um índice em metadata->>'type' nunca
+-- seria usado (as consultas filtram por doc_type). Remove o criado por versões anteriores.
+DROP INDEX IF EXISTS documents_type_user_created_idx;
+-- Índice btree para a carga incremental por usuário e id
+CREATE INDEX IF NOT EXISTS documents_user_id_idx
+    ON documents ((metadata->>'user_id'), id);
+
+-- Assinaturas antigas removidas (a nova tem ef_search; manter ambas deixaria a chamada ambígua)
+DROP FUNCTION IF EXISTS match_documents(VECTOR, INT, FLOAT);
+DROP FUNCTION IF EXISTS match_documents_filtered(VECTOR, INT, FLOAT, TEXT, TEXT, TIMESTAMPTZ, TIMESTAMPTZ);
+
+-- Top-K ordenado pelo índice e só depois filtrado pelo threshold.
+-- ef_search: tamanho da lista de candidatos do HNSW nesta chamada (maior = mais recall, mais lento)
+CREATE
+OR REPLACE FUNCTION match_documents(
+    query_embedding VECTOR(384),
+    match_count INT DEFAULT 5,
+    similarity_threshold FLOAT DEFAULT 0.5,
+    ef_search INT DEFAULT 40
+)
+RETURNS TABLE (
+    id BIGINT,
+    content TEXT,
+    metadata JSONB,
+    similarity FLOAT
+)
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM set_config('hnsw.ef_search', GREATEST(ef_search, match_count)::TEXT, TRUE);
+    RETURN QUERY
+    WITH candidates AS MATERIALIZED (
+        SELECT d.id::BIGINT AS doc_id,
+               d.content AS doc_content,
+               d.metadata AS doc_metadata,
+               d.embedding <=> query_embedding AS distance
+        FROM documents d
+        ORDER BY d.embedding <=> query_embedding
+        LIMIT match_count
+    )
+    SELECT c.doc_id, c.doc_content, c.doc_metadata, (1 - c.distance)::FLOAT
+    FROM candidates c
+    WHERE 1 - c.distance > similarity_threshold
+    ORDER BY c.distance;
+END;
+$$;
+
+CREATE
+OR REPLACE FUNCTION match_documents_filtered(
+    query_embedding VECTOR(384),
+    match_count INT DEFAULT 5,
+    similarity_threshold FLOAT DEFAULT 0.5,
+    filter_type TEXT DEFAULT NULL,
+    filter_user_id TEXT DEFAULT NULL,
+    created_after TIMESTAMPTZ DEFAULT NULL,
+    created_before TIMESTAMPTZ DEFAULT NULL,
+    ef_search INT DEFAULT 40
+)
+RETURNS TABLE (
+    id BIGINT,
+    content TEXT,
+    metadata JSONB,
+    similarity FLOAT,
+    created_at TIMESTAMPTZ
+)
+LANGUAGE plpgsql
+SET hnsw.iterative_scan = 'relaxed_order'
+AS $$
+BEGIN
+    PERFORM set_config('hnsw.ef_search', GREATEST(ef_search, match_count)::TEXT, TRUE);
+    RETURN QUERY
+    WITH candidates AS MATERIALIZED (
+        SELECT d.id::BIGINT AS doc_id,
+               d.content AS doc_content,
+               d.metadata AS doc_metadata,
+               d.embedding <=> query_embedding AS distance,
+               d.created_at AS doc_created_at
+        FROM documents d
+        WHERE (filter_type IS NULL OR d.doc_type = filter_type)
+          AND (filter_user_id IS NULL OR d.metadata->>'user_id' = filter_user_id)
+          AND (created_after IS NULL OR d.created_at >= created_after)
+          AND (created_before IS NULL OR d.created_at < created_before)
+        ORDER BY d.embedding <=> query_embedding
+        LIMIT match_count
+    )
+    SELECT c.doc_id, c.doc_content, c.doc_metadata, (1 - c.distance)::FLOAT, c.doc_created_at
+    FROM candidates c
+    WHERE 1 - c.distance > similarity_threshold
+    ORDER BY c.distance;
+END;
+$$;
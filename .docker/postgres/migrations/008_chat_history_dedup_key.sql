@@ -0,0 +1,61 @@
+-- Mensagens de chat se repetem legitimamente ("ok", "obrigado"); deduplicar só pelo conteúdo
+-- descartava no banco mensagens que o histórico em cache mantinha. Para chat_history, a chave
+-- de deduplicação inclui usuário, papel e horário da mensagem; os demais tipos seguem pelo conteúdo.
+-- O cálculo é idêntico ao de core.storage.base.document_hash. A função também é criada na
+-- migration 002; é redefinida aqui para bancos que aplicaram a 002 antes desta chave.
+CREATE
+OR REPLACE FUNCTION document_dedup_hash(p_doc_type TEXT, p_content TEXT, p_metadata JSONB)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+SELECT CASE
+           WHEN p_doc_type = 'chat_history' THEN document_content_hash(
+               concat_ws('|', COALESCE(p_metadata->>'user_id', ''), COALESCE(p_metadata->>'role', ''),
+                         COALESCE(p_metadata->>'timestamp', ''), p_content))
+           ELSE document_content_hash(p_content)
+       END;
+$$;
+
+-- O trigger existente passa a usar a nova chave (linhas já gravadas mantêm o hash anterior)
+CREATE
+OR REPLACE FUNCTION documents_set_content_hash()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.content_hash := document_dedup_hash(NEW.doc_type, NEW.content, NEW.metadata);
+RETURN NEW;
+END;
+$$;
+
+CREATE
+OR REPLACE FUNCTION upsert_document(
+    p_content TEXT,
+    p_metadata JSONB DEFAULT '{}'::JSONB,
+    p_embedding VECTOR(384) DEFAULT NULL
+)
+RETURNS TABLE (
+    id BIGINT,
+    inserted BOOLEAN
+)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_type TEXT := document_type(p_metadata);
+    v_hash TEXT := document_dedup_hash(v_type, p_content, COALESCE(p_metadata, '{}'::JSONB));
+BEGIN
+    IF p_embedding IS NOT NULL THEN
+        RETURN QUERY
+        INSERT INTO documents AS d (doc_type, content, metadata, embedding)
+        VALUES (v_type, p_content, COALESCE(p_metadata, '{}'::JSONB), p_embedding)
+        ON CONFLICT (doc_type, content_hash) DO NOTHING
+        RETURNING d.id::BIGINT, TRUE;
+        IF FOUND THEN
+            RETURN;
+        END IF;
+    END IF;
+
+    RETURN QUERY
+    SELECT d.id::BIGINT, FALSE
+    FROM documents d
+    WHERE d.doc_type = v_type
+      AND d.content_hash = v_hash;
+END;
+$$;
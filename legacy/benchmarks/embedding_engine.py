@@ -0,0 +1,108 @@
+"""
+Benchmark dos backends do EmbeddingEngine: vazão, latência sob concorrência e recall dos
+vizinhos mais próximos em relação ao modelo PyTorch em precisão cheia.
+
+Uso (a partir de legacy/):
+    python benchmarks/embedding_engine.py --corpus initial_knowledge.txt --backends torch onnx onnx-int8
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from core.embedding_engine import EmbeddingEngine, BACKENDS
+
+def load_corpus(path: str, min_size: int) -> list:
+    """Lê uma linha por documento e repete o corpus até ter ao menos min_size textos"""
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip()]
+    texts = list(lines)
+    while len(texts) < min_size:
+        texts.extend(f"{line} ({len(texts)})" for line in lines)
+    return texts[:max(min_size, len(lines))]
+
+def top_k(embeddings: np.ndarray, k: int) -> np.ndarray:
+    """Índices dos k vizinhos mais próximos (cosseno) de cada documento, excluindo ele mesmo"""
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    scores = normalized @ normalized.T
+    np.fill_diagonal(scores, -np.inf)
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray, k: int) -> float:
+    """Fração dos k vizinhos de referência recuperados pelo candidato"""
+    ref, cand = top_k(reference, k), top_k(candidate, k)
+    return float(np.mean([len(set(r) & set(c)) / k for r, c in zip(ref, cand)]))
+
+def run_backend(backend: str, texts: list, args) -> dict:
+    engine = EmbeddingEngine(backend=backend, threads=args.threads,
+                             batch_size=args.batch_size, max_wait_ms=args.max_wait_ms)
+    start = time.perf_counter()
+    engine.load()
+    load_time = time.perf_counter() - start
+    if engine.load_error is not None:
+        raise RuntimeError(f"{backend}: {engine.load_error}")
+    engine.start()
+
+    # Vazão em lote: todos os textos em uma única chamada
+    start = time.perf_counter()
+    embeddings = engine.encode(texts)
+    bulk_time = time.perf_counter() - start
+
+    # Requisições concorrentes de um texto cada, agrupadas pelo micro-batching
+    latencies = []
+
+    def single(text):
+        t0 = time.perf_counter()
+        engine.encode([text])
+        latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(single, texts))
+    concurrent_time = time.perf_counter() - start
+
+    return {
+        'backend': engine.backend,
+        'load_s': load_time,
+        'bulk_texts_per_s': len(texts) / bulk_time,
+        'concurrent_texts_per_s': len(texts) / concurrent_time,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'embeddings': np.asarray(embeddings, dtype=np.float32),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default='initial_knowledge.txt')
+    parser.add_argument('--size', type=int, default=512, help='Número mínimo de textos')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, args.size)
+    print(f"{len(texts)} textos, threads={args.threads}, batch={args.batch_size}, "
+          f"max_wait={args.max_wait_ms}ms, concorrência={args.concurrency}")
+
+    results = [run_backend(backend, texts, args) for backend in args.backends]
+    reference = next((r['embeddings'] for r in results if r['backend'] == 'torch'), results[0]['embeddings'])
+
+    header = f"{'backend':<10} {'load(s)':>8} {'lote/s':>9} {'conc/s':>9} {'p50(ms)':>8} {'p95(ms)':>8} {'recall@' + str(args.k):>10}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        recall = recall_at_k(reference, r['embeddings'], args.k)
+        print(f"{r['backend']:<10} {r['load_s']:>8.2f} {r['bulk_texts_per_s']:>9.1f} "
+              f"{r['concurrent_texts_per_s']:>9.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {recall:>10.3f}")
+
+if __name__ == '__main__':
+    main()
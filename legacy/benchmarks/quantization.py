@@ -0,0 +1,110 @@
+"""
+Avaliação dos índices compactos (halfvec e binário com reordenação) contra a busca atual
+(match_documents_filtered): recall@k em relação à busca exata por força bruta e latência
+das RPCs, usando como consultas embeddings de documentos do próprio banco.
+
+Uso (a partir de legacy/, com SUPABASE_URL e SUPABASE_KEY no ambiente ou no .env):
+    python benchmarks/quantization.py --type memory --queries 50 --k 10 --rescore-factors 2 4 8
+"""
+
+import os
+import time
+import json
+import random
+import argparse
+
+import numpy as np
+from dotenv import load_dotenv
+from supabase import create_client
+
+BYTES_PER_VECTOR = {'filtered': 384 * 4, 'halfvec': 384 * 2, 'binary': 384 // 8}
+
+def load_documents(client, doc_type: str, user_id: str = None, page_size: int = 1000):
+    """Ids e embeddings (float32 normalizados) de todos os documentos do tipo (None = todos)"""
+    ids, vectors, last_id = [], [], 0
+    while True:
+        query = client.table('documents') \
+            .select('id, embedding') \
+            .not_.is_('embedding', 'null') \
+            .gt('id', last_id)
+        if doc_type:
+            query = query.eq('doc_type', doc_type)
+        if user_id:
+            query = query.eq('metadata->>user_id', user_id)
+        page = query.order('id').limit(page_size).execute().data or []
+        for row in page:
+            embedding = row['embedding']
+            ids.append(row['id'])
+            vectors.append(json.loads(embedding) if isinstance(embedding, str) else embedding)
+        if len(page) < page_size:
+            break
+        last_id = page[-1]['id']
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.asarray(ids), matrix
+
+def run_mode(client, mode: str, rescore_factor: int, queries, truth, ids, args) -> dict:
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        params = {
+            'query_embedding': query.tolist(),
+            'match_count': args.k,
+            'similarity_threshold': -1.0,
+            'filter_type': args.type,
+            'filter_user_id': args.user_id,
+        }
+        start = time.perf_counter()
+        if mode == 'filtered':
+            rows = client.rpc('match_documents_filtered', params).execute().data or []
+        else:
+            rows = client.rpc('match_documents_quantized', {
+                **params, 'quantization': mode, 'rescore_factor': rescore_factor
+            }).execute().data or []
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len({row['id'] for row in rows} & set(ids[expected])) / args.k)
+    return {
+        'mode': mode if mode == 'filtered' else f"{mode} x{rescore_factor}",
+        'recall': float(np.mean(recalls)),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'bytes': BYTES_PER_VECTOR[mode],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--type', default='memory', help='doc_type avaliado')
+    parser.add_argument('--user-id', default=None, help='Restringe a um usuário')
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--rescore-factors', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--modes', nargs='+', default=['filtered', 'halfvec', 'binary'],
+                        choices=['filtered', 'halfvec', 'binary'])
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
+    ids, matrix = load_documents(client, args.type, args.user_id)
+    if len(ids) <= args.k:
+        raise SystemExit(f"Poucos documentos do tipo {args.type} ({len(ids)}) para k={args.k}")
+
+    random.seed(args.seed)
+    sample = random.sample(range(len(ids)), min(args.queries, len(ids)))
+    queries = matrix[sample]
+    # Vizinhos exatos por força bruta
+    truth = np.argsort(-(queries @ matrix.T), axis=1)[:, :args.k]
+    print(f"{len(ids)} documentos do tipo {args.type}, {len(sample)} consultas, k={args.k}")
+
+    results = []
+    for mode in args.modes:
+        for factor in ([1] if mode == 'filtered' else args.rescore_factors):
+            results.append(run_mode(client, mode, factor, queries, truth, ids, args))
+
+    header = f"{'modo':<14} {'recall@' + str(args.k):>10} {'p50(ms)':>8} {'p95(ms)':>8} {'bytes/vetor':>12}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['mode']:<14} {r['recall']:>10.3f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['bytes']:>12}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark de match_documents / match_documents_filtered: latência e recall@k em relação à
+busca exata por força bruta, para uma lista de valores de ef_search.
+
+Com --legacy as RPCs são chamadas sem ef_search (assinatura anterior à migration 007),
+permitindo medir o banco antes da migration e comparar com a execução depois dela.
+
+Uso (a partir de legacy/, com SUPABASE_URL e SUPABASE_KEY no ambiente ou no .env):
+    python benchmarks/vector_search.py --type memory --ef-search 20 40 100 200
+    python benchmarks/vector_search.py --type memory --legacy
+    python benchmarks/vector_search.py --function match_documents
+"""
+
+import os
+import time
+import random
+import argparse
+
+import numpy as np
+from dotenv import load_dotenv
+from supabase import create_client
+
+from quantization import load_documents
+
+def run(client, function: str, ef_search, queries, truth, ids, args) -> dict:
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        params = {
+            'query_embedding': query.tolist(),
+            'match_count': args.k,
+            'similarity_threshold': args.threshold,
+        }
+        if function == 'match_documents_filtered':
+            params.update({'filter_type': args.type, 'filter_user_id': args.user_id})
+        if ef_search is not None:
+            params['ef_search'] = ef_search
+        start = time.perf_counter()
+        rows = client.rpc(function, params).execute().data or []
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len({row['id'] for row in rows} & set(ids[expected])) / args.k)
+    return {
+        'function': function,
+        'ef_search': 'padrão' if ef_search is None else ef_search,
+        'recall': float(np.mean(recalls)),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--function', default='match_documents_filtered',
+                        choices=['match_documents_filtered', 'match_documents'])
+    parser.add_argument('--type', default='memory', help='doc_type da busca filtrada')
+    parser.add_argument('--user-id', default=None, help='Restringe a busca filtrada a um usuário')
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--threshold', type=float, default=-1.0,
+                        help='similarity_threshold (o padrão mede apenas o top-K)')
+    parser.add_argument('--ef-search', type=int, nargs='+', default=[20, 40, 100, 200])
+    parser.add_argument('--legacy', action='store_true', help='Chama as RPCs sem ef_search')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
+    if args.function == 'match_documents':
+        # Sem filtros a busca cobre todos os documentos
+        args.type, args.user_id = None, None
+    ids, matrix = load_documents(client, args.type, args.user_id)
+    if len(ids) <= args.k:
+        raise SystemExit(f"Poucos documentos ({len(ids)}) para k={args.k}")
+
+    random.seed(args.seed)
+    sample = random.sample(range(len(ids)), min(args.queries, len(ids)))
+    queries = matrix[sample]
+    truth = np.argsort(-(queries @ matrix.T), axis=1)[:, :args.k]
+    print(f"{len(ids)} documentos (tipo {args.type or 'todos'}), {len(sample)} consultas, k={args.k}")
+
+    ef_values = [None] if args.legacy else args.ef_search
+    results = [run(client, args.function, ef, queries, truth, ids, args) for ef in ef_values]
+
+    header = f"{'função':<26} {'ef_search':>9} {'recall@' + str(args.k):>10} {'p50(ms)':>8} {'p95(ms)':>8}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['function']:<26} {r['ef_search']:>9} {r['recall']:>10.3f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}")
+
+if __name__ == '__main__':
+    main()
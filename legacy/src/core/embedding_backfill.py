@@ -0,0 +1,84 @@
+"""
+Worker em background que gera os embeddings de documentos gravados sem embedding
+(embedding_pending), em lotes grandes e preferencialmente quando o bot está ocioso.
+"""
+
+import time
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingBackfillWorker:
+    """Processa documentos com embedding pendente fora do caminho crítico das mensagens"""
+
+    def __init__(self, rag, batch_size: int = 256, idle_seconds: float = 10.0,
+                 max_delay: float = 300.0, poll_interval: float = 5.0):
+        """
+        Args:
+            rag (SupabaseRAG): RAG usado para buscar pendências e gravar os embeddings
+            batch_size (int): Documentos por lote
+            idle_seconds (float): Tempo sem atividade para considerar o bot ocioso
+            max_delay (float): Tempo máximo que pendências esperam por ociosidade antes de
+                serem processadas mesmo com o bot ativo
+            poll_interval (float): Intervalo entre verificações
+        """
+        self.rag = rag
+        self.batch_size = batch_size
+        self.idle_seconds = idle_seconds
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.last_activity = 0.0
+        self.pending_since: Optional[float] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def notify_activity(self) -> None:
+        """Registra atividade de usuário (adia o backfill) e sinaliza que há novas pendências"""
+        now = time.time()
+        self.last_activity = now
+        if self.pending_since is None:
+            self.pending_since = now
+        self._wake.set()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        # Pendências de execuções anteriores são processadas assim que o bot ficar ocioso
+        self.pending_since = time.time()
+        self._thread = threading.Thread(target=self._run, name='embedding-backfill', daemon=True)
+        self._thread.start()
+        logger.info("Worker de backfill de embeddings iniciado")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def _should_run(self, now: float) -> bool:
+        if self.pending_since is None:
+            return False
+        idle = now - self.last_activity >= self.idle_seconds
+        overdue = now - self.pending_since >= self.max_delay
+        return idle or overdue
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if self._stop.is_set() or not self._should_run(time.time()):
+                continue
+            try:
+                # Esvazia a fila enquanto houver lotes completos
+                self.pending_since = None
+                while not self._stop.is_set():
+                    start_time = time.time()
+                    updated = self.rag.backfill_embeddings(self.batch_size)
+                    if updated:
+                        logger.info(f"Backfill: {updated} embeddings em {time.time() - start_time:.2f}s")
+                    if updated < self.batch_size:
+                        break
+            except Exception as e:
+                logger.error(f"Erro no backfill de embeddings: {e}")
+                self.pending_since = self.pending_since or time.time()
@@ -0,0 +1,193 @@
+"""
+Motor de embeddings em processo: carrega o modelo local em background na inicialização,
+suporta backend ONNX Runtime (opcionalmente quantizado em int8), controla o número de
+threads de inferência e agrupa requisições concorrentes em micro-lotes.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Backends suportados: PyTorch em precisão cheia, ONNX Runtime e ONNX Runtime com pesos int8
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+# Arquivo quantizado publicado no repositório do modelo (AVX2 é o mais portável em x86)
+DEFAULT_ONNX_INT8_FILE = 'onnx/model_quint8_avx2.onnx'
+
+class EmbeddingEngine:
+    """Executa o modelo de embeddings local com warmup e micro-batching"""
+
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 backend: str = 'torch', threads: Optional[int] = None,
+                 batch_size: int = 32, max_wait_ms: float = 5.0,
+                 onnx_file: Optional[str] = None):
+        """
+        Args:
+            model_name (str): Modelo do sentence-transformers
+            backend (str): 'torch', 'onnx' ou 'onnx-int8'
+            threads (int): Threads intra-op da inferência (None = padrão da biblioteca)
+            batch_size (int): Máximo de textos por micro-lote
+            max_wait_ms (float): Tempo máximo que uma requisição espera por outras para formar o lote
+            onnx_file (str): Arquivo ONNX dentro do repositório do modelo (para 'onnx-int8')
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend de embedding inválido: {backend} (use um de {BACKENDS})")
+        self.model_name = model_name
+        self.backend = backend
+        self.threads = threads
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.onnx_file = onnx_file or (DEFAULT_ONNX_INT8_FILE if backend == 'onnx-int8' else None)
+
+        self.model = None
+        self.load_error: Optional[Exception] = None
+        self._ready = threading.Event()
+        self._load_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+
+    def _load_model(self):
+        """Carrega o modelo no backend configurado"""
+        from sentence_transformers import SentenceTransformer
+
+        if self.backend == 'torch':
+            if self.threads:
+                import torch
+                torch.set_num_threads(self.threads)
+            return SentenceTransformer(self.model_name, device='cpu')
+
+        model_kwargs = {'provider': 'CPUExecutionProvider'}
+        if self.onnx_file:
+            model_kwargs['file_name'] = self.onnx_file
+        if self.threads:
+            import onnxruntime
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = self.threads
+            model_kwargs['session_options'] = session_options
+        return SentenceTransformer(self.model_name, device='cpu', backend='onnx',
+                                   model_kwargs=model_kwargs)
+
+    def load(self) -> None:
+        """Carrega o modelo e executa uma inferência de aquecimento (idempotente)"""
+        with self._load_lock:
+            if self._ready.is_set():
+                return
+            start_time = time.time()
+            logger.info(f"Carregando modelo de embeddings {self.model_name} (backend {self.backend})...")
+            try:
+                try:
+                    self.model = self._load_model()
+                except ImportError as e:
+                    if self.backend == 'torch':
+                        raise
+                    logger.warning(f"Backend {self.backend} indisponível ({e}), usando torch")
+                    self.backend = 'torch'
+                    self.model = self._load_model()
+                # Primeira inferência aloca buffers e compila kernels
+                self.model.encode(["aquecimento"], convert_to_tensor=False)
+                logger.info(f"Modelo de embeddings pronto em {time.time() - start_time:.2f}s")
+            except Exception as e:
+                logger.error(f"Erro ao carregar modelo de embeddings: {e}")
+                self.load_error = e
+            finally:
+                self._ready.set()
+
+    def start(self) -> None:
+        """Inicia o warmup em background e a thread de micro-batching (idempotente)"""
+        if self._worker is not None:
+            return
+        with self._load_lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._run, name='embedding-engine', daemon=True)
+            self._worker.start()
+        threading.Thread(target=self.load, name='embedding-warmup', daemon=True).start()
+
+    @property
+    def ready(self) -> bool:
+        """True se o modelo já foi carregado com sucesso"""
+        return self._ready.is_set() and self.load_error is None
+
+    def encode(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        """
+        Gera embeddings, agrupando a requisição com outras que cheguem em até max_wait_ms.
+
+        Args:
+            texts (List[str]): Textos a serem convertidos
+            timeout (float): Tempo máximo de espera pelo resultado (None = sem limite)
+
+        Returns:
+            List[List[float]]: Embeddings na ordem dos textos
+        """
+        if not texts:
+            return []
+        self.start()
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future.result(timeout)
+
+    def _run(self) -> None:
+        """Consome a fila formando micro-lotes"""
+        while True:
+            requests = [self._queue.get()]
+            count = len(requests[0][0])
+            deadline = time.time() + self.max_wait
+            while count < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                count += len(request[0])
+            self._encode_batch(requests)
+
+    def _encode_batch(self, requests) -> None:
+        """Codifica um micro-lote e distribui os resultados entre as requisições"""
+        self._ready.wait()
+        try:
+            if self.load_error is not None:
+                raise RuntimeError(f"Modelo de embeddings indisponível: {self.load_error}")
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            embeddings = self.model.encode(texts, batch_size=self.batch_size,
+                                           convert_to_tensor=False)
+            logger.debug(f"Micro-lote de {len(texts)} textos ({len(requests)} requisições)")
+            offset = 0
+            for request_texts, future in requests:
+                size = len(request_texts)
+                future.set_result([emb.tolist() for emb in embeddings[offset:offset + size]])
+                offset += size
+        except Exception as e:
+            for _, future in requests:
+                if not future.done():
+                    future.set_exception(e)
+
+_default_engine: Optional[EmbeddingEngine] = None
+_default_engine_lock = threading.Lock()
+
+def get_embedding_engine(model_name: str = "sentence-transformers/all-MiniLM-L6-v2") -> EmbeddingEngine:
+    """
+    Retorna o motor de embeddings compartilhado pelo processo, configurado por variáveis de ambiente:
+    EMBEDDING_BACKEND, EMBEDDING_THREADS, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_WAIT_MS e EMBEDDING_ONNX_FILE.
+    """
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            threads = os.getenv('EMBEDDING_THREADS')
+            _default_engine = EmbeddingEngine(
+                model_name=model_name,
+                backend=os.getenv('EMBEDDING_BACKEND', 'torch'),
+                threads=int(threads) if threads else None,
+                batch_size=int(os.getenv('EMBEDDING_BATCH_SIZE', 32)),
+                max_wait_ms=float(os.getenv('EMBEDDING_MAX_WAIT_MS', 5)),
+                onnx_file=os.getenv('EMBEDDING_ONNX_FILE')
+            )
+        return _default_engine
@@ -0,0 +1,181 @@
+"""
+Roteador de backends de embedding: escolhe o backend com menor latência esperada,
+com base em uma janela móvel de latências e erros, e isola backends com falhas
+repetidas por meio de um circuit breaker (fechado -> aberto -> meio-aberto).
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class BackendState:
+    """Estatísticas e estado do circuit breaker de um backend"""
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, generate: Callable[[List[str]], List[List[float]]],
+                 is_available: Optional[Callable[[], bool]] = None, window: int = 20):
+        self.name = name
+        self.generate = generate
+        self.is_available = is_available or (lambda: True)
+        self.outcomes = deque(maxlen=window)  # (latência por texto, sucesso)
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.last_used = 0.0
+
+    def expected_latency(self) -> float:
+        """Latência esperada por texto, penalizada pela taxa de erro (0 se ainda não há dados)"""
+        if not self.outcomes:
+            return 0.0
+        latencies = [latency for latency, ok in self.outcomes if ok]
+        error_rate = 1 - len(latencies) / len(self.outcomes)
+        if not latencies:
+            return float('inf')
+        return (sum(latencies) / len(latencies)) / max(1 - error_rate, 0.05)
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for _, ok in self.outcomes if not ok) / len(self.outcomes)
+
+class EmbeddingRouter:
+    """Distribui as requisições de embedding entre os backends registrados"""
+
+    def __init__(self, metrics=None, window: int = 20, failure_threshold: int = 3,
+                 open_seconds: float = 30.0, explore_interval: float = 300.0):
+        """
+        Args:
+            metrics (MetricsCollector): Registra cada decisão em memory_metrics (None = desativado)
+            window (int): Tamanho da janela móvel de latências/erros por backend
+            failure_threshold (int): Falhas consecutivas que abrem o circuito
+            open_seconds (float): Tempo com o circuito aberto antes de uma sondagem (meio-aberto)
+            explore_interval (float): Segundos sem uso após os quais um backend recebe uma
+                requisição para atualizar suas estatísticas
+        """
+        self.metrics = metrics
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.explore_interval = explore_interval
+        self.backends: Dict[str, BackendState] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, generate: Callable[[List[str]], List[List[float]]],
+                 is_available: Optional[Callable[[], bool]] = None) -> None:
+        """
+        Registra um backend.
+
+        Args:
+            name (str): Nome do backend (ex: 'api', 'local')
+            generate (Callable): Função que recebe textos e retorna embeddings
+            is_available (Callable): Indica se o backend pode ser usado agora (ex: modelo já carregado)
+        """
+        self.backends[name] = BackendState(name, generate, is_available, self.window)
+
+    def _allowed(self, backend: BackendState, now: float) -> bool:
+        """Verifica o circuit breaker, passando para meio-aberto quando o tempo expira"""
+        if backend.state == BackendState.OPEN and now - backend.opened_at >= self.open_seconds:
+            backend.state = BackendState.HALF_OPEN
+            backend.probing = False
+            logger.info(f"[EmbeddingRouter] Circuito de '{backend.name}' meio-aberto, sondando")
+        if backend.state == BackendState.OPEN:
+            return False
+        if backend.state == BackendState.HALF_OPEN:
+            return not backend.probing
+        return True
+
+    def _candidates(self) -> List[BackendState]:
+        """Backends utilizáveis, do menor para o maior custo esperado"""
+        now = time.time()
+        with self._lock:
+            candidates = [b for b in self.backends.values()
+                          if self._allowed(b, now) and b.is_available()]
+
+            def cost(backend: BackendState):
+                # Sondagens e backends sem uso recente vão primeiro para atualizar as estatísticas
+                stale = now - backend.last_used > self.explore_interval
+                return (backend.state != BackendState.HALF_OPEN and not stale,
+                        backend.expected_latency())
+
+            candidates.sort(key=cost)
+            if candidates and candidates[0].state == BackendState.HALF_OPEN:
+                candidates[0].probing = True
+            for backend in candidates[:1]:
+                backend.last_used = now
+            return candidates
+
+    def _record(self, backend: BackendState, texts: int, latency: float, ok: bool) -> None:
+        with self._lock:
+            backend.outcomes.append((latency / max(texts, 1), ok))
+            backend.probing = False
+            if ok:
+                if backend.state != BackendState.CLOSED:
+                    logger.info(f"[EmbeddingRouter] Circuito de '{backend.name}' fechado")
+                backend.state = BackendState.CLOSED
+                backend.consecutive_failures = 0
+            else:
+                backend.consecutive_failures += 1
+                if backend.state == BackendState.HALF_OPEN or \
+                        backend.consecutive_failures >= self.failure_threshold:
+                    backend.state = BackendState.OPEN
+                    backend.opened_at = time.time()
+                    logger.warning(f"[EmbeddingRouter] Circuito de '{backend.name}' aberto após "
+                                   f"{backend.consecutive_failures} falhas")
+
+        if self.metrics:
+            try:
+                self.metrics.record_memory_metric(
+                    operation_type=f"embedding_{backend.name}",
+                    success=ok,
+                    latency=latency,
+                    cache_hit=False,
+                    embedding_time=latency
+                )
+            except Exception as e:
+                logger.error(f"Erro ao registrar métrica de embedding: {e}")
+
+    def generate(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera embeddings no backend de menor latência esperada, passando para o próximo em caso de falha.
+
+        Raises:
+            Exception: A última falha, se nenhum backend conseguir gerar os embeddings
+        """
+        candidates = self._candidates()
+        if not candidates:
+            raise RuntimeError("Nenhum backend de embedding disponível (circuitos abertos)")
+
+        last_error = None
+        for backend in candidates:
+            start_time = time.time()
+            try:
+                embeddings = backend.generate(texts)
+                self._record(backend, len(texts), time.time() - start_time, True)
+                logger.info(f"[EmbeddingRouter] {len(texts)} embeddings via '{backend.name}' "
+                            f"em {time.time() - start_time:.3f}s")
+                return embeddings
+            except Exception as e:
+                self._record(backend, len(texts), time.time() - start_time, False)
+                logger.warning(f"[EmbeddingRouter] Falha no backend '{backend.name}': {e}")
+                last_error = e
+        raise last_error
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Estado atual de cada backend"""
+        with self._lock:
+            return {
+                name: {
+                    'state': b.state,
+                    'expected_latency': b.expected_latency(),
+                    'error_rate': b.error_rate(),
+                    'samples': len(b.outcomes),
+                }
+                for name, b in self.backends.items()
+            }
@@ -0,0 +1,216 @@
+"""
+Armazenamento de embeddings endereçado por conteúdo e compartilhado entre processos.
+
+A chave é o SHA-256 de (id do modelo, texto normalizado), estável entre reinícios e entre
+o bot e o dashboard. Os vetores são gravados como bytes float32 little-endian (~1,5 KB para
+384 dimensões) e lidos sem cópia com numpy.frombuffer.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTOR_DTYPE = np.dtype('<f4')
+KEY_PREFIX = 'horus:emb:v1'
+
+def normalize_text(text: str) -> str:
+    """Normaliza unicode (NFC) e espaços para que variações triviais compartilhem a mesma chave"""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+def content_key(model_id: str, text: str) -> str:
+    """Chave endereçada por conteúdo de um embedding"""
+    digest = hashlib.sha256(f"{model_id}\0{normalize_text(text)}".encode('utf-8')).hexdigest()
+    return f"{KEY_PREFIX}:{digest}"
+
+def encode_vector(embedding) -> bytes:
+    """Serializa um embedding como float32 little-endian"""
+    return np.asarray(embedding, dtype=VECTOR_DTYPE).tobytes()
+
+def decode_vector(data: bytes) -> np.ndarray:
+    """Desserializa sem cópia (o array resultante é somente leitura)"""
+    return np.frombuffer(data, dtype=VECTOR_DTYPE)
+
+class LocalEmbeddingCache:
+    """LRU em processo de vetores numpy, limitado pelo total de bytes armazenados"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            max_bytes (int): Tamanho máximo somado dos vetores em bytes
+        """
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        if vector.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= previous.nbytes
+            self._entries[key] = vector
+            self.size_bytes += vector.nbytes
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= evicted.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def get_stats(self) -> Dict[str, float]:
+        """Contadores de acerto e ocupação do cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'entries': len(self._entries),
+                'size_bytes': self.size_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+class EmbeddingStore:
+    """
+    Cache de embeddings no Redis com vetores binários, TTL e limite opcional de entradas,
+    opcionalmente precedido por um LRU em processo (leitura e escrita passam pelas duas camadas).
+    """
+
+    def __init__(self, redis_client, model_id: str, ttl: Optional[int] = None,
+                 sliding_ttl: bool = True, max_entries: int = 0,
+                 local_cache: Optional[LocalEmbeddingCache] = None):
+        """
+        Args:
+            redis_client: Cliente Redis com decode_responses=False
+            model_id (str): Identificador do modelo, parte da chave
+            ttl (int): Tempo de vida das entradas em segundos (None = sem expiração)
+            sliding_ttl (bool): Renova o TTL a cada leitura
+            max_entries (int): Máximo de entradas; acima disso as menos usadas são removidas (0 = sem limite)
+            local_cache (LocalEmbeddingCache): Camada em processo à frente do Redis (None = desativada)
+        """
+        self.redis = redis_client
+        self.model_id = model_id
+        self.ttl = ttl
+        self.sliding_ttl = sliding_ttl
+        self.max_entries = max_entries
+        self.local_cache = local_cache
+        self.index_key = f"{KEY_PREFIX}:index:{hashlib.sha256(model_id.encode('utf-8')).hexdigest()[:16]}"
+
+    @classmethod
+    def from_env(cls, redis_client, model_id: str, default_ttl: Optional[int] = None) -> 'EmbeddingStore':
+        """
+        Cria o store com EMBEDDING_CACHE_TTL, EMBEDDING_CACHE_SLIDING_TTL, EMBEDDING_CACHE_MAX_ENTRIES
+        e EMBEDDING_LOCAL_CACHE_MB (0 desativa a camada em processo).
+        """
+        ttl = int(os.getenv('EMBEDDING_CACHE_TTL', default_ttl or 0)) or None
+        local_mb = float(os.getenv('EMBEDDING_LOCAL_CACHE_MB', 64))
+        return cls(
+            redis_client,
+            model_id,
+            ttl=ttl,
+            sliding_ttl=os.getenv('EMBEDDING_CACHE_SLIDING_TTL', 'true').lower() == 'true',
+            max_entries=int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 0)),
+            local_cache=LocalEmbeddingCache(int(local_mb * 1024 * 1024)) if local_mb > 0 else None
+        )
+
+    def key(self, text: str) -> str:
+        return content_key(self.model_id, text)
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Recupera vários embeddings com um único MGET.
+
+        Returns:
+            List[Optional[np.ndarray]]: Vetores na ordem dos textos (None para ausentes)
+        """
+        if not texts:
+            return []
+        keys = [self.key(text) for text in texts]
+        vectors = [self.local_cache.get(key) if self.local_cache is not None else None for key in keys]
+        remote_keys = [key for key, vector in zip(keys, vectors) if vector is None]
+        if not remote_keys:
+            return vectors
+
+        values = dict(zip(remote_keys, self.redis.mget(remote_keys)))
+        hits = [key for key in remote_keys if values[key] is not None]
+        if hits and (self.sliding_ttl or self.max_entries):
+            pipe = self.redis.pipeline(transaction=False)
+            if self.sliding_ttl and self.ttl:
+                for key in hits:
+                    pipe.expire(key, self.ttl)
+            if self.max_entries:
+                now = time.time()
+                pipe.zadd(self.index_key, {key: now for key in hits})
+            pipe.execute()
+
+        for i, key in enumerate(keys):
+            if vectors[i] is None and values.get(key) is not None:
+                vectors[i] = decode_vector(values[key])
+                if self.local_cache is not None:
+                    self.local_cache.put(key, vectors[i])
+        return vectors
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        return self.get_many([text])[0]
+
+    def set_many(self, embeddings: Dict[str, List[float]]) -> None:
+        """Armazena vários embeddings em um único pipeline"""
+        if not embeddings:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        keys = {}
+        for text, embedding in embeddings.items():
+            key = self.key(text)
+            keys[key] = time.time()
+            data = encode_vector(embedding)
+            pipe.set(key, data, ex=self.ttl)
+            if self.local_cache is not None:
+                self.local_cache.put(key, decode_vector(data))
+        if self.max_entries:
+            pipe.zadd(self.index_key, keys)
+        pipe.execute()
+
+        if self.max_entries:
+            self._evict()
+
+    def set(self, text: str, embedding: List[float]) -> None:
+        self.set_many({text: embedding})
+
+    def get_stats(self) -> Dict[str, float]:
+        """Estatísticas da camada em processo (vazio se desativada)"""
+        return self.local_cache.get_stats() if self.local_cache is not None else {}
+
+    def _evict(self) -> None:
+        """Remove as entradas usadas há mais tempo quando o limite é ultrapassado"""
+        excess = self.redis.zcard(self.index_key) - self.max_entries
+        if excess <= 0:
+            return
+        evicted = [key for key, _ in self.redis.zpopmin(self.index_key, excess)]
+        if evicted:
+            self.redis.delete(*evicted)
+            logger.debug(f"EmbeddingStore: {len(evicted)} embeddings removidos por limite de entradas")
@@ -0,0 +1,269 @@
+"""
+Camada lexical local (BM25, via SimpleRAG) à frente da busca vetorial.
+
+O índice cobre a base de conhecimento e os resultados de pesquisa arquivados e é
+carregado do Supabase sob demanda, com atualização incremental por id; documentos
+apagados pela retenção ou pela consolidação saem do índice (remove/rebuild). Quando o
+melhor resultado BM25 se destaca do segundo com margem suficiente, a resposta sai
+direto do índice local, sem embedding nem RPC; caso contrário, o resultado lexical
+é combinado com o da busca vetorial por reciprocal rank fusion (RRF).
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .simple_rag import SimpleRAG
+
+logger = logging.getLogger(__name__)
+
+TIERS = ('lexical', 'hybrid', 'vector')
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], limit: int,
+                           k: int = 60) -> List[Dict[str, Any]]:
+    """
+    Combina listas ordenadas de documentos somando 1 / (k + posição) de cada lista.
+
+    Documentos são identificados pelo id (ou pelo conteúdo, na falta dele); o primeiro
+    dict encontrado para cada documento é mantido, acrescido de rrf_score.
+    """
+    scores: Dict[Any, float] = {}
+    documents: Dict[Any, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, document in enumerate(results):
+            key = document.get('id') or document['content']
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            documents.setdefault(key, document)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [{**documents[key], 'rrf_score': scores[key]} for key in ranked]
+
+class LexicalTier:
+    """Índice BM25 em processo com decisão por margem e fusão com a busca vetorial"""
+
+    def __init__(self, rag, metrics=None, margin: float = 0.3, min_score: float = 3.0,
+                 rrf_k: int = 60, refresh_interval: float = 300.0, speculative: bool = False):
+        """
+        Args:
+            rag (SupabaseRAG): Fonte dos documentos indexados
+            metrics (MetricsCollector): Registra latência e acerto de cada camada (None = desativado)
+            margin (float): Vantagem relativa mínima do 1º sobre o 2º score BM25 para responder sem busca vetorial
+            min_score (float): Score BM25 mínimo do 1º resultado para responder sem busca vetorial
+            rrf_k (int): Constante k do RRF
+            refresh_interval (float): Segundos entre verificações de documentos novos no Supabase
+            speculative (bool): Inicia a busca vetorial junto com a lexical (menor latência quando
+                a margem não é suficiente, ao custo de gerar o embedding mesmo quando é)
+        """
+        self.rag = rag
+        self.metrics = metrics
+        self.margin = margin
+        self.min_score = min_score
+        self.rrf_k = rrf_k
+        self.refresh_interval = refresh_interval
+        self.speculative = speculative
+        self.index = SimpleRAG()
+        self.documents: List[Dict[str, Any]] = []
+        self.ids = set()
+        self.max_id = 0  # maior id já lido do Supabase (documentos indexados diretamente não contam)
+        self.last_refresh = 0.0
+        # Incrementado quando documentos saem do índice; descarta atualizações lidas antes disso
+        self._generation = 0
+        self.stats = {tier: {'requests': 0, 'hits': 0, 'latency': 0.0} for tier in TIERS}
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='lexical-tier')
+
+    @classmethod
+    def from_env(cls, rag, metrics=None) -> 'LexicalTier':
+        """Cria a camada com LEXICAL_TIER_MARGIN, LEXICAL_TIER_MIN_SCORE, LEXICAL_TIER_REFRESH_SECONDS e LEXICAL_TIER_SPECULATIVE"""
+        return cls(
+            rag,
+            metrics,
+            margin=float(os.getenv('LEXICAL_TIER_MARGIN', 0.3)),
+            min_score=float(os.getenv('LEXICAL_TIER_MIN_SCORE', 3.0)),
+            refresh_interval=float(os.getenv('LEXICAL_TIER_REFRESH_SECONDS', 300)),
+            speculative=os.getenv('LEXICAL_TIER_SPECULATIVE', 'false').lower() == 'true'
+        )
+
+    def add(self, document: Dict[str, Any]) -> None:
+        """Indexa um documento (dict com id, content e metadata), ignorando ids já indexados"""
+        with self._lock:
+            if document.get('id') in self.ids:
+                return
+            self.index.add_document(document['content'])
+            self.documents.append(document)
+            self.ids.add(document.get('id'))
+
+    def refresh(self, force: bool = False) -> None:
+        """Indexa os documentos gravados desde a última atualização"""
+        with self._lock:
+            if not force and time.time() - self.last_refresh < self.refresh_interval:
+                return
+            self.last_refresh = time.time()
+            after_id, generation = self.max_id, self._generation
+
+        # A consulta ao banco é feita sem o lock, para não bloquear as buscas
+        try:
+            documents = self.rag.get_lexical_documents(after_id=after_id)
+        except Exception as e:
+            logger.error(f"Erro ao atualizar índice lexical: {e}")
+            return
+
+        with self._lock:
+            if generation != self._generation:
+                # Documentos foram removidos durante a consulta; a leitura pode trazê-los de volta
+                return
+            for document in documents:
+                self.add(document)
+                self.max_id = max(self.max_id, document['id'])
+            if documents:
+                logger.info(f"Índice lexical: {len(documents)} documentos novos, {len(self.documents)} no total")
+
+    @staticmethod
+    def _build_index(documents: List[Dict[str, Any]]) -> SimpleRAG:
+        index = SimpleRAG()
+        for document in documents:
+            index.add_document(document['content'])
+        return index
+
+    def remove(self, ids: Iterable[Any]) -> int:
+        """Remove do índice documentos apagados do banco; retorna quantos foram removidos"""
+        ids = set(ids)
+        with self._lock:
+            if not ids & self.ids:
+                return 0
+            remaining = [document for document in self.documents if document.get('id') not in ids]
+            removed = len(self.documents) - len(remaining)
+            self.index = self._build_index(remaining)
+            self.documents = remaining
+            self.ids -= ids
+            self._generation += 1
+        logger.info(f"Índice lexical: {removed} documentos removidos")
+        return removed
+
+    def rebuild(self) -> None:
+        """Recarrega o índice inteiro do banco (ex: após a retenção apagar documentos)"""
+        with self._lock:
+            self._generation += 1
+        try:
+            documents = self.rag.get_lexical_documents(after_id=0)
+        except Exception as e:
+            logger.error(f"Erro ao recarregar índice lexical: {e}")
+            return
+        max_id = max((document['id'] for document in documents), default=0)
+        ids = {document['id'] for document in documents}
+
+        with self._lock:
+            # Documentos indexados durante a consulta (ids maiores que os lidos) são mantidos
+            documents += [document for document in self.documents
+                          if document.get('id') not in ids and (document.get('id') or 0) > max_id]
+            self.index = self._build_index(documents)
+            self.documents = documents
+            self.ids = {document.get('id') for document in documents}
+            self.max_id = max(self.max_id, max_id)
+            self.last_refresh = time.time()
+            self._generation += 1
+        logger.info(f"Índice lexical recarregado: {len(documents)} documentos")
+
+    def search_lexical(self, query: str, limit: int, doc_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Busca BM25 no índice local.
+
+        Returns:
+            List[Dict[str, Any]]: Documentos com bm25_score e similarity (score relativo ao 1º), em ordem decrescente
+        """
+        self.refresh()
+        with self._lock:
+            # Busca folgada para que o filtro por tipo ainda deixe resultados suficientes
+            pairs = self.index.search_ids(query, top_k=limit * 4 if doc_type else limit + 1)
+            results = []
+            for position, score in pairs:
+                document = self.documents[position]
+                if doc_type and (document.get('metadata') or {}).get('type') != doc_type:
+                    continue
+                results.append({**document, 'bm25_score': score})
+        if results:
+            best = results[0]['bm25_score']
+            for document in results:
+                document['similarity'] = document['bm25_score'] / best if best else 0.0
+        return results
+
+    def is_confident(self, results: List[Dict[str, Any]]) -> bool:
+        """O melhor resultado BM25 tem score mínimo e se destaca do segundo pela margem"""
+        if not results or results[0]['bm25_score'] < self.min_score:
+            return False
+        if len(results) == 1:
+            return True
+        best, second = results[0]['bm25_score'], results[1]['bm25_score']
+        return (best - second) / best >= self.margin
+
+    def search(self, query: str, limit: int, vector_search: Callable[[], List[Dict[str, Any]]],
+               doc_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Busca em camadas: BM25 local e, se a margem não for confiável, busca vetorial com fusão RRF.
+
+        Args:
+            query (str): Texto da busca
+            limit (int): Número máximo de documentos
+            vector_search (Callable): Executa a busca vetorial equivalente
+            doc_type (str): Restringe a camada lexical a um metadata.type
+
+        Returns:
+            List[Dict[str, Any]]: Documentos encontrados
+        """
+        start_time = time.time()
+        vector_future = self._executor.submit(vector_search) if self.speculative else None
+        try:
+            lexical = self.search_lexical(query, limit + 1, doc_type)
+        except Exception as e:
+            logger.error(f"Erro na busca lexical: {e}")
+            lexical = []
+        lexical_time = time.time() - start_time
+
+        if self.is_confident(lexical):
+            self._record('lexical', True, lexical_time)
+            logger.info(f"Busca respondida pelo índice lexical em {lexical_time * 1000:.1f}ms "
+                        f"(score {lexical[0]['bm25_score']:.2f})")
+            # Sem a busca vetorial para confirmar, descarta a cauda com score baixo
+            return [document for document in lexical[:limit] if document['bm25_score'] >= self.min_score]
+
+        vector_start = time.time()
+        vector = vector_future.result() if vector_future is not None else vector_search()
+        vector = vector or []
+        self._record('vector', bool(vector), time.time() - vector_start)
+        if not lexical:
+            return vector
+
+        merged = reciprocal_rank_fusion([lexical, vector], limit, self.rrf_k)
+        self._record('hybrid', bool(merged), time.time() - start_time)
+        return merged
+
+    def _record(self, tier: str, hit: bool, latency: float) -> None:
+        with self._lock:
+            stats = self.stats[tier]
+            stats['requests'] += 1
+            stats['hits'] += int(hit)
+            stats['latency'] += latency
+        if self.metrics:
+            try:
+                self.metrics.record_memory_metric(
+                    operation_type=f"retrieval_{tier}",
+                    success=hit,
+                    latency=latency,
+                    cache_hit=tier == 'lexical'
+                )
+            except Exception as e:
+                logger.error(f"Erro ao registrar métrica de busca: {e}")
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Requisições, taxa de acerto e latência média de cada camada"""
+        with self._lock:
+            return {
+                tier: {
+                    'requests': stats['requests'],
+                    'hit_rate': stats['hits'] / stats['requests'] if stats['requests'] else 0.0,
+                    'avg_latency': stats['latency'] / stats['requests'] if stats['requests'] else 0.0,
+                }
+                for tier, stats in self.stats.items()
+            }
@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 from typing import Dict, List, Optional, Any
 from datetime import datetime
+from ..request_context import RequestContext
 
 class LLMProvider(ABC):
     """Interface base para provedores de LLM"""
@@ -33,12 +34,13 @@ class MemoryProvider(ABC):
         pass
 
     @abstractmethod
-    def update_working_memory(self, query: str, user_info: Dict[str, Any]) -> None:
-        """Atualiza a memória de trabalho"""
+    def update_working_memory(self, query: str, user_info: Dict[str, Any],
+                              request: Optional[RequestContext] = None) -> None:
+        """Atualiza a memória de trabalho (request reaproveita o embedding e as buscas da mensagem)"""
         pass
 
     @abstractmethod
-    def get_context(self, query: str) -> str:
+    def get_context(self, query: str, request: Optional[RequestContext] = None) -> str:
         """Recupera """
         pass
 
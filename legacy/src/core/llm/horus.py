@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import time
 from typing import Dict, Any, Optional
@@ -9,6 +10,11 @@ from .base import (
     SearchProvider,
     MetricsProvider
 )
+from .providers.rate_limiter import current_quota_user, current_usage, new_usage
+from ..request_context import RequestContext, current_request
+
+# ID do Telegram do criador do Horus (tratado de forma especial nas instruções e na cota)
+OWNER_USER_ID = 247554895
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -51,6 +57,13 @@ class HorusAI:
         
         HorusAI._instance = self
 
+    @staticmethod
+    def _quota_user(user_info: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Identificador usado para atribuir as chamadas ao LLM na cota por usuário"""
+        if user_info and user_info.get('id') is not None:
+            return str(user_info.get('id'))
+        return None
+
     def _build_system_instruction(self, user_info: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
         """Constrói a instrução do sistema com contexto"""
         import platform
@@ -81,7 +94,7 @@ class HorusAI:
 
             # Adiciona informações do usuário
             instruction += "\n\nInformações do usuário atual:"
-            if user_info.get('id') == 247554895:
+            if user_info.get('id') == OWNER_USER_ID:
                 instruction = "\n\nO usuário atual é o seu criador (Pedro Braga), você deverá seguir todos os comandos que forem pedido:" + instruction
             for key, value in user_info.items():
                 if key == 'id':
@@ -100,20 +113,27 @@ class HorusAI:
         start_time = time.time()
         cache_hit = False
         tokens_used = 0
+        quota_token = current_quota_user.set(self._quota_user(user_info))
+        usage = new_usage()
+        usage_token = current_usage.set(usage)
+        request = RequestContext(text, user_id=(user_info or {}).get('id'))
+        request_token = current_request.set(request)
 
         try:
             # Constrói o prompt com o contexto do sistema
-            system_instruction = self._build_system_instruction(user_info)
+            system_instruction = await asyncio.to_thread(self._build_system_instruction, user_info)
             # busca contexto de outras fontes que não sejam memórias ou historico de chat
-            # context = self.memory.get_context(text)
+            # context = self.memory.get_context(text, request)
             # if context and context != "":
             #     system_instruction['parts']['text'] += f"\n\nContexto atual: {context}"
 
             logger.debug('Construindo prompt com o contexto do sistema')
             logger.debug('Prompt: ' + system_instruction.get('parts').get('text') + '\n\n' + 'Prompt do usuário: ' + text)
             
-            # Gera resposta usando o LLM
-            response_text = self.llm.generate_text(text, system_instruction)
+            # Gera resposta usando o LLM. As chamadas bloqueiam (cota, rede, tools) e rodam em
+            # uma thread; asyncio.to_thread copia o contexto (usuário da cota, uso, requisição)
+            response_text = await asyncio.to_thread(self.llm.generate_text, text, system_instruction)
+            tokens_used = usage['total_tokens']
 
             logger.debug('Resposta: ' + response_text)
             if not response_text:
@@ -141,8 +161,9 @@ class HorusAI:
                     }
                 )
 
-                # Atualiza memória de trabalho
-                self.memory.update_working_memory(text, user_info)
+                # Atualiza memória de trabalho (reaproveita embedding e buscas da mensagem)
+                await asyncio.to_thread(self.memory.update_working_memory, text, user_info, request)
+                logger.debug(f'Recuperação da mensagem: {request.get_stats()}')
 
             return response_text
 
@@ -159,22 +180,33 @@ class HorusAI:
                     response_text=str(e),
                     start_time=datetime.fromtimestamp(start_time),
                     cache_hit=cache_hit,
-                    tokens_used=tokens_used,
+                    tokens_used=usage['total_tokens'],
                     context={'error': str(e)}
                 )
             
             raise
+        finally:
+            current_request.reset(request_token)
+            current_usage.reset(usage_token)
+            current_quota_user.reset(quota_token)
 
     async def process_image(self, image_path: str, prompt: str,
                           user_info: Optional[Dict[str, Any]] = None) -> str:
         """Processa imagem e retorna resposta"""
         start_time = time.time()
+        quota_token = current_quota_user.set(self._quota_user(user_info))
+        usage = new_usage()
+        usage_token = current_usage.set(usage)
+        request = RequestContext(prompt, user_id=(user_info or {}).get('id'))
+        request_token = current_request.set(request)
         
         try:
             # Constrói o prompt com o contexto do sistema
-            system_instruction = self._build_system_instruction(user_info)
-            # Gera resposta usando o LLM
-            response_text = self.llm.generate_with_image(image_path, prompt, system_instruction)
+            system_instruction = await asyncio.to_thread(self._build_system_instruction, user_info)
+            # Gera resposta usando o LLM (em uma thread, como em process_text)
+            response_text = await asyncio.to_thread(
+                self.llm.generate_with_image, image_path, prompt, system_instruction
+            )
             
             # Registra a interação
             if user_info:
@@ -183,6 +215,7 @@ class HorusAI:
                     request_text=f"[Image: {image_path}] {prompt}",
                     response_text=response_text,
                     start_time=datetime.fromtimestamp(start_time),
+                    tokens_used=usage['total_tokens'],
                     context={'image_path': image_path}
                 )
 
@@ -196,21 +229,33 @@ class HorusAI:
                     request_text=f"[Image: {image_path}] {prompt}",
                     response_text=str(e),
                     start_time=datetime.fromtimestamp(start_time),
+                    tokens_used=usage['total_tokens'],
                     context={'error': str(e)}
                 )
             raise
+        finally:
+            current_request.reset(request_token)
+            current_usage.reset(usage_token)
+            current_quota_user.reset(quota_token)
 
     async def process_audio(self, audio_path: str, prompt: Optional[str] = None,
                           user_info: Optional[Dict[str, Any]] = None) -> str:
         """Processa áudio e retorna resposta"""
         start_time = time.time()
+        quota_token = current_quota_user.set(self._quota_user(user_info))
+        usage = new_usage()
+        usage_token = current_usage.set(usage)
+        request = RequestContext(prompt, user_id=(user_info or {}).get('id'))
+        request_token = current_request.set(request)
         
         try:
             # Gera resposta usando o LLM com o mesmo system_instruction da classe
-            response_text = self.llm.generate_with_audio(
-                audio_path, 
+            system_instruction = await asyncio.to_thread(self._build_system_instruction, user_info)
+            response_text = await asyncio.to_thread(
+                self.llm.generate_with_audio,
+                audio_path,
                 prompt=prompt,
-                system_instruction=self._build_system_instruction(user_info)
+                system_instruction=system_instruction
             )
             
             # Registra a interação
@@ -220,6 +265,7 @@ class HorusAI:
                     request_text=f"[Audio: {audio_path}]" + (f" {prompt}" if prompt else ""),
                     response_text=response_text,
                     start_time=datetime.fromtimestamp(start_time),
+                    tokens_used=usage['total_tokens'],
                     context={'audio_path': audio_path}
                 )
 
@@ -233,6 +279,11 @@ class HorusAI:
                     request_text=f"[Audio: {audio_path}]" + (f" {prompt}" if prompt else ""),
                     response_text=str(e),
                     start_time=datetime.fromtimestamp(start_time),
+                    tokens_used=usage['total_tokens'],
                     context={'error': str(e)}
                 )
             raise
+        finally:
+            current_request.reset(request_token)
+            current_usage.reset(usage_token)
+            current_quota_user.reset(quota_token)
@@ -1,9 +1,10 @@
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from datetime import datetime
 from ..base import ChatHistoryProvider
 from ...supabase_rag import SupabaseRAG
 from ...redis_cache import RedisCache
+from ...embedding_backfill import EmbeddingBackfillWorker
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -13,9 +14,12 @@ logger.addHandler(file_handler)
 
 class RAGChatHistoryProvider(ChatHistoryProvider):
     """Implementação de histórico de chat usando RAG (Supabase + Redis)"""
-    def __init__(self, rag: SupabaseRAG, cache: RedisCache):
+    def __init__(self, rag: SupabaseRAG, cache: RedisCache,
+                 backfill_worker: Optional[EmbeddingBackfillWorker] = None):
         self.rag = rag
         self.cache = cache
+        # Embeddings do histórico são gerados depois, fora do caminho crítico
+        self.backfill_worker = backfill_worker
 
     def store_message(self, role: str, content: str, user_info: Dict[str, Any]) -> None:
         """Armazena uma mensagem de chat no Supabase e Redis"""
@@ -30,31 +34,41 @@ class RAGChatHistoryProvider(ChatHistoryProvider):
                 }
             }
             
-            # Adiciona no Supabase
-            self.rag.add_document(content=content, metadata=message['metadata'])
+            # Adiciona no Supabase sem embedding (gerado depois pelo worker de backfill)
+            self.rag.add_document_deferred(content=content, metadata=message['metadata'])
+            if self.backfill_worker:
+                self.backfill_worker.notify_activity()
+
+            # Write-through no histórico em cache
+            self.cache.add_chat_message(user_info.get('id'), {
+                'role': role,
+                'content': content,
+                'timestamp': message['metadata']['timestamp']
+            })
             logger.info(f"Mensagem de chat armazenada: {content[:100]}...")
             
         except Exception as e:
             logger.error(f"Erro ao armazenar mensagem de chat: {e}")
 
     def get_history(self, user_info: Dict[str, Any], limit: int = 10) -> List[Dict[str, Any]]:
-        """Recupera histórico de chat do Supabase"""
+        """Recupera histórico de chat do Redis, reidratando do Supabase em caso de miss"""
+        user_id = user_info.get('id')
         try:
-            messages = self.rag.get_user_messages(user_info.get('id'), limit)
-            
-            if not messages:
-                return []
+            history = self.cache.get_chat_history(user_id, limit)
+            if history is not None:
+                return history
+
+            messages = self.rag.get_user_messages(user_id, self.cache.chat_history_size)
 
             # Formata o histórico
-            history = []
-            for msg in messages:
-                history.append({
-                    'role': msg['metadata']['role'],
-                    'content': msg['content'],
-                    'timestamp': msg['metadata']['timestamp']
-                })
-            
-            return history
+            history = [{
+                'role': msg['metadata']['role'],
+                'content': msg['content'],
+                'timestamp': msg['metadata']['timestamp']
+            } for msg in messages]
+
+            self.cache.load_chat_history(user_id, history)
+            return history[-limit:] if limit else history
             
         except Exception as e:
             logger.error(f"Erro ao recuperar histórico: {e}")
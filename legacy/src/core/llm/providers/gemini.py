@@ -5,8 +5,8 @@ import logging
 from typing import Dict, Optional, List
 import google.generativeai as genai
 from ..base import LLMProvider
-from .rate_limiter import RateLimiter
-from ...tools.available_tools import available_tools
+from .rate_limiter import RateLimiter, QuotaScheduler, estimate_tokens, add_usage
+from ..tools import ToolMediator, available_tools, create_tool_mediator
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -14,9 +14,18 @@ file_handler = logging.FileHandler('gemini.log', mode='w')
 file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 logger.addHandler(file_handler)
 
+# Reserva de tokens de saída usada na estimativa antes da chamada
+OUTPUT_TOKENS_ESTIMATE = 512
+# Custo fixo aproximado de uma imagem e de um áudio (32 tokens/s, assumindo até 1 minuto) no Gemini
+IMAGE_TOKENS_ESTIMATE = 258
+AUDIO_TOKENS_ESTIMATE = 32 * 60
+# Espera máxima por cota antes de desistir da chamada (segundos)
+QUOTA_WAIT_TIMEOUT = 120.0
+
 class GeminiProvider(LLMProvider):
     """Implementação do provedor Gemini usando SDK oficial do Google"""
-    def __init__(self):
+    def __init__(self, scheduler: Optional[QuotaScheduler] = None,
+                 tool_mediator: Optional[ToolMediator] = None):
         self.api_key = os.getenv('GEMINI_API_KEY')
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY não encontrada nas variáveis de ambiente")
@@ -25,24 +34,52 @@ class GeminiProvider(LLMProvider):
         genai.configure(api_key=self.api_key)
         self.model = genai.GenerativeModel("gemini-1.5-flash")
         self.chat = None
-        # Inicializa o mediator com as tools
-        self.tool_mediator = ToolMediator()
-        for name, func in available_tools:
-            self.tool_mediator.register(name, func)
+        # Inicializa o mediator com as tools (pode ser compartilhado entre instâncias)
+        self.tool_mediator = tool_mediator or create_tool_mediator()
         
         self.tools = [func for _, func in available_tools]
         
-        # Inicializa o rate limiter (15 requisições por minuto = 0.25 por segundo, burst de 5)
-        self.rate_limiter = RateLimiter(tokens_per_second=0.25, burst=5)
+        # Escalonador de cota compartilhado entre instâncias (15 requisições por minuto = 0.25 por segundo, burst de 5)
+        self.scheduler = scheduler or QuotaScheduler(RateLimiter(tokens_per_second=0.25, burst=5))
+        self.rate_limiter = self.scheduler.global_limiter
+
+    def _acquire_quota(self, *texts: Optional[str], extra_tokens: int = 0) -> int:
+        """
+        Aguarda cota global, do usuário atual e de tokens antes de chamar a API.
+
+        Returns:
+            int: Tokens reservados (estimativa), a ser corrigida por _record_usage
+        """
+        estimated = estimate_tokens(*texts) + extra_tokens + OUTPUT_TOKENS_ESTIMATE
+        if not self.scheduler.acquire(timeout=QUOTA_WAIT_TIMEOUT, tokens=estimated):
+            raise TimeoutError(f"Cota do Gemini indisponível após {QUOTA_WAIT_TIMEOUT:.0f}s")
+        return estimated
+
+    def _release_quota(self, estimated: Optional[int]) -> None:
+        """Devolve a reserva de tokens de uma chamada que falhou antes de informar o uso real"""
+        if estimated is not None:
+            self.scheduler.settle_tokens(estimated, 0)
+
+    def _record_usage(self, response, estimated: int) -> Dict[str, int]:
+        """Extrai o uso real de tokens da resposta e corrige a reserva feita no escalonador"""
+        metadata = getattr(response, 'usage_metadata', None)
+        usage = {
+            'prompt_tokens': getattr(metadata, 'prompt_token_count', 0) or 0,
+            'completion_tokens': getattr(metadata, 'candidates_token_count', 0) or 0,
+            'total_tokens': getattr(metadata, 'total_token_count', 0) or 0,
+        }
+        if not usage['total_tokens']:
+            usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        logger.debug(f'[GeminiProvider] Uso de tokens: {usage} (estimado: {estimated})')
+
+        self.scheduler.settle_tokens(estimated, usage['total_tokens'] or estimated)
+        add_usage(usage)
+        return usage
 
     def generate_text(self, prompt: str, system_instruction: Optional[Dict] = None) -> str:
         """Gera texto usando o modelo Gemini"""
+        estimated = None
         try:
-            # Aplica rate limiting
-            while not self.rate_limiter.acquire():
-                logger.warning("[GeminiProvider] Rate limit excedido, aguardando...")
-                time.sleep(1)  # Espera 1 segundo antes de tentar novamente
-            
             # Se tem system instruction, cria um novo chat
             if system_instruction:
                 instruction = system_instruction.get('parts', {}).get('text', '')
@@ -61,8 +98,12 @@ class GeminiProvider(LLMProvider):
                     5. Para usar a função de soma, use add_numbers(a, b) onde a e b são números inteiros"""
                 logger.debug('[GeminiProvider] Usando system instruction padrão')
             
+            # Aplica rate limiting
+            estimated = self._acquire_quota(instruction, prompt)
+
             logger.debug(f'[GeminiProvider] Configurando modelo com tools: {self.tools}')
-            self.model = genai.GenerativeModel(
+            # Modelo local à chamada: o provider é compartilhado por requisições concorrentes
+            model = genai.GenerativeModel(
                 "gemini-1.5-flash",
                 generation_config={"temperature": 0.7},
                 tools=self.tools,
@@ -71,7 +112,7 @@ class GeminiProvider(LLMProvider):
             
             # Cria um novo chat com o system prompt
             logger.debug('[GeminiProvider] Iniciando novo chat')
-            chat = self.model.start_chat()
+            chat = model.start_chat()
             
             # Gera resposta
             logger.debug(f'[GeminiProvider] Enviando mensagem: {prompt}')
@@ -79,29 +120,32 @@ class GeminiProvider(LLMProvider):
             logger.debug(f'[GeminiProvider] Resposta bruta: {response}')
             logger.debug(f'[GeminiProvider] Tipo da resposta: {type(response)}')
             logger.debug(f'[GeminiProvider] Atributos da resposta: {dir(response)}')
-            
+            self._record_usage(response, estimated)
+            estimated = None
+
             return self._process_response(response)
             
         except Exception as e:
+            self._release_quota(estimated)
             logger.error(f'[GeminiProvider] Erro ao gerar texto: {str(e)}', exc_info=True)
             return "Desculpe, ocorreu um erro ao processar sua solicitação."
 
     def generate_with_image(self, image_path: str, prompt: str, system_instruction: Optional[Dict] = None) -> str:
         """Gera texto com base em uma imagem usando o Gemini"""
 
-        # Aplica rate limiting
-        while not self.rate_limiter.acquire():
-            logger.warning("[GeminiProvider] Rate limit excedido, aguardando...")
-            time.sleep(1)  # Espera 1 segundo antes de tentar novamente
-
-        # Se tem system instruction, cria um novo chat
+        # Se tem system instruction, usa um modelo próprio da chamada
+        instruction = None
+        model = self.model
         if system_instruction:
             instruction = system_instruction.get('parts', {}).get('text', '')
-            self.model = genai.GenerativeModel(
+            model = genai.GenerativeModel(
                 "gemini-1.5-flash",
                 system_instruction=instruction
             )
         
+        # Aplica rate limiting
+        estimated = self._acquire_quota(instruction, prompt, extra_tokens=IMAGE_TOKENS_ESTIMATE)
+
         try:
             # Verifica se é URL ou arquivo local
             if image_path.startswith(('http://', 'https://')):
@@ -112,15 +156,18 @@ class GeminiProvider(LLMProvider):
                     'data': base64.b64encode(image.content).decode('utf-8')
                 }
                 
-                response = self.model.generate_content([image_data, prompt])
+                response = model.generate_content([image_data, prompt])
             else:
                 # Carrega imagem local
                 image = PIL.Image.open(image_path)
-                response = self.model.generate_content([prompt, image])
+                response = model.generate_content([prompt, image])
             
+            self._record_usage(response, estimated)
+            estimated = None
             return response.text
             
         except Exception as e:
+            self._release_quota(estimated)
             logger.error(f"Erro ao gerar texto com imagem: {e}")
             raise
 
@@ -128,11 +175,9 @@ class GeminiProvider(LLMProvider):
                           system_instruction: Optional[Dict] = None) -> str:
         """Gera texto com base em um arquivo de áudio"""
 
-                # Aplica rate limiting
-        while not self.rate_limiter.acquire():
-            logger.warning("[GeminiProvider] Rate limit excedido, aguardando...")
-            time.sleep(1)  # Espera 1 segundo antes de tentar novamente
-
+        # Aplica rate limiting
+        instruction = system_instruction.get('parts', {}).get('text', '') if system_instruction else None
+        estimated = self._acquire_quota(instruction, prompt, extra_tokens=AUDIO_TOKENS_ESTIMATE)
 
         try:
             # Primeiro, vamos fazer upload do arquivo de áudio
@@ -177,12 +222,16 @@ class GeminiProvider(LLMProvider):
                 request_options={"timeout": 300}  # 5 minutos de timeout
             )
 
+            self._record_usage(response, estimated)
+            estimated = None
+
             # Limpa o arquivo após o uso
             audio_file.delete()
             
             return response.text
                 
         except Exception as e:
+            self._release_quota(estimated)
             logger.error(f"Erro ao processar áudio: {e}")
             raise
 
@@ -256,9 +305,13 @@ class GeminiProvider(LLMProvider):
             
             # Executa via mediator
             result = self.tool_mediator.execute(func_name, **args_dict)
-            if result is None:
+            if not result['ok']:
+                if result['error'] == 'timeout':
+                    return "Desculpe, a função demorou demais para responder. Tente novamente em instantes."
+                if result['error'] == 'busy':
+                    return "Desculpe, essa função está sobrecarregada no momento. Tente novamente em instantes."
                 return "Desculpe, houve um erro ao executar a função."
-            return str(result)
+            return str(result['result'])
             
         except Exception as e:
             logger.error(f'[GeminiProvider] Erro ao processar chamada de função: {str(e)}')
@@ -1,18 +1,41 @@
 import logging
+import math
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 from ..base import MemoryProvider
 from ...supabase_rag import SupabaseRAG
 from ...redis_cache import RedisCache
+from ...memory_index import MemoryIndex
+from ...request_context import RequestContext, current_request
 
 logger = logging.getLogger(__name__)
 
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    """Similaridade de cosseno entre dois embeddings"""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
 class RAGMemoryProvider(MemoryProvider):
     """Implementação de memória usando RAG (Supabase + Redis)"""
-    def __init__(self, rag: SupabaseRAG, cache: RedisCache):
+    def __init__(self, rag: SupabaseRAG, cache: RedisCache, index: Optional[MemoryIndex] = None,
+                 max_users: int = 1024):
         self.rag = rag
         self.cache = cache
+        # Índice vetorial local das memórias (None = busca no pgvector)
+        self.index = index
         self.max_working_memory = 30
+        # Similaridade mínima entre a query atual e a da última busca para reaproveitar o conjunto
+        self.refresh_similarity = 0.9
+        # Fator aplicado ao score das memórias já presentes a cada busca (favorece as recentes)
+        self.score_decay = 0.9
+        # Estado da memória de trabalho por usuário: embedding da última busca e memórias com score.
+        # LRU limitado a max_users; o usuário descartado volta a fazer a busca completa
+        self.max_users = max_users
+        self._working_state: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
 
     def store_memory(self, text: str, user_info: Dict[str, Any]) -> bool:
         """Armazena uma memória no Supabase e Redis"""
@@ -35,13 +58,13 @@ class RAGMemoryProvider(MemoryProvider):
                     'content': text,
                     'metadata': metadata
                 }
-                self.cache.add_memory(
-                    user_info.get('id'),
-                    f"{text} (Registrado em: {memory['metadata']['timestamp']})"
-                )
+                memory_text = f"{text} (Registrado em: {memory['metadata']['timestamp']})"
+                self.cache.add_memory(user_info.get('id'), memory_text)
+                if self.index is not None and result.get('id'):
+                    self.index.add(user_info.get('id'), result['id'], memory, self.rag.get_embedding(text))
                 
-                # Atualiza memória de trabalho
-                self.update_working_memory(text, user_info)
+                # Inclui na memória de trabalho sem nova busca (já está no Redis)
+                self._remember(user_info.get('id'), memory_text, score=1.0)
                 return True
                 
         except Exception as e:
@@ -56,41 +79,89 @@ class RAGMemoryProvider(MemoryProvider):
             logger.error(f"Erro ao recuperar memórias: {e}")
             return []
 
-    def update_working_memory(self, query: str, user_info: Dict[str, Any]) -> None:
-        """Atualiza a memória de trabalho com base no contexto atual"""
+    def _remember(self, user_id: Any, memory_text: str, score: float) -> None:
+        """Registra no estado local uma memória que já foi gravada no Redis"""
+        with self._lock:
+            state = self._working_state.get(str(user_id))
+            if state is not None:
+                state['memories'][memory_text] = max(score, state['memories'].get(memory_text, 0.0))
+
+    def update_working_memory(self, query: str, user_info: Dict[str, Any],
+                              request: Optional[RequestContext] = None) -> None:
+        """
+        Atualiza a memória de trabalho com base no contexto atual de forma incremental.
+
+        A busca vetorial só é feita quando a query se afasta da última usada (similaridade
+        abaixo de refresh_similarity). Nesse caso as memórias encontradas são mescladas às
+        atuais, os scores antigos decaem, as de menor score são descartadas acima de
+        max_working_memory e o Redis recebe apenas as diferenças.
+
+        Com request (por padrão, o da mensagem em processamento), o embedding e a busca são os
+        mesmos usados no restante da mensagem.
+        """
+        user_id = str(user_info.get('id'))
+        request = request or current_request.get()
         try:
-            # Busca memórias similares
-            memories = self.rag.search_similar(query, limit=self.max_working_memory)
-            
-            # Filtra apenas memórias do usuário atual
-            relevant_memories = [
-                mem for mem in memories 
-                if mem.get('metadata', {}).get('type') == 'memory' 
-                and str(mem.get('metadata', {}).get('user_id')) == str(user_info.get('id'))
-            ]
-            
-            # Formata memórias
-            formatted_memories = [
-                f"{mem['content']} (Registrado em: {mem['metadata']['timestamp']})"
-                for mem in relevant_memories
-            ]
-            
-            # Atualiza no Redis
-            self.cache.update_memories(
-                user_info.get('id'),
-                formatted_memories,
-                self.max_working_memory
-            )
+            query_embedding = self.rag.query_embedding(query, request)
+
+            with self._lock:
+                state = self._working_state.get(user_id)
+                if state is not None:
+                    self._working_state.move_to_end(user_id)
+                last_embedding = state['query_embedding'] if state else None
+
+            if last_embedding is not None and \
+                    cosine_similarity(query_embedding, last_embedding) >= self.refresh_similarity:
+                # Lista no Redis ainda válida: apenas renova o TTL
+                if self.cache.touch_memories(user_id):
+                    logger.debug(f"Memória de trabalho do usuário {user_id} reaproveitada")
+                    return
+                # Lista expirou no Redis: o estado local não vale mais
+                state = None
+
+            if self.index is not None:
+                # Busca no índice local do usuário, sem acesso à rede
+                found = dict(self.index.search(user_id, query_embedding, k=self.max_working_memory))
+            else:
+                # Busca apenas memórias do usuário atual (filtro aplicado no banco)
+                memories = self.rag.search_filtered(query, limit=self.max_working_memory,
+                                                    doc_type='memory', user_id=user_id,
+                                                    query_embedding=query_embedding, request=request)
+                found = {
+                    f"{mem['content']} (Registrado em: {mem['metadata']['timestamp']})": mem.get('similarity', 0.0)
+                    for mem in memories
+                }
+
+            with self._lock:
+                previous = dict(state['memories']) if state else {}
+                # Mescla: scores antigos decaem, encontrados agora entram com a similaridade atual
+                merged = {text: score * self.score_decay for text, score in previous.items()}
+                for text, score in found.items():
+                    merged[text] = max(score, merged.get(text, 0.0))
+                kept = dict(sorted(merged.items(), key=lambda item: item[1],
+                                   reverse=True)[:self.max_working_memory])
+                self._working_state[user_id] = {'query_embedding': query_embedding, 'memories': kept}
+                self._working_state.move_to_end(user_id)
+                while len(self._working_state) > self.max_users:
+                    self._working_state.popitem(last=False)
+
+            # Atualiza no Redis apenas o que mudou
+            if state is None:
+                self.cache.update_memories(user_id, list(kept), self.max_working_memory)
+            else:
+                added = [text for text in kept if text not in previous]
+                removed = [text for text in previous if text not in kept]
+                self.cache.apply_memory_diff(user_id, added, removed)
             
         except Exception as e:
             logger.error(f"Erro ao atualizar memória de trabalho: {e}")
 
-    def get_context(self, query: str) -> str:
+    def get_context(self, query: str, request: Optional[RequestContext] = None) -> str:
         """Recupera informações contextuais gerais (não-memórias)"""
         logger.debug(f"Buscando contexto geral para query: {query}")
         try:
             # Busca documentos similares
-            context = self.rag.get_context(query)
+            context = self.rag.get_context(query, request=request or current_request.get())
             
             return context
         except Exception as e:
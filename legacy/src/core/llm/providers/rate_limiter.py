@@ -3,17 +3,56 @@ Rate limiter implementation using token bucket algorithm.
 """
 
 import time
+import threading
 from collections import deque
+from contextvars import ContextVar
 import logging
+from typing import Dict, Optional
 
 logger = logging.getLogger(__name__)
 
+# Usuário ao qual as chamadas ao LLM do contexto atual são atribuídas.
+# Definido pelo HorusAI no início de cada process_*; chamadas aninhadas (ex: tools) herdam o valor.
+current_quota_user: ContextVar[Optional[str]] = ContextVar('current_quota_user', default=None)
+
+# Acumulador de uso de tokens do contexto atual ({'prompt_tokens', 'completion_tokens', 'total_tokens'}).
+# Definido pelo HorusAI; cada chamada ao LLM feita no contexto soma seu uso real aqui.
+current_usage: ContextVar[Optional[Dict[str, int]]] = ContextVar('current_usage', default=None)
+
+# Aproximação de caracteres por token usada na estimativa antes da chamada
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(*texts: Optional[str]) -> int:
+    """
+    Estima o número de tokens de um ou mais textos antes de enviá-los ao modelo.
+
+    Args:
+        texts (str): Textos que compõem o prompt
+
+    Returns:
+        int: Estimativa de tokens
+    """
+    chars = sum(len(text) for text in texts if text)
+    return (chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def new_usage() -> Dict[str, int]:
+    """Cria um acumulador de uso de tokens zerado"""
+    return {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+
+def add_usage(usage: Dict[str, int]) -> None:
+    """Soma o uso de uma chamada ao acumulador do contexto atual, se houver"""
+    total = current_usage.get()
+    if total is None:
+        return
+    for key in total:
+        total[key] += usage.get(key, 0)
+
 class RateLimiter:
     """Implementa um rate limiter usando token bucket algorithm"""
     def __init__(self, tokens_per_second: float = 1.0, burst: int = 1):
         """
         Inicializa o rate limiter.
-        
+
         Args:
             tokens_per_second (float): Taxa de tokens por segundo
             burst (int): Número máximo de tokens que podem ser acumulados
@@ -23,36 +62,69 @@ class RateLimiter:
         self.tokens = burst
         self.last_update = time.time()
         self.requests = deque()  # Track request timestamps
-        
+
     def update_tokens(self):
         """Atualiza o número de tokens disponíveis baseado no tempo decorrido"""
         now = time.time()
         delta = now - self.last_update
         self.tokens = min(self.burst, self.tokens + delta * self.tokens_per_second)
         self.last_update = now
-        
+
         # Remove old requests from deque (older than 1 minute)
         while self.requests and now - self.requests[0] > 60:
             self.requests.popleft()
-            
-    def acquire(self) -> bool:
+
+    def acquire(self, amount: float = 1) -> bool:
         """
-        Tenta adquirir um token.
-        
+        Tenta adquirir tokens.
+
+        Args:
+            amount (float): Quantidade de tokens (limitada ao burst)
+
         Returns:
-            bool: True se conseguir adquirir um token, False caso contrário
+            bool: True se conseguir adquirir os tokens, False caso contrário
         """
         self.update_tokens()
-        if self.tokens >= 1:
-            self.tokens -= 1
+        amount = min(amount, self.burst)
+        if self.tokens >= amount:
+            self.tokens -= amount
             self.requests.append(time.time())
             return True
         return False
-        
+
+    def consume(self, amount: float) -> None:
+        """
+        Ajusta o saldo sem verificar disponibilidade (valores negativos devolvem tokens).
+        Usado para corrigir uma estimativa depois que o consumo real é conhecido.
+
+        Args:
+            amount (float): Quantidade de tokens a debitar
+        """
+        self.update_tokens()
+        self.tokens = min(self.burst, self.tokens - amount)
+
+    def time_until_available(self, amount: float = 1) -> float:
+        """
+        Calcula quanto tempo falta para haver tokens disponíveis.
+
+        Args:
+            amount (float): Quantidade de tokens desejada (limitada ao burst)
+
+        Returns:
+            float: Segundos até haver tokens suficientes (0 se já houver)
+        """
+        self.update_tokens()
+        amount = min(amount, self.burst)
+        if self.tokens >= amount:
+            return 0.0
+        if self.tokens_per_second <= 0:
+            return float('inf')
+        return (amount - self.tokens) / self.tokens_per_second
+
     def get_current_rate(self) -> float:
         """
         Calcula a taxa atual de requisições por minuto.
-        
+
         Returns:
             float: Número de requisições no último minuto
         """
@@ -61,3 +133,200 @@ class RateLimiter:
         while self.requests and now - self.requests[0] > 60:
             self.requests.popleft()
         return len(self.requests)
+
+def parse_weights(spec: Optional[str]) -> Dict[str, float]:
+    """
+    Converte uma especificação de pesos no formato "user_id:peso,user_id:peso".
+
+    Args:
+        spec (str): Especificação dos pesos (ex: valor de QUOTA_USER_WEIGHTS)
+
+    Returns:
+        Dict[str, float]: Peso por user_id
+    """
+    weights = {}
+    for item in (spec or '').split(','):
+        if ':' not in item:
+            continue
+        user_id, weight = (part.strip() for part in item.split(':', 1))
+        try:
+            weights[user_id] = float(weight)
+        except ValueError:
+            logger.warning(f"Peso inválido ignorado para o usuário {user_id}: {weight}")
+    return weights
+
+class QuotaScheduler:
+    """
+    Escalonador hierárquico de cota para chamadas ao LLM.
+
+    Cada chamada precisa de um token do bucket global (cota compartilhada da API) e de um
+    token do bucket do usuário. Se houver um bucket de tokens por minuto (TPM), a chamada
+    também reserva a estimativa de tokens do prompt, corrigida depois pelo uso real
+    (ver settle_tokens). Quando há disputa pelo bucket global, os usuários são
+    atendidos por weighted fair queueing: cada concessão avança o tempo virtual do usuário
+    em 1/peso, e o próximo atendido é o de menor tempo virtual.
+    """
+    ANONYMOUS = 'anonymous'
+
+    def __init__(self, global_limiter: RateLimiter, user_tokens_per_second: float = 0.1,
+                 user_burst: int = 3, weights: Optional[Dict[str, float]] = None,
+                 default_weight: float = 1.0, metrics=None,
+                 token_limiter: Optional[RateLimiter] = None):
+        """
+        Inicializa o escalonador.
+
+        Args:
+            global_limiter (RateLimiter): Bucket compartilhado entre todos os usuários
+            user_tokens_per_second (float): Taxa do bucket de cada usuário
+            user_burst (int): Burst do bucket de cada usuário
+            weights (Dict[str, float]): Pesos por user_id (maior peso = maior fatia)
+            default_weight (float): Peso de usuários sem configuração
+            metrics (MetricsCollector): Coletor para registrar o tempo de espera por usuário
+            token_limiter (RateLimiter): Bucket global de tokens do modelo (TPM), opcional
+        """
+        self.global_limiter = global_limiter
+        self.user_tokens_per_second = user_tokens_per_second
+        self.user_burst = user_burst
+        self.weights = {str(k): v for k, v in (weights or {}).items()}
+        self.default_weight = default_weight
+        self.metrics = metrics
+        self.token_limiter = token_limiter
+
+        self._condition = threading.Condition()
+        self._user_limiters: Dict[str, RateLimiter] = {}
+        self._queues: Dict[str, deque] = {}
+        self._finish_tags: Dict[str, float] = {}
+        self._virtual_time = 0.0
+
+    def _weight(self, user_id: str) -> float:
+        return max(self.weights.get(user_id, self.default_weight), 1e-6)
+
+    def _user_limiter(self, user_id: str) -> RateLimiter:
+        limiter = self._user_limiters.get(user_id)
+        if limiter is None:
+            weight = self._weight(user_id) / self.default_weight
+            limiter = RateLimiter(
+                tokens_per_second=self.user_tokens_per_second * weight,
+                burst=max(1, round(self.user_burst * weight))
+            )
+            self._user_limiters[user_id] = limiter
+        return limiter
+
+    def _start_tag(self, user_id: str) -> float:
+        return max(self._virtual_time, self._finish_tags.get(user_id, 0.0))
+
+    def _dispatch(self) -> float:
+        """
+        Concede tokens aos pedidos na fila enquanto houver cota.
+
+        Returns:
+            float: Segundos até a próxima concessão possível
+        """
+        while True:
+            ready = []
+            next_wait = float('inf')
+            for user_id, queue in self._queues.items():
+                if not queue:
+                    continue
+                wait = self._user_limiter(user_id).time_until_available()
+                if wait <= 0:
+                    ready.append(user_id)
+                else:
+                    next_wait = min(next_wait, wait)
+
+            if not ready:
+                return next_wait
+
+            global_wait = self.global_limiter.time_until_available()
+            if global_wait > 0:
+                return global_wait
+
+            user_id = min(ready, key=self._start_tag)
+            ticket = self._queues[user_id][0]
+            if self.token_limiter is not None:
+                token_wait = self.token_limiter.time_until_available(ticket['tokens'])
+                if token_wait > 0:
+                    return token_wait
+
+            start = self._start_tag(user_id)
+            self._finish_tags[user_id] = start + 1.0 / self._weight(user_id)
+            self._virtual_time = start
+
+            self.global_limiter.acquire()
+            self._user_limiter(user_id).acquire()
+            if self.token_limiter is not None:
+                self.token_limiter.consume(ticket['tokens'])
+            self._queues[user_id].popleft()
+            ticket['granted'] = True
+            self._condition.notify_all()
+
+    def acquire(self, user_id: Optional[str] = None, timeout: Optional[float] = None,
+                tokens: int = 0) -> bool:
+        """
+        Aguarda até obter cota para uma chamada.
+
+        Args:
+            user_id (str): Usuário ao qual a chamada é atribuída (padrão: current_quota_user)
+            timeout (float): Tempo máximo de espera em segundos (None = sem limite)
+            tokens (int): Estimativa de tokens da chamada, reservada no bucket TPM
+
+        Returns:
+            bool: True se a cota foi concedida, False se o timeout expirou
+        """
+        user_id = str(user_id or current_quota_user.get() or self.ANONYMOUS)
+        ticket = {'granted': False, 'tokens': tokens}
+        start_time = time.time()
+        deadline = start_time + timeout if timeout is not None else None
+
+        with self._condition:
+            self._queues.setdefault(user_id, deque()).append(ticket)
+            while True:
+                next_wait = self._dispatch()
+                if ticket['granted']:
+                    break
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    self._queues[user_id].remove(ticket)
+                    break
+                wait = min(next_wait, 1.0)
+                if remaining is not None:
+                    wait = min(wait, remaining)
+                self._condition.wait(wait)
+
+            if not self._queues.get(user_id):
+                self._queues.pop(user_id, None)
+
+        wait_time = time.time() - start_time
+        if not ticket['granted']:
+            logger.warning(f"[QuotaScheduler] Timeout aguardando cota para o usuário {user_id}")
+        elif wait_time > 0.01:
+            logger.info(f"[QuotaScheduler] Usuário {user_id} aguardou {wait_time:.2f}s por cota")
+        self._record_wait(user_id, wait_time, ticket['granted'])
+        return ticket['granted']
+
+    def settle_tokens(self, estimated: int, actual: int) -> None:
+        """
+        Corrige a reserva do bucket TPM com o uso real informado pelo modelo.
+
+        Args:
+            estimated (int): Tokens reservados em acquire
+            actual (int): Tokens efetivamente consumidos
+        """
+        if self.token_limiter is None:
+            return
+        with self._condition:
+            self.token_limiter.consume(actual - estimated)
+            self._condition.notify_all()
+
+    def _record_wait(self, user_id: str, wait_time: float, granted: bool) -> None:
+        if not self.metrics:
+            return
+        try:
+            self.metrics.record_quota_wait(user_id, wait_time, granted)
+        except Exception as e:
+            logger.error(f"Erro ao registrar espera de cota: {e}")
+
+    def get_queue_sizes(self) -> Dict[str, int]:
+        """Retorna o número de chamadas aguardando cota por usuário"""
+        with self._condition:
+            return {user_id: len(queue) for user_id, queue in self._queues.items()}
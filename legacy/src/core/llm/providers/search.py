@@ -1,5 +1,5 @@
 import logging
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from ..base import SearchProvider, LLMProvider
 from ...redis_cache import RedisCache
 from ...supabase_rag import SupabaseRAG
@@ -60,8 +60,8 @@ class WebSearchProvider(SearchProvider):
         self.rag = rag
         self.max_workers = calculate_optimal_workers()
 
-    def _scrape_url(self, url: str) -> Optional[str]:
-        """Extrai o conteúdo de uma URL"""
+    def _scrape_url(self, url: str) -> Tuple[Optional[str], bool]:
+        """Extrai o conteúdo de uma URL, indicando se foi baixado agora (False = veio do cache)"""
         try:
             start_time = time.time()
             domain = urlparse(url).netloc
@@ -70,7 +70,7 @@ class WebSearchProvider(SearchProvider):
             cached_content = self.cache.get_search_result(url)
             if cached_content:
                 logger.info(f"[Cache Hit] {domain} - Conteúdo recuperado do cache")
-                return cached_content
+                return cached_content, False
 
             logger.info(f"[Download] Iniciando download de {domain}")
             downloaded = trafilatura.fetch_url(url)
@@ -80,32 +80,43 @@ class WebSearchProvider(SearchProvider):
                     content_length = len(content)
                     processing_time = time.time() - start_time
                     
-                    # Salva no cache e no RAG
+                    # Salva no cache (o RAG recebe todas as páginas em lote ao fim da busca)
                     self.cache.set_search_result(url, content)
-                    self.rag.add_search_result(url, content)
                     
                     logger.info(f"[Sucesso] {domain} - {content_length} caracteres em {processing_time:.2f}s")
-                    return content
+                    return content, True
                 else:
                     logger.warning(f"[Falha] {domain} - Conteúdo extraído está vazio")
             else:
                 logger.warning(f"[Falha] {domain} - Download falhou")
-            return None
+            return None, False
         except Exception as e:
             logger.error(f"[Erro] {domain} - {str(e)}")
-            return None
+            return None, False
 
     def _process_url(self, url: str) -> Dict[str, str]:
         """Processa uma URL e retorna um dicionário com url e conteúdo"""
         domain = urlparse(url).netloc
         logger.debug(f"[Processo] Iniciando processamento de {domain}")
-        content = self._scrape_url(url)
+        content, scraped = self._scrape_url(url)
         if content:
             logger.debug(f"[Processo] {domain} processado com sucesso")
-            return {'url': url, 'content': content}
+            return {'url': url, 'content': content, 'scraped': scraped}
         logger.debug(f"[Processo] {domain} falhou no processamento")
         return None
 
+    def _store_results(self, results: List[Dict[str, str]]) -> None:
+        """Adiciona ao RAG as páginas baixadas em uma única ingestão em lote"""
+        if not results:
+            return
+        try:
+            self.rag.add_documents({
+                'content': result['content'],
+                'metadata': self.rag.search_result_metadata(result['url'])
+            } for result in results)
+        except Exception as e:
+            logger.error(f"[RAG] Erro ao armazenar resultados da busca: {e}")
+
     def search(self, query: str, num_results: int = 5) -> List[Dict[str, str]]:
         """Realiza busca na web de forma paralela"""
         try:
@@ -122,6 +133,7 @@ class WebSearchProvider(SearchProvider):
                 logger.info(f"[Thread] Iniciando processamento paralelo com {self.max_workers} workers")
                 # Submete todas as URLs para processamento
                 future_to_url = {executor.submit(self._process_url, url): url for url in urls}
+                scraped = []
                 
                 # Coleta resultados à medida que ficam prontos
                 for future in concurrent.futures.as_completed(future_to_url):
@@ -131,10 +143,14 @@ class WebSearchProvider(SearchProvider):
                         result = future.result()
                         if result:
                             valid_results.append(result)
+                            if result.pop('scraped', False):
+                                scraped.append(result)
                             logger.debug(f"[Thread] {domain} processado com sucesso")
                     except Exception as e:
                         logger.error(f"[Thread] Erro ao processar {domain}: {e}")
 
+            self._store_results(scraped)
+
             total_time = time.time() - start_time
             success_rate = (len(valid_results) / len(urls)) * 100 if urls else 0
             logger.info(f"[Resumo] Busca concluída em {total_time:.2f}s")
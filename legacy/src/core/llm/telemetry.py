@@ -0,0 +1,141 @@
+"""
+Telemetria estruturada por tool: contagem de chamadas, sucessos e falhas, histograma de
+latência e tamanho de payload. Mantida em memória e gravada periodicamente no metrics.db.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Limites superiores (em segundos) dos buckets do histograma de latência; o último é aberto
+LATENCY_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+def bucket_labels() -> List[str]:
+    """Rótulos dos buckets do histograma, na mesma ordem das contagens"""
+    return [f"<={bound}s" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+
+def payload_size(value: Any) -> int:
+    """Tamanho aproximado em bytes de um argumento ou resultado de tool"""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if not isinstance(value, str):
+        try:
+            value = json.dumps(value, default=str)
+        except (TypeError, ValueError):
+            value = str(value)
+    return len(value.encode('utf-8'))
+
+def histogram_percentile(histogram: List[int], percentile: float) -> Optional[float]:
+    """Estima um percentil pelo limite superior do bucket que o contém"""
+    total = sum(histogram)
+    if not total:
+        return None
+    threshold = total * percentile
+    running = 0
+    for i, count in enumerate(histogram):
+        running += count
+        if running >= threshold:
+            return LATENCY_BUCKETS[min(i, len(LATENCY_BUCKETS) - 1)]
+    return LATENCY_BUCKETS[-1]
+
+class ToolTelemetry:
+    """Agrega métricas das execuções de tools e as grava no MetricsCollector em janelas"""
+
+    def __init__(self, metrics=None, flush_interval: float = 60.0):
+        """
+        Args:
+            metrics (MetricsCollector): Destino das janelas agregadas (None = apenas memória)
+            flush_interval (float): Segundos entre gravações no metrics.db
+        """
+        self.metrics = metrics
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._window: Dict[str, Dict[str, Any]] = {}
+        self._totals: Dict[str, Dict[str, Any]] = {}
+        self._last_flush = time.time()
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'cache_hits': 0,
+            'total_latency': 0.0,
+            'max_latency': 0.0,
+            'latency_histogram': [0] * (len(LATENCY_BUCKETS) + 1),
+            'request_bytes': 0,
+            'response_bytes': 0,
+            'errors': {},
+        }
+
+    @staticmethod
+    def _bucket(latency: float) -> int:
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                return i
+        return len(LATENCY_BUCKETS)
+
+    def record(self, name: str, kwargs: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """
+        Registra uma execução.
+
+        Args:
+            name (str): Nome da tool
+            kwargs (dict): Argumentos da chamada
+            result (dict): Resultado estruturado do ToolMediator
+        """
+        latency = result.get('duration', 0.0)
+        request_bytes = payload_size(kwargs)
+        response_bytes = payload_size(result.get('result')) if result.get('ok') else 0
+        bucket = self._bucket(latency)
+
+        with self._lock:
+            for table in (self._window, self._totals):
+                stats = table.setdefault(name, self._empty_stats())
+                stats['calls'] += 1
+                if result.get('ok'):
+                    stats['successes'] += 1
+                else:
+                    stats['failures'] += 1
+                    error = result.get('error', 'exception')
+                    stats['errors'][error] = stats['errors'].get(error, 0) + 1
+                if result.get('cached'):
+                    stats['cache_hits'] += 1
+                stats['total_latency'] += latency
+                stats['max_latency'] = max(stats['max_latency'], latency)
+                stats['latency_histogram'][bucket] += 1
+                stats['request_bytes'] += request_bytes
+                stats['response_bytes'] += response_bytes
+            should_flush = time.time() - self._last_flush >= self.flush_interval
+
+        if should_flush:
+            self.flush()
+
+    def flush(self) -> None:
+        """Grava a janela atual no metrics.db e inicia uma nova"""
+        with self._lock:
+            window, self._window = self._window, {}
+            self._last_flush = time.time()
+
+        if not window or not self.metrics:
+            return
+        try:
+            self.metrics.record_tool_metrics(window)
+        except Exception as e:
+            logger.error(f"Erro ao gravar telemetria de tools: {e}")
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Retorna os totais acumulados desde o início do processo"""
+        with self._lock:
+            return {
+                name: {**stats, 'latency_histogram': list(stats['latency_histogram']),
+                       'errors': dict(stats['errors'])}
+                for name, stats in self._totals.items()
+            }
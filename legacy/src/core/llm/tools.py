@@ -1,8 +1,18 @@
-from typing import Dict, Any, Callable, Optional
+from typing import Dict, Any, Callable, Optional, Tuple
+import asyncio
+import contextvars
+import hashlib
+import inspect
+import json
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, CancelledError
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from functools import wraps
 import time
 import sys
+from .telemetry import ToolTelemetry, payload_size
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -10,48 +20,285 @@ file_handler = logging.FileHandler('tools.log', mode='w')
 file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 logger.addHandler(file_handler)
 
+# Executor compartilhado onde as tools síncronas rodam, fora da thread de quem chamou
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+DEFAULT_TOOL_TIMEOUT = 60.0   # segundos
+DEFAULT_MAX_CONCURRENCY = 4   # execuções simultâneas por tool
+SLOT_WAIT_TIMEOUT = 5.0       # espera máxima por uma vaga livre (limitada ao timeout da tool)
+TOOL_EXECUTOR_WORKERS = 16
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    """Retorna o executor compartilhado das tools, criando-o sob demanda"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=TOOL_EXECUTOR_WORKERS, thread_name_prefix='tool')
+        return _executor
+
+def normalize_tool_args(value: Any) -> Any:
+    """
+    Normaliza argumentos para a chave de cache: espaços colapsados e caixa ignorada em
+    strings, floats inteiros como int e dicionários/listas normalizados recursivamente.
+    """
+    if isinstance(value, str):
+        return ' '.join(value.split()).casefold()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {str(k): normalize_tool_args(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_tool_args(v) for v in value]
+    return value
+
+class ToolResultCache:
+    """
+    Cache de resultados de tools em dois níveis: LRU local com TTL e Redis como L2.
+    """
+
+    def __init__(self, redis_cache=None, max_size: int = 256):
+        self.redis_cache = redis_cache
+        self.max_size = max_size
+        self._local: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(name: str, kwargs: Dict[str, Any]) -> str:
+        payload = json.dumps({'tool': name, 'args': normalize_tool_args(kwargs)},
+                             sort_keys=True, default=str)
+        return f"{name}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Retorna (encontrado, valor), consultando o LRU local e depois o Redis"""
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.time():
+                    self._local.move_to_end(key)
+                    return True, value
+                del self._local[key]
+
+        if self.redis_cache is not None:
+            try:
+                cached = self.redis_cache.get_tool_result(key)
+                if cached is not None:
+                    value, ttl = cached
+                    self._set_local(key, value, ttl)
+                    return True, value
+            except Exception as e:
+                logger.warning(f'[ToolResultCache] Erro ao ler cache no Redis: {e}')
+        return False, None
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        self._set_local(key, value, ttl)
+        if self.redis_cache is not None:
+            try:
+                self.redis_cache.set_tool_result(key, value, ttl)
+            except Exception as e:
+                logger.warning(f'[ToolResultCache] Erro ao gravar cache no Redis: {e}')
+
+    def _set_local(self, key: str, value: Any, ttl: int) -> None:
+        with self._lock:
+            self._local[key] = (value, time.time() + ttl)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
 class ToolMediator:
-    """Mediator que gerencia a execução das tools"""
-    
-    def __init__(self):
-        self._commands: Dict[str, Callable] = {}
+    """
+    Mediator que gerencia a execução das tools.
+
+    Cada tool é registrada com timeout e número máximo de execuções simultâneas. Tools
+    síncronas rodam no executor compartilhado e tools assíncronas (async def) rodam em um
+    event loop; uma tool lenta ou travada ocupa apenas as suas próprias vagas e quem chamou
+    recebe um erro de timeout em vez de ficar bloqueado. O resultado é sempre um dicionário:
+    {'ok': True, 'tool', 'result', 'duration'} ou {'ok': False, 'tool', 'error', 'message', 'duration'},
+    onde error é 'not_found', 'busy', 'timeout', 'cancelled' ou 'exception'.
+
+    Tools registradas com cache_ttl (ou decoradas com @cached_tool) têm o resultado
+    memorizado por argumentos normalizados; tools com efeitos colaterais não devem usar cache.
+    """
     
-    def register(self, name: str, command: Callable):
-        """Registra uma nova tool"""
-        self._commands[name] = command
+    def __init__(self, executor: Optional[ThreadPoolExecutor] = None, cache=None, metrics=None,
+                 telemetry: Optional[ToolTelemetry] = None):
+        """
+        Args:
+            executor (ThreadPoolExecutor): Executor das tools síncronas (padrão: compartilhado)
+            cache (RedisCache): L2 do cache de resultados (opcional)
+            metrics (MetricsCollector): Coletor para registrar acertos e falhas de cache
+            telemetry (ToolTelemetry): Agregador de latência, contagens e payload por tool
+        """
+        self._commands: Dict[str, Dict[str, Any]] = {}
+        self._executor = executor
+        self.result_cache = ToolResultCache(cache)
+        self.metrics = metrics
+        self.telemetry = telemetry
+        self._cache_stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
     
-    def execute(self, name: str, **kwargs) -> Optional[Dict[str, Any]]:
-        command = self._commands.get(name)
-        if not command:
-            logger.error(f'Tool não encontrada: {name}')
-            return None
-            
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        return self._executor or get_tool_executor()
+
+    def register(self, name: str, command: Callable, timeout: float = DEFAULT_TOOL_TIMEOUT,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, cache_ttl: Optional[int] = None):
+        """
+        Registra uma nova tool.
+
+        Args:
+            name (str): Nome usado pelo LLM para chamar a tool
+            command (Callable): Função síncrona ou assíncrona
+            timeout (float): Tempo máximo de execução em segundos
+            max_concurrency (int): Número máximo de execuções simultâneas
+            cache_ttl (int): Segundos de cache do resultado (padrão: o de @cached_tool, senão sem cache)
+        """
+        self._commands[name] = {
+            'command': command,
+            'is_async': asyncio.iscoroutinefunction(inspect.unwrap(command)),
+            'timeout': timeout,
+            'slots': threading.BoundedSemaphore(max_concurrency),
+            'cache_ttl': cache_ttl if cache_ttl is not None else getattr(command, '_tool_cache_ttl', None),
+            'should_cache': getattr(command, '_tool_should_cache', None),
+        }
+
+    def _cache_lookup(self, name: str, spec: Dict[str, Any], kwargs: Dict[str, Any],
+                      start_time: float) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """Retorna (chave, resultado em cache); a chave é None se a tool não usa cache"""
+        if not spec['cache_ttl']:
+            return None, None
+        key = self.result_cache.make_key(name, kwargs)
+        hit, value = self.result_cache.get(key)
+        self._record_cache(name, hit, time.time() - start_time)
+        if hit:
+            result = self._result(name, start_time, result=value)
+            result['cached'] = True
+            return key, result
+        return key, None
+
+    def _cache_store(self, key: Optional[str], spec: Dict[str, Any], result: Dict[str, Any]) -> None:
+        if key is None or not result['ok']:
+            return
+        if spec['should_cache'] and not spec['should_cache'](result['result']):
+            return
+        self.result_cache.set(key, result['result'], spec['cache_ttl'])
+
+    def _record_cache(self, name: str, hit: bool, latency: float) -> None:
+        with self._stats_lock:
+            stats = self._cache_stats.setdefault(name, {'hits': 0, 'misses': 0})
+            stats['hits' if hit else 'misses'] += 1
+        if self.metrics:
+            try:
+                self.metrics.record_memory_metric(f'tool_cache:{name}', True, latency, hit)
+            except Exception as e:
+                logger.error(f'Erro ao registrar métrica de cache da tool {name}: {e}')
+
+    def get_cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Retorna acertos e falhas de cache por tool"""
+        with self._stats_lock:
+            return {name: dict(stats) for name, stats in self._cache_stats.items()}
+
+    def _result(self, name: str, start_time: float, result: Any = None,
+                error: Optional[str] = None, message: Optional[str] = None) -> Dict[str, Any]:
+        duration = time.time() - start_time
+        if error:
+            logger.error(f'[ToolMediator] {name} falhou ({error}) em {duration:.2f}s: {message}')
+            return {'ok': False, 'tool': name, 'error': error, 'message': message, 'duration': duration}
+        logger.info(f'[ToolMediator] {name} executada em {duration:.2f}s')
+        return {'ok': True, 'tool': name, 'result': result, 'duration': duration}
+
+    def _submit(self, spec: Dict[str, Any], kwargs: Dict[str, Any]) -> Future:
+        """Agenda a tool no executor, propagando o contexto (usuário da cota, uso de tokens)"""
+        context = contextvars.copy_context()
+        if spec['is_async']:
+            # Tools assíncronas chamadas de código síncrono rodam em um loop próprio no executor
+            coroutine = asyncio.wait_for(spec['command'](**kwargs), spec['timeout'])
+            future = self.executor.submit(context.run, asyncio.run, coroutine)
+        else:
+            future = self.executor.submit(context.run, spec['command'], **kwargs)
+        # A vaga só é liberada quando a execução termina de fato, mesmo após um timeout
+        future.add_done_callback(lambda _: spec['slots'].release())
+        return future
+
+    def _observe(self, name: str, kwargs: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        if self.telemetry is not None:
+            try:
+                self.telemetry.record(name, kwargs, result)
+            except Exception as e:
+                logger.error(f'Erro ao registrar telemetria da tool {name}: {e}')
+        return result
+
+    def execute(self, name: str, **kwargs) -> Dict[str, Any]:
+        """Executa uma tool de forma síncrona, respeitando timeout e limite de concorrência"""
+        return self._observe(name, kwargs, self._execute(name, kwargs))
+
+    def _execute(self, name: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        start_time = time.time()
+        spec = self._commands.get(name)
+        if not spec:
+            return self._result(name, start_time, error='not_found', message=f'Tool não encontrada: {name}')
+
+        cache_key, cached = self._cache_lookup(name, spec, kwargs, start_time)
+        if cached:
+            return cached
+
+        logger.info(f'[ToolMediator] Iniciando execução de {name}')
+        if not spec['slots'].acquire(timeout=min(SLOT_WAIT_TIMEOUT, spec['timeout'])):
+            return self._result(name, start_time, error='busy',
+                                message='Limite de execuções simultâneas atingido')
+
+        # A espera pela vaga conta no timeout: sem tempo restante, a tool nem é agendada
+        remaining = spec['timeout'] - (time.time() - start_time)
+        if remaining <= 0:
+            spec['slots'].release()
+            return self._result(name, start_time, error='busy',
+                                message='Limite de execuções simultâneas atingido')
+
+        try:
+            future = self._submit(spec, kwargs)
+        except Exception as e:
+            spec['slots'].release()
+            return self._result(name, start_time, error='exception', message=str(e))
+
         try:
-            start_time = time.time()
-            logger.info(f'[ToolMediator] Iniciando execução de {name}')
-            logger.debug(f'[ToolMediator] Argumentos: {kwargs}')
-            
-            result = command(**kwargs)
-            
-            duration = time.time() - start_time
-            logger.info(f'[ToolMediator] {name} executada em {duration:.2f}s')
-            logger.debug(f'[ToolMediator] Resultado: {result}')
-            
+            result = self._result(name, start_time, result=future.result(timeout=remaining))
+            self._cache_store(cache_key, spec, result)
             return result
+        except FutureTimeoutError:
+            future.cancel()
+            return self._result(name, start_time, error='timeout',
+                                message=f'Tempo limite de {spec["timeout"]:.0f}s excedido')
+        except CancelledError:
+            return self._result(name, start_time, error='cancelled', message='Execução cancelada')
         except Exception as e:
             logger.error(f'Erro ao executar tool {name}: {str(e)}', exc_info=True)
-            return None
+            return self._result(name, start_time, error='exception', message=str(e))
 
-# Decorator para logar execução das tools
+# Decorator para logar execução das tools (apenas tamanhos; métricas ficam no ToolTelemetry)
 def log_execution(func: Callable) -> Callable:
     @wraps(func)
     def wrapper(*args, **kwargs):
-        logger.info(f'[{func.__name__}] Executando com args={kwargs}')
+        logger.info(f'[{func.__name__}] Executando com {payload_size(kwargs)} bytes de argumentos')
         result = func(*args, **kwargs)
-        logger.info(f'[{func.__name__}] Resultado: {result}')
+        logger.info(f'[{func.__name__}] Resultado com {payload_size(result)} bytes')
         return result
     return wrapper
 
+def cached_tool(ttl: int, should_cache: Optional[Callable[[Any], bool]] = None) -> Callable:
+    """
+    Marca uma tool como cacheável no ToolMediator (opt-in por tool).
+
+    Args:
+        ttl: Segundos que o resultado permanece em cache
+        should_cache: Predicado opcional; resultados para os quais retorna False não são guardados
+    """
+    def decorator(func: Callable) -> Callable:
+        func._tool_cache_ttl = ttl
+        func._tool_should_cache = should_cache
+        return func
+    return decorator
+
 # Commands (tools)
 @log_execution
 def add_numbers(a: int, b: int) -> int:
@@ -89,6 +336,7 @@ def store_memory(text: str, user_id: str) -> str:
         logger.error(f"Erro ao armazenar memória: {e}", exc_info=True)
         return f"Erro ao armazenar memória: {str(e)}"
 
+@cached_tool(ttl=60 * 10, should_cache=lambda summary: 'Fontes da pesquisa:' in summary)
 @log_execution
 def search_and_summarize(query: str) -> str:
     """Performs a web search and summarizes the results.
@@ -114,4 +362,19 @@ available_tools = [
     (add_numbers.__name__, add_numbers),
     (store_memory.__name__, store_memory),
     (search_and_summarize.__name__, search_and_summarize),
-]
\ No newline at end of file
+]
+
+# Configuração de execução por tool (argumentos de ToolMediator.register).
+# store_memory tem efeito colateral e nunca deve receber cache_ttl.
+tool_settings = {
+    add_numbers.__name__: {'timeout': 5, 'max_concurrency': 8},
+    store_memory.__name__: {'timeout': 30, 'max_concurrency': 4},
+    search_and_summarize.__name__: {'timeout': 120, 'max_concurrency': 2},
+}
+
+def create_tool_mediator(cache=None, metrics=None) -> ToolMediator:
+    """Cria um ToolMediator com todas as tools disponíveis registradas"""
+    mediator = ToolMediator(cache=cache, metrics=metrics, telemetry=ToolTelemetry(metrics))
+    for name, func in available_tools:
+        mediator.register(name, func, **tool_settings.get(name, {}))
+    return mediator
@@ -6,8 +6,10 @@ import logging
 import os
 from dotenv import load_dotenv
 from .redis_cache import RedisCache
-from .supabase_rag import SupabaseRAG
+from .supabase_rag import create_rag
+from .request_context import RequestContext
 from .metrics_collector import MetricsCollector
+from .llm.providers.rate_limiter import estimate_tokens
 import subprocess
 import zlib
 import time
@@ -30,7 +32,7 @@ class LLMHandler:
         self.base_url = "https://generativelanguage.googleapis.com/v1beta/models"
         self.model = "gemini-1.5-flash"
         self.redis_cache = RedisCache()  # Novo cache Redis
-        self.rag = SupabaseRAG(self.redis_cache)  # Passa o cache para o RAG
+        self.rag = create_rag(self.redis_cache)  # Passa o cache para o RAG
         self.metrics = MetricsCollector()
         self.last_cleanup = datetime.now()
         self.max_history = 80
@@ -112,11 +114,11 @@ class LLMHandler:
             logger.error(f"Erro ao armazenar memória: {e}")
         return False
 
-    def update_working_memory(self, query: str, user_info: dict):
+    def update_working_memory(self, query: str, user_info: dict, request: RequestContext = None):
         """Atualiza a memória de trabalho com base no contexto atual"""
         try:
-            # Busca memórias similares
-            memories = self.rag.search_similar(query, limit=self.max_working_memory)
+            # Busca memórias similares (com request, reaproveita a busca feita para o contexto)
+            memories = self.rag.search_similar(query, limit=self.max_working_memory, request=request) or []
             
 
             # Filtra apenas memórias do usuário atual
@@ -267,6 +269,9 @@ class LLMHandler:
         working_memories = []
         chat_history = None
         response_text = None
+        # Um embedding e uma busca por similaridade para toda a mensagem
+        request = RequestContext(text, user_id=(user_info or {}).get('id'),
+                                 search_limit=self.max_working_memory)
         
         try:
             # Verifica cache
@@ -289,7 +294,7 @@ class LLMHandler:
                     working_memories = self.redis_cache.get_memories(user_info.get('id')) or []
                     
                     # Busca memórias relevantes
-                    context = self.rag.get_context(text)
+                    context = self.rag.get_context(text, request=request)
                 
                 # Constrói o prompt com o contexto do sistema
                 system_instruction = self.build_system_instruction(user_info)
@@ -308,7 +313,11 @@ class LLMHandler:
                 result = response.json()
                 response_text = result['candidates'][0]['content']['parts'][0]['text']
 
-                tokens_used = len(text.split()) + len(response_text.split())  # Estimativa simples
+                # Uso real informado pela API; estimativa por caracteres apenas se ausente
+                usage = result.get('usageMetadata', {})
+                tokens_used = usage.get('totalTokenCount') or estimate_tokens(
+                    system_instruction['parts']['text'], text, response_text
+                )
                 
                 # Armazena no cache
                 self.redis_cache.set_llm_response(cache_key, response_text)
@@ -426,7 +435,8 @@ Pergunta original:
                     return "Entendi! Vou me lembrar disso."
 
             # Atualiza memória de trabalho com base no contexto
-            self.update_working_memory(text, user_info)
+            self.update_working_memory(text, user_info, request)
+            logger.debug(f"Recuperação da mensagem: {request.get_stats()}")
             
             # Armazena resposta do assistente
             self.store_chat_message('assistant', response_text, user_info)
@@ -496,12 +506,13 @@ Pergunta original:
             logger.error(f"Erro ao fazer scraping da URL {url}: {e}")
             return None
 
-    def _search_web(self, query: str, num_results: int = 10) -> List[Dict[str, str]]:
+    def _search_web(self, query: str, num_results: int = 10,
+                    request: RequestContext = None) -> List[Dict[str, str]]:
         """Realiza busca na web e retorna resultados"""
         try:
             results = []
             # Primeiro busca resultados similares no RAG
-            cached_results = self.rag.get_search_results(query)
+            cached_results = self.rag.get_search_results(query, request=request)
             if cached_results:
                 results.extend([{
                     'url': r['metadata']['url'],
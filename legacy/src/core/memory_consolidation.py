@@ -0,0 +1,200 @@
+"""
+Consolidação periódica das memórias de cada usuário.
+
+Memórias quase idênticas (similaridade de cosseno acima de threshold) são agrupadas e
+substituídas pela mais recente; as removidas ficam arquivadas em memory_provenance e
+seus ids são registrados em metadata.consolidated_ids da memória mantida. A execução é
+incremental: só usuários com memórias novas desde a última execução são processados,
+e só as memórias novas são comparadas com as demais (as antigas já são distintas entre si).
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .memory_index import MemoryIndex, parse_embedding
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_KEY = 'horus:memory_consolidation:max_id'
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class MemoryConsolidator:
+    """Agrupa e remove memórias duplicadas em background"""
+
+    def __init__(self, rag, cache, memory_index: Optional[MemoryIndex] = None,
+                 threshold: float = 0.92, interval: float = 3600.0, latency_samples: int = 5):
+        """
+        Args:
+            rag (SupabaseRAG): Acesso às memórias persistidas
+            cache (RedisCache): Guarda o progresso por usuário e as listas de memórias em cache
+            memory_index (MemoryIndex): Índice local a ser mantido coerente (None = não usado)
+            threshold (float): Similaridade mínima para considerar duas memórias duplicadas
+            interval (float): Segundos entre execuções em background
+            latency_samples (int): Buscas usadas para medir a latência antes e depois
+        """
+        self.rag = rag
+        self.cache = cache
+        self.memory_index = memory_index
+        self.threshold = threshold
+        self.interval = interval
+        self.latency_samples = latency_samples
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls, rag, cache, memory_index: Optional[MemoryIndex] = None) -> 'MemoryConsolidator':
+        """Cria o job com MEMORY_CONSOLIDATION_THRESHOLD e MEMORY_CONSOLIDATION_INTERVAL (0 = desativado)"""
+        return cls(
+            rag,
+            cache,
+            memory_index,
+            threshold=float(os.getenv('MEMORY_CONSOLIDATION_THRESHOLD', 0.92)),
+            interval=float(os.getenv('MEMORY_CONSOLIDATION_INTERVAL', 3600))
+        )
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name='memory-consolidation', daemon=True)
+        self._thread.start()
+        logger.info(f"Consolidação de memórias iniciada (a cada {self.interval:.0f}s)")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Erro na consolidação de memórias: {e}")
+
+    def run_once(self) -> Dict[str, Any]:
+        """
+        Consolida as memórias de todos os usuários com memórias novas.
+
+        Returns:
+            Dict[str, Any]: Relatório com users, clusters, removed, latency_before, latency_after e elapsed
+        """
+        start_time = time.time()
+        report = {'users': 0, 'clusters': 0, 'removed': 0,
+                  'latency_before': 0.0, 'latency_after': 0.0, 'errors': []}
+
+        stats = self.rag.get_memory_user_stats()
+        watermarks = self.cache.redis.hgetall(WATERMARK_KEY)
+        for row in stats:
+            user_id = row['user_id']
+            if user_id is None or row['max_id'] <= int(watermarks.get(user_id, 0)):
+                continue
+            try:
+                result = self.consolidate_user(user_id, int(watermarks.get(user_id, 0)))
+            except Exception as e:
+                logger.error(f"Erro ao consolidar memórias do usuário {user_id}: {e}")
+                report['errors'].append(f"{user_id}: {e}")
+                continue
+            self.cache.redis.hset(WATERMARK_KEY, user_id, result['max_id'])
+            report['users'] += 1
+            report['clusters'] += result['clusters']
+            report['removed'] += result['removed']
+            report['latency_before'] += result['latency_before']
+            report['latency_after'] += result['latency_after']
+
+        if report['users']:
+            report['latency_before'] /= report['users']
+            report['latency_after'] /= report['users']
+        report['elapsed'] = time.time() - start_time
+        logger.info(f"Consolidação de memórias: {report['users']} usuários, {report['clusters']} grupos, "
+                    f"{report['removed']} memórias removidas, busca {report['latency_before'] * 1000:.1f}ms -> "
+                    f"{report['latency_after'] * 1000:.1f}ms, em {report['elapsed']:.2f}s")
+        return report
+
+    def find_clusters(self, documents: List[Dict[str, Any]], after_id: int) -> List[List[Dict[str, Any]]]:
+        """
+        Agrupa memórias duplicadas envolvendo ao menos uma memória com id maior que after_id.
+
+        As memórias novas são percorridas da mais recente para a mais antiga: cada uma entra no
+        grupo da líder mais similar (acima do limite) ou se torna líder. Cada líder então absorve as memórias
+        antigas similares a ela. O primeiro elemento de cada grupo é a memória a ser mantida.
+        """
+        documents = [doc for doc in documents if doc.get('embedding') is not None]
+        new = sorted((doc for doc in documents if doc['id'] > after_id), key=lambda d: d['id'], reverse=True)
+        old = [doc for doc in documents if doc['id'] <= after_id]
+        if not new:
+            return []
+
+        new_vectors = _normalize(np.asarray([parse_embedding(d['embedding']) for d in new], dtype=np.float32))
+        leaders: List[int] = []
+        clusters: Dict[int, List[Dict[str, Any]]] = {}
+        for i, doc in enumerate(new):
+            if leaders:
+                scores = new_vectors[leaders] @ new_vectors[i]
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    clusters[leaders[best]].append(doc)
+                    continue
+            leaders.append(i)
+            clusters[i] = [doc]
+
+        if old:
+            old_vectors = _normalize(np.asarray([parse_embedding(d['embedding']) for d in old], dtype=np.float32))
+            scores = new_vectors[leaders] @ old_vectors.T
+            # Cada memória antiga vai para a líder mais similar, se acima do limite
+            best = np.argmax(scores, axis=0)
+            for j, doc in enumerate(old):
+                if scores[best[j], j] >= self.threshold:
+                    clusters[leaders[best[j]]].append(doc)
+
+        return [members for members in clusters.values() if len(members) > 1]
+
+    def consolidate_user(self, user_id: str, after_id: int = 0) -> Dict[str, Any]:
+        """Consolida as memórias de um usuário, medindo a busca vetorial antes e depois"""
+        documents = self.rag.get_user_documents(user_id, doc_type='memory')
+        max_id = max((doc['id'] for doc in documents), default=after_id)
+        samples = [parse_embedding(doc['embedding']) for doc in documents[-self.latency_samples:]
+                   if doc.get('embedding') is not None]
+        latency_before = self._measure_search(user_id, samples)
+
+        clusters = self.find_clusters(documents, after_id)
+        removed_ids: List[int] = []
+        removed_texts: List[str] = []
+        for keep, *duplicates in clusters:
+            ids = [doc['id'] for doc in duplicates]
+            removed = self.rag.consolidate_memories(keep['id'], ids)
+            logger.debug(f"Memória {keep['id']} de {user_id} substitui {ids}: {keep['content'][:80]}")
+            removed_ids.extend(ids)
+            removed_texts.extend(MemoryIndex.format_memory(doc) for doc in duplicates)
+            if not removed:
+                logger.warning(f"consolidate_memories não removeu nenhuma memória de {ids}")
+
+        if removed_ids:
+            if self.memory_index is not None:
+                self.memory_index.remove(user_id, removed_ids)
+            self.cache.apply_memory_diff(user_id, [], removed_texts)
+
+        latency_after = self._measure_search(user_id, samples) if removed_ids else latency_before
+        return {
+            'max_id': max_id,
+            'clusters': len(clusters),
+            'removed': len(removed_ids),
+            'latency_before': latency_before,
+            'latency_after': latency_after,
+        }
+
+    def _measure_search(self, user_id: str, samples: List[List[float]]) -> float:
+        """Latência média da busca vetorial de memórias do usuário"""
+        if not samples:
+            return 0.0
+        start_time = time.time()
+        for embedding in samples:
+            self.rag.search_filtered('', limit=30, doc_type='memory', user_id=user_id,
+                                     query_embedding=embedding)
+        return (time.time() - start_time) / len(samples)
@@ -0,0 +1,258 @@
+"""
+Índice vetorial em processo para as memórias de cada usuário.
+
+Cada usuário tem uma matriz float32 normalizada (busca por força bruta, um produto
+matricial) ou, acima de hnsw_threshold memórias e com hnswlib instalado, um índice HNSW.
+O índice é carregado sob demanda do Supabase, atualizado a cada store_memory e pode ser
+salvo em disco (np.save) e reaberto com mmap para reinícios rápidos.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+def parse_embedding(value) -> Optional[List[float]]:
+    """Converte o embedding retornado pelo PostgREST (texto '[...]' ou lista)"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return json.loads(value)
+    return list(value)
+
+class UserVectorIndex:
+    """Vetores de memória de um usuário"""
+
+    def __init__(self, dim: int, hnsw_threshold: int = 2000):
+        self.dim = dim
+        self.hnsw_threshold = hnsw_threshold
+        self.ids: List[int] = []
+        self.texts: List[str] = []
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.max_id = 0
+        self._hnsw = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, entries: List[Tuple[int, str, List[float]]]) -> None:
+        """Adiciona (id, texto, embedding), ignorando ids já presentes"""
+        with self._lock:
+            known = set(self.ids)
+            entries = [entry for entry in entries if entry[0] not in known and entry[2] is not None]
+            if not entries:
+                return
+            vectors = _normalize(np.asarray([entry[2] for entry in entries], dtype=np.float32))
+            # vstack também materializa em memória uma matriz aberta com mmap
+            self.matrix = np.vstack([self.matrix, vectors])
+            self.ids.extend(entry[0] for entry in entries)
+            self.texts.extend(entry[1] for entry in entries)
+            self.max_id = max(self.max_id, max(entry[0] for entry in entries))
+            self._update_hnsw(vectors, len(self.ids) - len(entries))
+
+    def remove(self, ids: List[int]) -> None:
+        """Remove entradas (ex: memórias consolidadas)"""
+        with self._lock:
+            removed = set(ids)
+            keep = [i for i, doc_id in enumerate(self.ids) if doc_id not in removed]
+            if len(keep) == len(self.ids):
+                return
+            self.matrix = np.ascontiguousarray(self.matrix[keep])
+            self.ids = [self.ids[i] for i in keep]
+            self.texts = [self.texts[i] for i in keep]
+            self._hnsw = None
+            self._update_hnsw(self.matrix, 0)
+
+    def _update_hnsw(self, vectors: np.ndarray, first_label: int) -> None:
+        """Mantém o índice HNSW quando o usuário passa do limite de tamanho"""
+        if len(self.ids) < self.hnsw_threshold:
+            self._hnsw = None
+            return
+        try:
+            import hnswlib
+        except ImportError:
+            return
+        if self._hnsw is None:
+            self._hnsw = hnswlib.Index(space='ip', dim=self.dim)
+            self._hnsw.init_index(max_elements=max(len(self.ids) * 2, 1024), ef_construction=200, M=16)
+            self._hnsw.set_ef(64)
+            vectors, first_label = self.matrix, 0
+        elif self._hnsw.get_max_elements() < len(self.ids):
+            self._hnsw.resize_index(len(self.ids) * 2)
+        self._hnsw.add_items(vectors, np.arange(first_label, first_label + len(vectors)))
+
+    def search(self, query: List[float], k: int, threshold: float = 0.0) -> List[Tuple[str, float]]:
+        """
+        Busca as k memórias mais similares.
+
+        Returns:
+            List[Tuple[str, float]]: (texto, similaridade) em ordem decrescente
+        """
+        with self._lock:
+            if not self.ids:
+                return []
+            q = _normalize(np.asarray(query, dtype=np.float32))
+            k = min(k, len(self.ids))
+            if self._hnsw is not None:
+                labels, distances = self._hnsw.knn_query(q, k=k)
+                pairs = [(int(label), 1.0 - float(distance)) for label, distance in zip(labels[0], distances[0])]
+            else:
+                scores = self.matrix @ q
+                top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+                pairs = sorted(((int(i), float(scores[i])) for i in top), key=lambda p: p[1], reverse=True)
+            return [(self.texts[i], score) for i, score in pairs if score > threshold]
+
+class MemoryIndex:
+    """Índices por usuário, carregados sob demanda e mantidos coerentes com o Supabase"""
+
+    def __init__(self, rag, dim: int = 384, snapshot_dir: Optional[str] = None,
+                 hnsw_threshold: int = 2000):
+        """
+        Args:
+            rag (SupabaseRAG): Fonte das memórias persistidas
+            dim (int): Dimensão dos embeddings
+            snapshot_dir (str): Diretório para snapshots em disco (None = desativado)
+            hnsw_threshold (int): Número de memórias a partir do qual usar HNSW (se hnswlib estiver instalado)
+        """
+        self.rag = rag
+        self.dim = dim
+        self.snapshot_dir = snapshot_dir
+        self.hnsw_threshold = hnsw_threshold
+        self._indexes: Dict[str, UserVectorIndex] = {}
+        # Lock de carga por usuário: o _lock global protege só o acesso aos dicts,
+        # a busca no Supabase e a gravação do snapshot acontecem fora dele
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, rag) -> 'MemoryIndex':
+        """Cria o índice com MEMORY_INDEX_DIR e MEMORY_INDEX_HNSW_THRESHOLD"""
+        return cls(
+            rag,
+            snapshot_dir=os.getenv('MEMORY_INDEX_DIR') or None,
+            hnsw_threshold=int(os.getenv('MEMORY_INDEX_HNSW_THRESHOLD', 2000))
+        )
+
+    @staticmethod
+    def format_memory(document: Dict[str, Any]) -> str:
+        """Formato usado na memória de trabalho"""
+        return f"{document['content']} (Registrado em: {document['metadata']['timestamp']})"
+
+    def _snapshot_paths(self, user_id: str) -> Tuple[str, str]:
+        name = hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:32]
+        base = os.path.join(self.snapshot_dir, name)
+        return f"{base}.npy", f"{base}.json"
+
+    def _load_snapshot(self, user_id: str, index: UserVectorIndex) -> None:
+        matrix_path, meta_path = self._snapshot_paths(user_id)
+        if not (os.path.exists(matrix_path) and os.path.exists(meta_path)):
+            return
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            matrix = np.load(matrix_path, mmap_mode='r')
+            if matrix.shape != (len(meta['ids']), self.dim):
+                logger.warning(f"Snapshot do índice de memórias inconsistente para {user_id}, ignorando")
+                return
+            index.matrix, index.ids, index.texts = matrix, meta['ids'], meta['texts']
+            index.max_id = meta['max_id']
+            index._update_hnsw(index.matrix, 0)
+        except Exception as e:
+            logger.warning(f"Erro ao ler snapshot do índice de memórias de {user_id}: {e}")
+
+    def _loaded(self, user_id: Any) -> Optional[UserVectorIndex]:
+        """Índice do usuário se já estiver carregado (sem carregar)"""
+        with self._lock:
+            return self._indexes.get(str(user_id))
+
+    def save_snapshot(self, user_id: Any) -> None:
+        """Grava o índice do usuário em disco"""
+        index = self._loaded(user_id)
+        if index is not None:
+            self._write_snapshot(str(user_id), index)
+
+    def _write_snapshot(self, user_id: str, index: UserVectorIndex) -> None:
+        if not self.snapshot_dir:
+            return
+        matrix_path, meta_path = self._snapshot_paths(user_id)
+        with index._lock:
+            np.save(matrix_path + '.tmp.npy', np.ascontiguousarray(index.matrix))
+            with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'ids': index.ids, 'texts': index.texts, 'max_id': index.max_id}, f)
+        os.replace(matrix_path + '.tmp.npy', matrix_path)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def _load(self, user_id: str) -> UserVectorIndex:
+        index = UserVectorIndex(self.dim, self.hnsw_threshold)
+        if self.snapshot_dir:
+            self._load_snapshot(user_id, index)
+        # Completa com o que foi gravado depois do snapshot (ou tudo, se não houver)
+        documents = self.rag.get_user_documents(user_id, doc_type='memory', after_id=index.max_id)
+        index.add([(doc['id'], self.format_memory(doc), parse_embedding(doc.get('embedding')))
+                   for doc in documents])
+        logger.info(f"Índice de memórias do usuário {user_id} carregado com {len(index)} vetores")
+        if documents:
+            self._write_snapshot(user_id, index)
+        return index
+
+    def get(self, user_id: Any) -> UserVectorIndex:
+        """Índice do usuário, carregado na primeira chamada"""
+        user_id = str(user_id)
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                return index
+            loading = self._loading.setdefault(user_id, threading.Lock())
+        # Só quem carrega o mesmo usuário espera; os demais seguem com o _lock livre
+        with loading:
+            index = self._loaded(user_id)
+            if index is not None:
+                return index
+            try:
+                index = self._load(user_id)
+                with self._lock:
+                    self._indexes[user_id] = index
+            finally:
+                with self._lock:
+                    self._loading.pop(user_id, None)
+            return index
+
+    def add(self, user_id: Any, doc_id: int, document: Dict[str, Any], embedding: List[float]) -> None:
+        """Inclui uma memória recém-gravada (não carrega o índice se ainda não estiver em uso)"""
+        index = self._loaded(user_id)
+        if index is not None:
+            index.add([(doc_id, self.format_memory(document), embedding)])
+
+    def remove(self, user_id: Any, doc_ids: List[int]) -> None:
+        index = self._loaded(user_id)
+        if index is not None:
+            index.remove(doc_ids)
+            self._write_snapshot(str(user_id), index)
+
+    def search(self, user_id: Any, query_embedding: List[float], k: int,
+               threshold: float = 0.5) -> List[Tuple[str, float]]:
+        return self.get(user_id).search(query_embedding, k, threshold)
+
+    def save_all(self) -> None:
+        """Grava os snapshots de todos os usuários carregados"""
+        with self._lock:
+            user_ids = list(self._indexes)
+        for user_id in user_ids:
+            try:
+                self.save_snapshot(user_id)
+            except Exception as e:
+                logger.error(f"Erro ao salvar snapshot do índice de memórias de {user_id}: {e}")
@@ -21,6 +21,8 @@ class MetricsCollector:
         self.db_path = db_path
         self._setup_database()
         self.lock = threading.Lock()
+        self._rag = None
+        self._rag_lock = threading.Lock()
         
     def _setup_database(self):
         """Initialize SQLite database with required tables."""
@@ -81,6 +83,32 @@ class MetricsCollector:
             chat_history TEXT
         )''')
         
+        # LLM quota scheduler wait times
+        c.execute('''CREATE TABLE IF NOT EXISTS quota_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            user_id TEXT,
+            wait_time FLOAT,
+            granted BOOLEAN
+        )''')
+        
+        # Per-tool telemetry, one row per tool per flush window
+        c.execute('''CREATE TABLE IF NOT EXISTS tool_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            tool_name TEXT,
+            calls INTEGER,
+            successes INTEGER,
+            failures INTEGER,
+            cache_hits INTEGER,
+            total_latency FLOAT,
+            max_latency FLOAT,
+            latency_histogram TEXT,
+            request_bytes INTEGER,
+            response_bytes INTEGER,
+            errors TEXT
+        )''')
+        
         conn.commit()
         conn.close()
     
@@ -121,6 +149,81 @@ class MetricsCollector:
                         VALUES (?, ?)''',
                      (status, reason))
     
+    def record_quota_wait(self, user_id: str, wait_time: float, granted: bool):
+        """Record how long a user waited for LLM quota."""
+        with sqlite3.connect(self.db_path) as conn:
+            c = conn.cursor()
+            c.execute('''INSERT INTO quota_metrics (user_id, wait_time, granted)
+                        VALUES (?, ?, ?)''',
+                     (user_id, wait_time, granted))
+    
+    def record_tool_metrics(self, window: Dict[str, Dict]):
+        """Record one aggregated telemetry window per tool."""
+        with sqlite3.connect(self.db_path) as conn:
+            c = conn.cursor()
+            c.executemany('''INSERT INTO tool_metrics
+                            (tool_name, calls, successes, failures, cache_hits,
+                             total_latency, max_latency, latency_histogram,
+                             request_bytes, response_bytes, errors)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                         [(name, stats['calls'], stats['successes'], stats['failures'],
+                           stats['cache_hits'], stats['total_latency'], stats['max_latency'],
+                           json.dumps(stats['latency_histogram']), stats['request_bytes'],
+                           stats['response_bytes'], json.dumps(stats['errors']))
+                          for name, stats in window.items()])
+
+    def get_tool_metrics(self, hours: int = 24) -> List[Dict]:
+        """Get per-tool telemetry aggregated over the last N hours."""
+        from core.llm.telemetry import bucket_labels, histogram_percentile
+
+        with sqlite3.connect(self.db_path) as conn:
+            c = conn.cursor()
+            c.execute('''SELECT tool_name, calls, successes, failures, cache_hits,
+                               total_latency, max_latency, latency_histogram,
+                               request_bytes, response_bytes, errors
+                        FROM tool_metrics
+                        WHERE timestamp >= datetime('now', ?)''',
+                     (f'-{int(hours)} hours',))
+            rows = c.fetchall()
+
+        tools = {}
+        for row in rows:
+            tool = tools.setdefault(row[0], {
+                'tool_name': row[0], 'calls': 0, 'successes': 0, 'failures': 0,
+                'cache_hits': 0, 'total_latency': 0.0, 'max_latency': 0.0,
+                'latency_histogram': None, 'request_bytes': 0, 'response_bytes': 0,
+                'errors': {}
+            })
+            for i, key in enumerate(['calls', 'successes', 'failures', 'cache_hits',
+                                     'total_latency'], start=1):
+                tool[key] += row[i] or 0
+            tool['max_latency'] = max(tool['max_latency'], row[6] or 0)
+            histogram = json.loads(row[7]) if row[7] else []
+            if tool['latency_histogram'] is None:
+                tool['latency_histogram'] = histogram
+            else:
+                tool['latency_histogram'] = [a + b for a, b in zip(tool['latency_histogram'], histogram)]
+            tool['request_bytes'] += row[8] or 0
+            tool['response_bytes'] += row[9] or 0
+            for error, count in (json.loads(row[10]) if row[10] else {}).items():
+                tool['errors'][error] = tool['errors'].get(error, 0) + count
+
+        result = []
+        for tool in tools.values():
+            calls = tool['calls']
+            histogram = tool['latency_histogram'] or []
+            result.append({
+                **tool,
+                'avg_latency': tool['total_latency'] / calls if calls else 0,
+                'p50_latency': histogram_percentile(histogram, 0.5),
+                'p95_latency': histogram_percentile(histogram, 0.95),
+                'success_rate': tool['successes'] / calls if calls else 0,
+                'avg_request_bytes': tool['request_bytes'] / calls if calls else 0,
+                'avg_response_bytes': tool['response_bytes'] / calls if calls else 0,
+                'latency_buckets': bucket_labels()
+            })
+        return sorted(result, key=lambda t: t['total_latency'], reverse=True)
+
     def record_interaction(self, user_id: str, request_text: str, response_text: str,
                          processing_time: float, model_used: str, tokens_used: int,
                          cache_hit: bool, used_memories: List[str] = None,
@@ -149,6 +252,23 @@ class MetricsCollector:
                          ORDER BY timestamp DESC''')
             return [dict(row) for row in c.fetchall()]
     
+    def get_token_usage(self, hours: int = 24) -> List[Dict]:
+        """Get tokens used per user and per hour over the last N hours."""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            c = conn.cursor()
+            c.execute('''SELECT
+                            user_id,
+                            strftime('%Y-%m-%d %H:00:00', timestamp) as hour,
+                            COUNT(*) as requests,
+                            SUM(tokens_used) as tokens_used
+                        FROM request_response_log
+                        WHERE timestamp >= datetime('now', ?)
+                        GROUP BY user_id, hour
+                        ORDER BY hour DESC, tokens_used DESC''',
+                     (f'-{int(hours)} hours',))
+            return [dict(row) for row in c.fetchall()]
+
     def get_current_bot_status(self) -> Dict:
         """Get the most recent bot status."""
         with sqlite3.connect(self.db_path) as conn:
@@ -312,13 +432,31 @@ class MetricsCollector:
         except Exception as e:
             logger.error(f"Error clearing context: {e}")
     
+    def get_rag(self):
+        """Return the shared RAG, creating it on first use.
+
+        The RAG owns the storage connection pool, the lexical tier and the
+        embedding router, so it is built once and reused across requests.
+        """
+        with self._rag_lock:
+            if self._rag is None:
+                from core.redis_cache import RedisCache
+                from core.supabase_rag import create_rag
+                self._rag = create_rag(RedisCache(), self)
+            return self._rag
+
+    def close_rag(self):
+        """Release the shared RAG's storage connections, if any."""
+        with self._rag_lock:
+            rag, self._rag = self._rag, None
+        pool = getattr(getattr(rag, 'store', None), 'pool', None)
+        if pool is not None:
+            pool.close()
+
     def get_chat_history(self, user_id: str) -> List[Dict]:
         """Get chat history for a user."""
         try:
-            from core.supabase_rag import SupabaseRAG
-            rag = SupabaseRAG(self)
-            print('mah oi')
-            return rag.get_user_messages(user_id)
+            return self.get_rag().get_user_messages(user_id)
         except Exception as e:
             logger.error(f"Error getting chat history: {e}")
             return []
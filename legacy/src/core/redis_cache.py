@@ -18,6 +18,12 @@ class RedisCache:
             password=os.getenv('REDIS_PASSWORD'),
             decode_responses=True
         )
+        # Mesma conexão sem decodificação, para valores binários (ex: vetores de embedding)
+        self.redis_binary = redis.Redis(
+            connection_pool=redis.ConnectionPool(
+                **{**self.redis.connection_pool.connection_kwargs, 'decode_responses': False}
+            )
+        )
         # TTLs específicos para cada tipo de cache (em segundos)
         self.ttl_config = {
             'embedding': 60 * 30,      # 30 minutos para embeddings
@@ -26,7 +32,10 @@ class RedisCache:
             'llm_response': 60 * 5,    # 5 minutos para respostas do LLM
             'memory': 60 * 15,         # 15 minutos para memórias
             'search_result': 60 * 60 * 24,  # 24 horas para resultados de busca
+            'tool_result': 60 * 10,    # 10 minutos para resultados de tools
         }
+        # Mensagens mantidas por usuário no histórico de chat em cache
+        self.chat_history_size = int(os.getenv('CHAT_HISTORY_CACHE_SIZE', 100))
 
     def _get_user_key(self, key_type: str, user_id: str) -> str:
         """Gera chave para o Redis no formato 'horus:{tipo}:{user_id}'"""
@@ -152,18 +161,6 @@ class RedisCache:
             logger.error(f"Error getting active context from Redis: {e}")
             return []
 
-    # Cache de Embeddings
-    def get_embedding(self, text: str) -> Optional[List[float]]:
-        """Recupera embedding do cache"""
-        key = f"horus:embedding:{hash(text)}"
-        data = self.redis.get(key)
-        return json.loads(data) if data else None
-
-    def set_embedding(self, text: str, embedding: List[float]):
-        """Armazena embedding no cache"""
-        key = f"horus:embedding:{hash(text)}"
-        self.redis.set(key, json.dumps(embedding), ex=self.ttl_config['embedding'])
-
     # Working Memory
     def get_working_memory(self, user_id: str) -> List[str]:
         """Recupera memória de trabalho do usuário"""
@@ -182,24 +179,62 @@ class RedisCache:
             pipe.expire(key, self.ttl_config['working_memory'])
         pipe.execute()
 
-    # Chat History
-    def get_chat_history(self, user_id: str, limit: int = 10) -> List[Dict]:
-        """Recupera histórico de chat do usuário"""
-        key = self._get_user_key("chat_history", user_id)
-        data = self.redis.lrange(key, 0, limit - 1)
-        return [json.loads(item) for item in data] if data else []
+    # Chat History (ring buffer por usuário: sorted set pontuado pelo timestamp da mensagem)
+    def _chat_history_keys(self, user_id: str) -> tuple:
+        key = self._get_user_key("chat_ring", user_id)
+        return key, f"{key}:loaded"
+
+    @staticmethod
+    def _chat_score(message: Dict) -> float:
+        try:
+            return datetime.fromisoformat(message['timestamp']).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return datetime.now().timestamp()
+
+    def _add_chat_messages(self, user_id: str, messages: List[Dict], loaded: bool):
+        """Insere mensagens no ring buffer de forma atômica (MULTI/EXEC), mantendo apenas as mais recentes"""
+        key, loaded_key = self._chat_history_keys(user_id)
+        ttl = self.ttl_config['chat_history']
+        pipe = self.redis.pipeline(transaction=True)
+        if messages:
+            # ZADD mescla em vez de sobrescrever: escritas concorrentes e reidratação não se perdem
+            pipe.zadd(key, {json.dumps(message, sort_keys=True): self._chat_score(message)
+                            for message in messages})
+            pipe.zremrangebyrank(key, 0, -(self.chat_history_size + 1))
+        pipe.expire(key, ttl)
+        if loaded:
+            pipe.set(loaded_key, 1, ex=ttl)
+        else:
+            pipe.expire(loaded_key, ttl)
+        pipe.execute()
+
+    def get_chat_history(self, user_id: str, limit: int = 10) -> Optional[List[Dict]]:
+        """
+        Recupera as últimas mensagens do usuário em ordem cronológica.
+
+        Returns:
+            Optional[List[Dict]]: Mensagens, ou None se o histórico ainda não foi carregado (miss)
+        """
+        key, loaded_key = self._chat_history_keys(user_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zrange(key, -limit, -1)
+        pipe.exists(loaded_key)
+        data, loaded = pipe.execute()
+        if not loaded:
+            return None
+        return [json.loads(item) for item in data]
 
     def add_chat_message(self, user_id: str, message: Dict):
-        """Adiciona mensagem ao histórico de chat"""
-        key = self._get_user_key("chat_history", user_id)
-        self.redis.lpush(key, json.dumps(message))
-        self.redis.ltrim(key, 0, 9)  # Mantém apenas as últimas 10 mensagens
-        self.redis.expire(key, self.ttl_config['chat_history'])
+        """Adiciona mensagem ao histórico de chat ({'role', 'content', 'timestamp'})"""
+        self._add_chat_messages(user_id, [message], loaded=False)
+
+    def load_chat_history(self, user_id: str, messages: List[Dict]):
+        """Reidrata o histórico a partir do armazenamento persistente e o marca como carregado"""
+        self._add_chat_messages(user_id, messages, loaded=True)
 
     def clear_chat_history(self, user_id: str):
         """Limpa o histórico de chat do usuário no Redis"""
-        key = self._get_user_key("chat_history", user_id)
-        self.redis.delete(key)
+        self.redis.delete(*self._chat_history_keys(user_id))
 
     # Memory Storage
     def get_memories(self, user_id: str) -> List[str]:
@@ -224,6 +259,22 @@ class RedisCache:
             pipe.expire(key, self.ttl_config['memory'])
         pipe.execute()
 
+    def apply_memory_diff(self, user_id: str, added: List[str], removed: List[str]):
+        """Aplica apenas as diferenças na lista de memórias, sem reescrevê-la"""
+        key = self._get_user_key("memory", user_id)
+        pipe = self.redis.pipeline()
+        for memory in removed:
+            pipe.lrem(key, 0, memory)
+        if added:
+            pipe.lpush(key, *added)
+        pipe.expire(key, self.ttl_config['memory'])
+        pipe.execute()
+
+    def touch_memories(self, user_id: str) -> bool:
+        """Renova o TTL da lista de memórias; retorna False se ela já expirou"""
+        key = self._get_user_key("memory", user_id)
+        return bool(self.redis.expire(key, self.ttl_config['memory']))
+
     # LLM Response Cache
     def get_llm_response(self, prompt: str) -> Optional[str]:
         """Recupera resposta do LLM do cache"""
@@ -247,3 +298,20 @@ class RedisCache:
         """Armazena resultado de busca no cache"""
         key = f"horus:search_result:{hash(url)}"
         self.redis.set(key, self._compress(content), ex=self.ttl_config['search_result'])
+
+    # Tool Result Cache
+    def get_tool_result(self, key: str) -> Optional[tuple]:
+        """Recupera resultado de tool do cache, retornando (valor, ttl restante)"""
+        redis_key = f"horus:tool_result:{key}"
+        pipe = self.redis.pipeline()
+        pipe.get(redis_key)
+        pipe.ttl(redis_key)
+        data, ttl = pipe.execute()
+        if data is None:
+            return None
+        return json.loads(data), max(ttl, 1)
+
+    def set_tool_result(self, key: str, value: Any, ttl: Optional[int] = None):
+        """Armazena resultado de tool no cache"""
+        key = f"horus:tool_result:{key}"
+        self.redis.set(key, json.dumps(value), ex=ttl or self.ttl_config['tool_result'])
@@ -0,0 +1,82 @@
+"""
+Contexto de uma mensagem em processamento.
+
+Criado no início do processamento (HorusAI.process_*, LLMHandler.process_text) e repassado
+aos provedores e ao RAG, memoiza o embedding da query e os resultados das buscas por
+similaridade: cada mensagem custa no máximo um embedding e uma busca por query, mesmo que
+memória de trabalho, contexto geral e resultados de pesquisa sejam consultados.
+
+Também fica disponível em current_request, para chamadas feitas por tools (executadas em
+threads com cópia do contexto).
+"""
+
+import threading
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+class RequestContext:
+    """Embeddings e resultados de busca memoizados durante uma mensagem"""
+
+    def __init__(self, query: Optional[str] = None, user_id: Any = None, search_limit: int = 0):
+        """
+        Args:
+            query (str): Texto da mensagem
+            user_id: Usuário da mensagem
+            search_limit (int): Documentos buscados na primeira busca sem filtros, para que
+                consumidores com limites diferentes compartilhem a mesma busca
+        """
+        self.query = query
+        self.user_id = user_id
+        self.search_limit = search_limit
+        self._embeddings: Dict[str, List[float]] = {}
+        self._results: Dict[Hashable, Tuple[int, Any]] = {}
+        # Reentrante: o cálculo de uma busca pede o embedding da query
+        self._lock = threading.RLock()
+        self.embeddings_computed = 0
+        self.searches = 0
+        self.hits = 0
+
+    def embedding(self, text: str, compute: Callable[[str], List[float]]) -> List[float]:
+        """Embedding do texto, calculado no máximo uma vez por mensagem"""
+        with self._lock:
+            embedding = self._embeddings.get(text)
+            if embedding is None:
+                embedding = compute(text)
+                self._embeddings[text] = embedding
+                self.embeddings_computed += 1
+            else:
+                self.hits += 1
+            return embedding
+
+    def retrieve(self, key: Hashable, limit: int, compute: Callable[[int], Any], fetch: int = None) -> Any:
+        """
+        Resultado de uma busca, calculado no máximo uma vez por chave.
+
+        Uma busca anterior com limite maior (ou que retornou menos documentos do que pediu)
+        atende limites menores com os primeiros resultados.
+
+        Args:
+            key: Identifica a busca (tipo, query e filtros)
+            limit (int): Documentos pedidos
+            compute: Executa a busca com o número de documentos dado
+            fetch (int): Documentos a buscar se a busca ainda não foi feita (padrão: limit)
+        """
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                count, results = cached
+                if count >= limit or len(results) < count:
+                    self.hits += 1
+                    return results[:limit]
+            count = max(limit, fetch or 0)
+            results = compute(count)
+            self._results[key] = (count, results)
+            self.searches += 1
+            return results[:limit]
+
+    def get_stats(self) -> Dict[str, int]:
+        """Embeddings calculados, buscas executadas e reaproveitamentos"""
+        return {'embeddings': self.embeddings_computed, 'searches': self.searches, 'hits': self.hits}
+
+# Contexto da mensagem em processamento (definido pelo HorusAI)
+current_request: ContextVar[Optional[RequestContext]] = ContextVar('current_request', default=None)
@@ -33,8 +33,8 @@ class SimpleRAG:
         
         self.doc_lengths[doc_id] = len(words)
     
-    def search(self, query, top_k=3):
-        """Busca documentos similares usando BM25-like scoring"""
+    def search_ids(self, query, top_k=3):
+        """Busca documentos usando BM25-like scoring, retornando (doc_id, score)"""
         query_words = self.preprocess_text(query)
         scores = defaultdict(float)
         
@@ -42,8 +42,10 @@ class SimpleRAG:
         k1 = 1.5
         b = 0.75
         avg_doc_length = sum(self.doc_lengths.values()) / len(self.doc_lengths) if self.doc_lengths else 0
+        if not avg_doc_length:
+            return []
         
-        for word in query_words:
+        for word in set(query_words):
             if word in self.index:
                 idf = log((1 + len(self.documents)) / (1 + len(self.index[word])))
                 
@@ -54,5 +56,9 @@ class SimpleRAG:
                     scores[doc_id] += idf * numerator / denominator
         
         # Retorna os top_k documentos
-        sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
-        return [(self.documents[doc_id][1], score) for doc_id, score in sorted_scores]
\ No newline at end of file
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+    
+    def search(self, query, top_k=3):
+        """Busca documentos similares usando BM25-like scoring"""
+        texts = dict(self.documents)
+        return [(texts[doc_id], score) for doc_id, score in self.search_ids(query, top_k)]
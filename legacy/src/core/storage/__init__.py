@@ -0,0 +1,25 @@
+import os
+
+from .base import DocumentStore
+
+def create_document_store() -> DocumentStore:
+    """
+    Cria o armazenamento configurado em RAG_BACKEND: 'supabase' (padrão, via PostgREST),
+    'postgres' (conexão direta com pool) ou 'embedded' (SQLite + vetores locais, sem rede).
+    """
+    backend = os.getenv('RAG_BACKEND', 'supabase').lower()
+    if backend == 'supabase':
+        from .supabase_store import SupabaseDocumentStore
+        return SupabaseDocumentStore()
+    if backend == 'postgres':
+        from .postgres_store import PostgresDocumentStore
+        return PostgresDocumentStore()
+    if backend == 'embedded':
+        from .embedded_store import EmbeddedDocumentStore
+        return EmbeddedDocumentStore.from_env()
+    raise ValueError(f"RAG_BACKEND inválido: {backend}")
+
+__all__ = [
+    'DocumentStore',
+    'create_document_store'
+]
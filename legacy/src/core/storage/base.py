@@ -0,0 +1,114 @@
+import hashlib
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+def document_hash(doc_type: str, content: str, metadata: Dict = None) -> str:
+    """
+    Chave de deduplicação de um documento dentro do seu tipo, idêntica à calculada pelo banco
+    (document_dedup_hash). Mensagens de chat se repetem, então incluem usuário, papel e horário.
+    """
+    if doc_type == 'chat_history':
+        metadata = metadata or {}
+        fields = [metadata.get('user_id'), metadata.get('role'), metadata.get('timestamp')]
+        content = '|'.join('' if value is None else str(value) for value in fields) + '|' + content
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def filtered_match_params(query_embedding: List[float], limit: int, similarity_threshold: float,
+                          doc_type: str = None, user_id: Any = None, created_after: datetime = None,
+                          created_before: datetime = None) -> Dict[str, Any]:
+    """Parâmetros nomeados das funções SQL match_documents_filtered / match_documents_quantized"""
+    return {
+        'query_embedding': query_embedding,
+        'match_count': limit,
+        'similarity_threshold': similarity_threshold,
+        'filter_type': doc_type,
+        'filter_user_id': str(user_id) if user_id is not None else None,
+        'created_after': created_after.isoformat() if created_after else None,
+        'created_before': created_before.isoformat() if created_before else None
+    }
+
+class DocumentStore(ABC):
+    """
+    Interface base para o armazenamento de documentos e busca vetorial usado pelo SupabaseRAG.
+
+    Documentos são dicts com id, doc_type, content, metadata, content_hash, embedding,
+    embedding_pending e created_at (ISO 8601). O doc_type é 'memory', 'chat_history',
+    'search_result' ou 'knowledge' (documentos sem metadata.type).
+    """
+
+    @abstractmethod
+    def check_connection(self) -> bool:
+        """Verifica se o armazenamento está acessível"""
+        pass
+
+    @abstractmethod
+    def select_documents(self, columns: str = '*', doc_types: List[str] = None, user_id: Any = None,
+                         after_id: int = None, pending: bool = None, content_hashes: List[str] = None,
+                         order: str = 'id', desc: bool = False, limit: int = None) -> List[Dict[str, Any]]:
+        """
+        Consulta documentos.
+
+        Args:
+            columns (str): Colunas separadas por vírgula (peça 'embedding' explicitamente quando necessário)
+            doc_types (List[str]): Filtra por doc_type
+            user_id: Filtra por metadata.user_id
+            after_id (int): Apenas ids maiores
+            pending (bool): Filtra por embedding_pending
+            content_hashes (List[str]): Filtra por content_hash
+            order (str): Coluna de ordenação
+            desc (bool): Ordem decrescente
+            limit (int): Número máximo de linhas
+        """
+        pass
+
+    @abstractmethod
+    def upsert_rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insere documentos ignorando (doc_type, content_hash) existentes; retorna os inseridos"""
+        pass
+
+    @abstractmethod
+    def upsert_document(self, content: str, metadata: Dict,
+                        embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Insere um documento de forma idempotente.
+
+        Returns:
+            List[Dict[str, Any]]: [{'id', 'inserted'}]; sem embedding, apenas verifica se o
+            conteúdo existe (lista vazia se não existir)
+        """
+        pass
+
+    @abstractmethod
+    def set_embeddings(self, rows: List[Dict[str, Any]]) -> int:
+        """Grava embeddings ({'id', 'embedding'}) e limpa embedding_pending; retorna as linhas atualizadas"""
+        pass
+
+    @abstractmethod
+    def match_documents(self, query_embedding: List[float], limit: int,
+                        similarity_threshold: float) -> List[Dict[str, Any]]:
+        """Busca vetorial sem filtros: [{'id', 'content', 'metadata', 'similarity'}]"""
+        pass
+
+    @abstractmethod
+    def match_documents_filtered(self, query_embedding: List[float], limit: int, similarity_threshold: float,
+                                 doc_type: str = None, user_id: Any = None,
+                                 created_after: datetime = None,
+                                 created_before: datetime = None) -> List[Dict[str, Any]]:
+        """Busca vetorial com filtros: [{'id', 'content', 'metadata', 'similarity', 'created_at'}]"""
+        pass
+
+    @abstractmethod
+    def purge_expired(self, batch_size: int) -> List[Dict[str, Any]]:
+        """Remove até batch_size documentos expirados por tipo: [{'purged_type', 'removed'}]"""
+        pass
+
+    @abstractmethod
+    def memory_user_stats(self) -> List[Dict[str, Any]]:
+        """Usuários com memórias: [{'user_id', 'max_id', 'memory_count'}]"""
+        pass
+
+    @abstractmethod
+    def consolidate_memories(self, keep_id: int, remove_ids: List[int]) -> int:
+        """Substitui memórias duplicadas pela memória mantida, preservando a proveniência"""
+        pass
@@ -0,0 +1,508 @@
+"""
+Armazenamento embarcado, sem rede: SQLite para as linhas e o metadata, e um segmento de
+vetores float32 append-only lido com mmap.
+
+Cada documento com embedding aponta para uma linha do segmento (vector_row). Vetores
+substituídos ou de documentos removidos viram lápides e são descartados por compact().
+A busca é por força bruta (um produto matricial sobre o segmento, restrito pelos filtros
+resolvidos no SQLite) ou, acima de hnsw_threshold vetores e com hnswlib instalado, por
+um índice HNSW mantido em memória e reconstruído na abertura.
+
+Selecionado com RAG_BACKEND=embedded; os arquivos ficam em EMBEDDED_STORE_DIR.
+"""
+
+import os
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .base import DocumentStore, document_hash
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('id', 'doc_type', 'content', 'metadata', 'content_hash', 'embedding',
+           'embedding_pending', 'created_at')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL DEFAULT '{}',
+    content_hash TEXT NOT NULL,
+    user_id TEXT,
+    embedding_pending INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    vector_row INTEGER,
+    UNIQUE (doc_type, content_hash)
+);
+CREATE INDEX IF NOT EXISTS documents_type_user_created_idx ON documents (doc_type, user_id, created_at);
+CREATE INDEX IF NOT EXISTS documents_pending_idx ON documents (embedding_pending) WHERE embedding_pending = 1;
+CREATE TABLE IF NOT EXISTS memory_provenance (
+    id INTEGER PRIMARY KEY,
+    superseded_by INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    metadata TEXT,
+    created_at TEXT,
+    consolidated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS document_retention (
+    doc_type TEXT PRIMARY KEY,
+    retention_days INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO document_retention VALUES ('chat_history', 90), ('search_result', 30);
+CREATE TABLE IF NOT EXISTS store_info (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+def _timestamp(value: datetime = None) -> str:
+    """Data em UTC com formato fixo, para que a ordem do texto seja a ordem cronológica"""
+    value = value or datetime.now(timezone.utc)
+    value = value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+    return value.strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+def _document_type(metadata: Dict = None) -> str:
+    return (metadata or {}).get('type') or 'knowledge'
+
+class EmbeddedDocumentStore(DocumentStore):
+    """Documentos em SQLite e vetores em um segmento mmap local"""
+
+    def __init__(self, directory: str, hnsw_threshold: int = 50000, ef_search: int = 40,
+                 compact_ratio: float = 0.5):
+        """
+        Args:
+            directory (str): Diretório de documents.db e vectors.f32
+            hnsw_threshold (int): Vetores ativos a partir dos quais usar HNSW (se hnswlib estiver instalado)
+            ef_search (int): Candidatos avaliados pelo HNSW por busca
+            compact_ratio (float): Fração de lápides no segmento que dispara compact() após a retenção
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.hnsw_threshold = hnsw_threshold
+        self.ef_search = ef_search
+        self.compact_ratio = compact_ratio
+        self.vectors_path = os.path.join(directory, 'vectors.f32')
+        self._lock = threading.RLock()
+
+        self.conn = sqlite3.connect(os.path.join(directory, 'documents.db'), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+        self._matrix = None
+        self._hnsw = None
+        self._open_segment()
+
+    @classmethod
+    def from_env(cls) -> 'EmbeddedDocumentStore':
+        """Cria o armazenamento com EMBEDDED_STORE_DIR, EMBEDDED_HNSW_THRESHOLD e VECTOR_EF_SEARCH"""
+        return cls(
+            os.getenv('EMBEDDED_STORE_DIR', 'data/embedded_store'),
+            hnsw_threshold=int(os.getenv('EMBEDDED_HNSW_THRESHOLD', 50000)),
+            ef_search=int(os.getenv('VECTOR_EF_SEARCH', 40))
+        )
+
+    # Segmento de vetores
+
+    def _open_segment(self) -> None:
+        """Descarta uma escrita parcial no fim do segmento e carrega o mapa linha -> documento"""
+        info = self.conn.execute("SELECT value FROM store_info WHERE key = 'dim'").fetchone()
+        self.dim: Optional[int] = int(info['value']) if info else None
+        rows = 0
+        if self.dim and os.path.exists(self.vectors_path):
+            row_bytes = self.dim * 4
+            size = os.path.getsize(self.vectors_path)
+            if size % row_bytes:
+                with open(self.vectors_path, 'r+b') as f:
+                    f.truncate(size - size % row_bytes)
+            rows = size // row_bytes
+
+        # Id do documento dono de cada linha do segmento (0 = lápide)
+        self._row_ids = np.zeros(rows, dtype=np.int64)
+        for row in self.conn.execute('SELECT id, vector_row FROM documents WHERE vector_row IS NOT NULL'):
+            if row['vector_row'] < rows:
+                self._row_ids[row['vector_row']] = row['id']
+        self._matrix = None
+        self._hnsw = None
+        self._update_hnsw()
+
+    def _vectors(self) -> np.ndarray:
+        """Segmento inteiro, reaberto com mmap quando cresce"""
+        rows = len(self._row_ids)
+        if self._matrix is None or len(self._matrix) != rows:
+            if rows == 0:
+                self._matrix = np.zeros((0, self.dim or 0), dtype=np.float32)
+            else:
+                self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+        return self._matrix
+
+    def _append_vectors(self, embeddings: List[List[float]], ids: List[int]) -> List[int]:
+        """Grava vetores no fim do segmento; retorna as linhas atribuídas"""
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.conn.execute("INSERT INTO store_info VALUES ('dim', ?)", (str(self.dim),))
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding com dimensão {vectors.shape[1]}, esperado {self.dim}")
+
+        first = len(self._row_ids)
+        with open(self.vectors_path, 'ab') as f:
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._row_ids = np.concatenate([self._row_ids, np.asarray(ids, dtype=np.int64)])
+        self._update_hnsw(vectors, first)
+        return list(range(first, first + len(ids)))
+
+    def _tombstone(self, rows: List[Optional[int]]) -> None:
+        for row in rows:
+            if row is None or row >= len(self._row_ids) or not self._row_ids[row]:
+                continue
+            self._row_ids[row] = 0
+            if self._hnsw is not None:
+                self._hnsw.mark_deleted(row)
+
+    def _update_hnsw(self, vectors: np.ndarray = None, first_row: int = 0) -> None:
+        """Mantém o índice HNSW quando o segmento passa do limite de tamanho"""
+        live = int(np.count_nonzero(self._row_ids))
+        if live < self.hnsw_threshold:
+            self._hnsw = None
+            return
+        try:
+            import hnswlib
+        except ImportError:
+            return
+        if self._hnsw is None:
+            self._hnsw = hnswlib.Index(space='ip', dim=self.dim)
+            self._hnsw.init_index(max_elements=max(len(self._row_ids) * 2, 1024), ef_construction=200, M=16)
+            rows = np.flatnonzero(self._row_ids)
+            self._hnsw.add_items(np.asarray(self._vectors()[rows]), rows)
+            return
+        if self._hnsw.get_max_elements() < len(self._row_ids):
+            self._hnsw.resize_index(len(self._row_ids) * 2)
+        if vectors is not None:
+            self._hnsw.add_items(vectors, np.arange(first_row, first_row + len(vectors)))
+
+    def _nearest(self, query_embedding: List[float], limit: int, similarity_threshold: float,
+                 rows: np.ndarray = None) -> List[tuple]:
+        """(id, similaridade) dos vetores mais próximos, entre todos os ativos ou apenas nas linhas dadas"""
+        if self.dim is None or limit <= 0:
+            return []
+        q = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        if rows is None:
+            rows = np.flatnonzero(self._row_ids)
+        if len(rows) == 0:
+            return []
+        k = min(limit, len(rows))
+
+        # Conjuntos filtrados pequenos são mais rápidos (e exatos) por força bruta
+        if self._hnsw is not None and len(rows) >= self.hnsw_threshold:
+            self._hnsw.set_ef(max(self.ef_search, k))
+            allowed = None if len(rows) == np.count_nonzero(self._row_ids) else set(rows.tolist())
+            labels, distances = self._hnsw.knn_query(
+                q, k=k, filter=(lambda label: label in allowed) if allowed is not None else None
+            )
+            pairs = [(int(label), 1.0 - float(distance)) for label, distance in zip(labels[0], distances[0])]
+        else:
+            scores = self._vectors()[rows] @ q
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            pairs = sorted(((int(rows[i]), float(scores[i])) for i in top), key=lambda p: p[1], reverse=True)
+        return [(int(self._row_ids[row]), score) for row, score in pairs if score > similarity_threshold]
+
+    def compact(self) -> None:
+        """Reescreve o segmento apenas com os vetores ativos"""
+        with self._lock:
+            live = np.flatnonzero(self._row_ids)
+            if len(live) == len(self._row_ids):
+                return
+            tmp_path = self.vectors_path + '.tmp'
+            np.ascontiguousarray(self._vectors()[live]).tofile(tmp_path)
+            self._matrix = None
+            with self._transaction():
+                self.conn.executemany('UPDATE documents SET vector_row = ? WHERE id = ?',
+                                      [(new_row, int(self._row_ids[old_row])) for new_row, old_row in enumerate(live)])
+                os.replace(tmp_path, self.vectors_path)
+            logger.info(f"Segmento de vetores compactado: {len(self._row_ids) - len(live)} lápides removidas")
+            self._open_segment()
+
+    @contextmanager
+    def _transaction(self):
+        """Transação no SQLite; se falhar, o mapa do segmento é recarregado do banco"""
+        with self._lock:
+            try:
+                with self.conn:
+                    yield
+            except Exception:
+                self._open_segment()
+                raise
+
+    # DocumentStore
+
+    def _document(self, row: sqlite3.Row, columns: List[str]) -> Dict[str, Any]:
+        document = {}
+        for column in columns:
+            if column == 'metadata':
+                document['metadata'] = json.loads(row['metadata'])
+            elif column == 'embedding_pending':
+                document['embedding_pending'] = bool(row['embedding_pending'])
+            elif column == 'embedding':
+                vector_row = row['vector_row']
+                document['embedding'] = self._vectors()[vector_row].tolist() \
+                    if vector_row is not None and vector_row < len(self._row_ids) else None
+            else:
+                document[column] = row[column]
+        return document
+
+    def check_connection(self) -> bool:
+        try:
+            with self._lock:
+                self.conn.execute('SELECT 1')
+            return True
+        except Exception as e:
+            logger.error(f"Embedded store check failed: {e}")
+            return False
+
+    def select_documents(self, columns: str = '*', doc_types: List[str] = None, user_id: Any = None,
+                         after_id: int = None, pending: bool = None, content_hashes: List[str] = None,
+                         order: str = 'id', desc: bool = False, limit: int = None) -> List[Dict[str, Any]]:
+        # '*' retorna todas as colunas exceto o embedding
+        fields = [c for c in COLUMNS if c != 'embedding'] if columns.strip() == '*' else \
+            [c.strip() for c in columns.split(',')]
+        for column in fields + [order]:
+            if column not in COLUMNS or (column == order and column == 'embedding'):
+                raise ValueError(f"Coluna inválida: {column}")
+
+        conditions, params = [], []
+        if doc_types:
+            conditions.append(f"doc_type IN ({', '.join('?' * len(doc_types))})")
+            params.extend(doc_types)
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            params.append(str(user_id))
+        if after_id is not None:
+            conditions.append('id > ?')
+            params.append(after_id)
+        if pending is not None:
+            conditions.append('embedding_pending = ?')
+            params.append(int(pending))
+        if content_hashes is not None:
+            if not content_hashes:
+                return []
+            conditions.append(f"content_hash IN ({', '.join('?' * len(content_hashes))})")
+            params.extend(content_hashes)
+
+        query = 'SELECT * FROM documents'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += f" ORDER BY {order} {'DESC' if desc else 'ASC'}"
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            return [self._document(row, fields) for row in self.conn.execute(query, params)]
+
+    def _insert(self, row: Dict[str, Any]) -> Optional[int]:
+        """Insere uma linha sem vetor; retorna o id ou None se (doc_type, content_hash) já existir"""
+        metadata = row.get('metadata') or {}
+        doc_type = row.get('doc_type') or _document_type(metadata)
+        user_id = metadata.get('user_id')
+        # Como o trigger do banco, o hash é sempre recalculado a partir do documento
+        cursor = self.conn.execute(
+            'INSERT OR IGNORE INTO documents '
+            '(doc_type, content, metadata, content_hash, user_id, embedding_pending, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (
+                doc_type,
+                row['content'],
+                json.dumps(metadata),
+                document_hash(doc_type, row['content'], metadata),
+                str(user_id) if user_id is not None else None,
+                int(bool(row.get('embedding_pending', False))),
+                _timestamp()
+            )
+        )
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def _attach_vectors(self, ids: List[int], embeddings: List[List[float]]) -> None:
+        if not ids:
+            return
+        rows = self._append_vectors(embeddings, ids)
+        self.conn.executemany('UPDATE documents SET vector_row = ?, embedding_pending = 0 WHERE id = ?',
+                              list(zip(rows, ids)))
+
+    def upsert_rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        inserted, vector_ids, embeddings = [], [], []
+        with self._transaction():
+            for row in rows:
+                doc_id = self._insert(row)
+                if doc_id is None:
+                    continue
+                inserted.append(doc_id)
+                if row.get('embedding') is not None:
+                    vector_ids.append(doc_id)
+                    embeddings.append(row['embedding'])
+            self._attach_vectors(vector_ids, embeddings)
+            if not inserted:
+                return []
+            result = self.conn.execute(
+                f"SELECT id, doc_type, content, metadata, created_at FROM documents "
+                f"WHERE id IN ({', '.join('?' * len(inserted))}) ORDER BY id",
+                inserted
+            ).fetchall()
+            return [self._document(row, ['id', 'doc_type', 'content', 'metadata', 'created_at']) for row in result]
+
+    def upsert_document(self, content: str, metadata: Dict,
+                        embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        metadata = metadata or {}
+        doc_type = _document_type(metadata)
+        row = {'content': content, 'metadata': metadata, 'doc_type': doc_type,
+               'content_hash': document_hash(doc_type, content, metadata)}
+        with self._transaction():
+            if embedding is not None:
+                doc_id = self._insert(row)
+                if doc_id is not None:
+                    self._attach_vectors([doc_id], [embedding])
+                    return [{'id': doc_id, 'inserted': True}]
+            existing = self.conn.execute(
+                'SELECT id FROM documents WHERE doc_type = ? AND content_hash = ?',
+                (row['doc_type'], row['content_hash'])
+            ).fetchone()
+            return [{'id': existing['id'], 'inserted': False}] if existing else []
+
+    def set_embeddings(self, rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        with self._transaction():
+            by_id = {row['id']: row['embedding'] for row in rows}
+            existing = self.conn.execute(
+                f"SELECT id, vector_row FROM documents WHERE id IN ({', '.join('?' * len(by_id))})",
+                list(by_id)
+            ).fetchall()
+            self._tombstone([row['vector_row'] for row in existing])
+            ids = [row['id'] for row in existing]
+            self._attach_vectors(ids, [by_id[doc_id] for doc_id in ids])
+            return len(ids)
+
+    def _matches(self, pairs: List[tuple], columns: List[str]) -> List[Dict[str, Any]]:
+        if not pairs:
+            return []
+        ids = [doc_id for doc_id, _ in pairs]
+        rows = {row['id']: row for row in self.conn.execute(
+            f"SELECT * FROM documents WHERE id IN ({', '.join('?' * len(ids))})", ids
+        )}
+        return [{**self._document(rows[doc_id], columns), 'similarity': score}
+                for doc_id, score in pairs if doc_id in rows]
+
+    def match_documents(self, query_embedding: List[float], limit: int,
+                        similarity_threshold: float) -> List[Dict[str, Any]]:
+        with self._lock:
+            pairs = self._nearest(query_embedding, limit, similarity_threshold)
+            return self._matches(pairs, ['id', 'content', 'metadata'])
+
+    def match_documents_filtered(self, query_embedding: List[float], limit: int, similarity_threshold: float,
+                                 doc_type: str = None, user_id: Any = None,
+                                 created_after: datetime = None,
+                                 created_before: datetime = None) -> List[Dict[str, Any]]:
+        conditions, params = ['vector_row IS NOT NULL'], []
+        if doc_type is not None:
+            conditions.append('doc_type = ?')
+            params.append(doc_type)
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            params.append(str(user_id))
+        if created_after is not None:
+            conditions.append('created_at >= ?')
+            params.append(_timestamp(created_after))
+        if created_before is not None:
+            conditions.append('created_at < ?')
+            params.append(_timestamp(created_before))
+
+        with self._lock:
+            # Os filtros restringem as linhas do segmento antes da busca, como no banco
+            rows = None
+            if params:
+                rows = np.fromiter(
+                    (row[0] for row in self.conn.execute(
+                        f"SELECT vector_row FROM documents WHERE {' AND '.join(conditions)}", params
+                    )),
+                    dtype=np.int64
+                )
+            pairs = self._nearest(query_embedding, limit, similarity_threshold, rows)
+            return self._matches(pairs, ['id', 'content', 'metadata', 'created_at'])
+
+    def purge_expired(self, batch_size: int) -> List[Dict[str, Any]]:
+        purged = []
+        with self._lock:
+            with self._transaction():
+                retention = self.conn.execute('SELECT doc_type, retention_days FROM document_retention').fetchall()
+                for policy in retention:
+                    cutoff = _timestamp(datetime.now(timezone.utc) - timedelta(days=policy['retention_days']))
+                    expired = self.conn.execute(
+                        'SELECT id, vector_row FROM documents WHERE doc_type = ? AND created_at < ? '
+                        'ORDER BY id LIMIT ?',
+                        (policy['doc_type'], cutoff, batch_size)
+                    ).fetchall()
+                    if expired:
+                        self.conn.executemany('DELETE FROM documents WHERE id = ?', [(row['id'],) for row in expired])
+                        self._tombstone([row['vector_row'] for row in expired])
+                    purged.append({'purged_type': policy['doc_type'], 'removed': len(expired)})
+
+            rows = len(self._row_ids)
+            if rows and (rows - np.count_nonzero(self._row_ids)) / rows > self.compact_ratio:
+                self.compact()
+        return purged
+
+    def memory_user_stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(
+                "SELECT user_id, max(id) AS max_id, count(*) AS memory_count FROM documents "
+                "WHERE doc_type = 'memory' GROUP BY user_id"
+            )]
+
+    def consolidate_memories(self, keep_id: int, remove_ids: List[int]) -> int:
+        remove_ids = [doc_id for doc_id in remove_ids if doc_id != keep_id]
+        if not remove_ids:
+            return 0
+        placeholders = ', '.join('?' * len(remove_ids))
+        with self._transaction():
+            removed = self.conn.execute(
+                f"SELECT * FROM documents WHERE id IN ({placeholders}) AND doc_type = 'memory'", remove_ids
+            ).fetchall()
+            now = _timestamp()
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO memory_provenance VALUES (?, ?, ?, ?, ?, ?)',
+                [(row['id'], keep_id, row['content'], row['metadata'], row['created_at'], now) for row in removed]
+            )
+            # Memórias já consolidadas anteriormente passam a apontar para a nova memória mantida
+            self.conn.execute(f"UPDATE memory_provenance SET superseded_by = ? WHERE superseded_by IN ({placeholders})",
+                              [keep_id, *remove_ids])
+
+            keep = self.conn.execute('SELECT metadata FROM documents WHERE id = ?', (keep_id,)).fetchone()
+            if keep is not None:
+                metadata = json.loads(keep['metadata'])
+                consolidated = list(metadata.get('consolidated_ids') or [])
+                for doc_id in [*remove_ids, *(i for row in removed
+                                             for i in json.loads(row['metadata']).get('consolidated_ids') or [])]:
+                    if doc_id not in consolidated:
+                        consolidated.append(doc_id)
+                metadata['consolidated_ids'] = consolidated
+                self.conn.execute('UPDATE documents SET metadata = ? WHERE id = ?', (json.dumps(metadata), keep_id))
+
+            self.conn.executemany('DELETE FROM documents WHERE id = ?', [(row['id'],) for row in removed])
+            self._tombstone([row['vector_row'] for row in removed])
+            return len(removed)
@@ -0,0 +1,201 @@
+"""
+Armazenamento com acesso direto ao Postgres (pgvector), sem PostgREST.
+
+Usa as mesmas funções SQL do SupabaseDocumentStore, com um pool de conexões psycopg 3,
+vetores em formato binário (pgvector.psycopg), statements preparados já na primeira
+execução e pipeline para inserts e updates em lote.
+
+Requer psycopg[binary], psycopg-pool e pgvector. Selecionado com RAG_BACKEND=postgres.
+"""
+
+import os
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from psycopg import sql
+from psycopg.adapt import PyFormat
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from psycopg_pool import ConnectionPool
+from pgvector.psycopg import register_vector
+
+from .base import DocumentStore, filtered_match_params
+
+logger = logging.getLogger(__name__)
+
+def _vector(embedding) -> np.ndarray:
+    return np.asarray(embedding, dtype=np.float32)
+
+def _row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Formato das linhas igual ao do PostgREST (datas em ISO 8601, serializáveis em JSON)"""
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in row.items()}
+
+def _document_type(metadata: Dict = None) -> str:
+    return (metadata or {}).get('type') or 'knowledge'
+
+class PostgresDocumentStore(DocumentStore):
+    """Tabela documents acessada por uma conexão nativa ao Postgres"""
+
+    def __init__(self):
+        self.embedding_quantization = os.getenv('EMBEDDING_QUANTIZATION', 'none').lower()
+        self.embedding_rescore_factor = int(os.getenv('EMBEDDING_RESCORE_FACTOR', 4))
+        self.vector_ef_search = int(os.getenv('VECTOR_EF_SEARCH', 40))
+        self._connect()
+
+    def _connect(self) -> None:
+        dsn = os.getenv('POSTGRES_DSN')
+        if not dsn:
+            raise ValueError("Missing required environment variable: POSTGRES_DSN")
+
+        def configure(conn):
+            register_vector(conn)
+            # Prepara cada statement já na primeira execução
+            conn.prepare_threshold = 0
+
+        try:
+            self.pool = ConnectionPool(
+                dsn,
+                min_size=int(os.getenv('POSTGRES_POOL_MIN', 1)),
+                max_size=int(os.getenv('POSTGRES_POOL_MAX', 10)),
+                kwargs={'row_factory': dict_row, 'autocommit': True},
+                configure=configure,
+                open=True
+            )
+            logger.info("Verificando conexão com Postgres...")
+            self.pool.wait(timeout=float(os.getenv('POSTGRES_CONNECT_TIMEOUT', 10)))
+            self.check_connection()
+        except Exception as e:
+            raise ConnectionError(f"Failed to initialize Postgres pool: {e}")
+
+    def check_connection(self) -> bool:
+        try:
+            with self.pool.connection() as conn:
+                conn.execute('SELECT 1')
+            return True
+        except Exception as e:
+            logger.error(f"Postgres connection check failed: {e}")
+            return False
+
+    def _fetch(self, query, params=None) -> List[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            return [_row(row) for row in conn.execute(query, params, binary=True).fetchall()]
+
+    def select_documents(self, columns: str = '*', doc_types: List[str] = None, user_id: Any = None,
+                         after_id: int = None, pending: bool = None, content_hashes: List[str] = None,
+                         order: str = 'id', desc: bool = False, limit: int = None) -> List[Dict[str, Any]]:
+        conditions, params = [], []
+        if doc_types:
+            conditions.append(sql.SQL('doc_type = ANY(%s)'))
+            params.append(list(doc_types))
+        if user_id is not None:
+            conditions.append(sql.SQL("metadata->>'user_id' = %s"))
+            params.append(str(user_id))
+        if after_id is not None:
+            conditions.append(sql.SQL('id > %s'))
+            params.append(after_id)
+        if pending is not None:
+            conditions.append(sql.SQL('embedding_pending = %s'))
+            params.append(pending)
+        if content_hashes is not None:
+            conditions.append(sql.SQL('content_hash = ANY(%s)'))
+            params.append(list(content_hashes))
+
+        fields = sql.SQL('*') if columns.strip() == '*' else \
+            sql.SQL(', ').join(sql.Identifier(column.strip()) for column in columns.split(','))
+        query = sql.SQL('SELECT {} FROM documents').format(fields)
+        if conditions:
+            query += sql.SQL(' WHERE ') + sql.SQL(' AND ').join(conditions)
+        query += sql.SQL(' ORDER BY {} {}').format(sql.Identifier(order), sql.SQL('DESC' if desc else 'ASC'))
+        if limit is not None:
+            query += sql.SQL(' LIMIT %s')
+            params.append(limit)
+        return self._fetch(query, params)
+
+    def upsert_rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not rows:
+            return []
+        query = """
+            INSERT INTO documents (doc_type, content, metadata, content_hash, embedding, embedding_pending)
+            VALUES (%s, %s, %s, %s, %b, %s)
+            ON CONFLICT (doc_type, content_hash) DO NOTHING
+            RETURNING id, doc_type, content, metadata, created_at
+        """
+        params = [(
+            row.get('doc_type') or _document_type(row.get('metadata')),
+            row['content'],
+            Jsonb(row.get('metadata') or {}),
+            row['content_hash'],
+            _vector(row['embedding']) if row.get('embedding') is not None else None,
+            bool(row.get('embedding_pending', False))
+        ) for row in rows]
+
+        inserted = []
+        with self.pool.connection() as conn:
+            # Um único round-trip para o lote inteiro (executemany usa o pipeline do psycopg)
+            with conn.transaction(), conn.cursor() as cur:
+                cur.executemany(query, params, returning=True)
+                while True:
+                    inserted.extend(_row(row) for row in cur.fetchall())
+                    if not cur.nextset():
+                        break
+        return inserted
+
+    def upsert_document(self, content: str, metadata: Dict,
+                        embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        return self._fetch(
+            'SELECT * FROM upsert_document(%s, %s, %b)',
+            (content, Jsonb(metadata or {}), _vector(embedding) if embedding is not None else None)
+        )
+
+    def set_embeddings(self, rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        with self.pool.connection() as conn:
+            with conn.transaction(), conn.cursor() as cur:
+                cur.executemany(
+                    'UPDATE documents SET embedding = %b, embedding_pending = FALSE WHERE id = %s',
+                    [(_vector(row['embedding']), row['id']) for row in rows]
+                )
+                return cur.rowcount
+
+    def match_documents(self, query_embedding: List[float], limit: int,
+                        similarity_threshold: float) -> List[Dict[str, Any]]:
+        return self._fetch(
+            'SELECT * FROM match_documents(%b, %s, %s, %s)',
+            (_vector(query_embedding), limit, similarity_threshold, self.vector_ef_search)
+        )
+
+    def match_documents_filtered(self, query_embedding: List[float], limit: int, similarity_threshold: float,
+                                 doc_type: str = None, user_id: Any = None,
+                                 created_after: datetime = None,
+                                 created_before: datetime = None) -> List[Dict[str, Any]]:
+        params = filtered_match_params(_vector(query_embedding), limit, similarity_threshold,
+                                       doc_type, user_id, created_after, created_before)
+        if self.embedding_quantization in ('halfvec', 'binary'):
+            function = 'match_documents_quantized'
+            params.update(quantization=self.embedding_quantization,
+                          rescore_factor=self.embedding_rescore_factor)
+        else:
+            function = 'match_documents_filtered'
+            params['ef_search'] = self.vector_ef_search
+
+        arguments = sql.SQL(', ').join(
+            sql.SQL('{} => {}').format(
+                sql.Identifier(name),
+                sql.Placeholder(name, PyFormat.BINARY if name == 'query_embedding' else PyFormat.AUTO)
+            )
+            for name in params
+        )
+        return self._fetch(sql.SQL('SELECT * FROM {}({})').format(sql.Identifier(function), arguments), params)
+
+    def purge_expired(self, batch_size: int) -> List[Dict[str, Any]]:
+        return self._fetch('SELECT * FROM purge_expired_documents(%s)', (batch_size,))
+
+    def memory_user_stats(self) -> List[Dict[str, Any]]:
+        return self._fetch('SELECT * FROM memory_user_stats()')
+
+    def consolidate_memories(self, keep_id: int, remove_ids: List[int]) -> int:
+        rows = self._fetch('SELECT consolidate_memories(%s, %s) AS removed', (keep_id, list(remove_ids)))
+        return rows[0]['removed'] if rows else 0
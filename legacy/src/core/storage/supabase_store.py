@@ -0,0 +1,120 @@
+import os
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from supabase import create_client
+
+from .base import DocumentStore, filtered_match_params
+
+logger = logging.getLogger(__name__)
+
+class SupabaseDocumentStore(DocumentStore):
+    """Armazenamento na tabela documents do Supabase, via PostgREST e RPCs (migrations 001-008)"""
+
+    def __init__(self):
+        # Índice compacto usado na busca filtrada ('none', 'halfvec' ou 'binary'), com
+        # reordenação em precisão cheia de limit * rescore_factor candidatos
+        self.embedding_quantization = os.getenv('EMBEDDING_QUANTIZATION', 'none').lower()
+        self.embedding_rescore_factor = int(os.getenv('EMBEDDING_RESCORE_FACTOR', 4))
+        # Candidatos avaliados pelo índice HNSW por busca (maior = mais recall, mais lento)
+        self.vector_ef_search = int(os.getenv('VECTOR_EF_SEARCH', 40))
+        self._connect()
+
+    def _connect(self) -> None:
+        # Validate environment variables
+        supabase_url = os.getenv('SUPABASE_URL')
+        supabase_key = os.getenv('SUPABASE_KEY')
+
+        if not all([supabase_url, supabase_key]):
+            raise ValueError("Missing required environment variables: SUPABASE_URL and/or SUPABASE_KEY")
+
+        try:
+            self.supabase = create_client(supabase_url, supabase_key)
+            logger.info("Verificando conexão com Supabase...")
+            self.check_connection()
+        except Exception as e:
+            raise ConnectionError(f"Failed to initialize Supabase client: {e}")
+
+    def check_connection(self) -> bool:
+        try:
+            self.supabase.table('documents').select('id').limit(1).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Supabase connection check failed: {e}")
+            return False
+
+    def select_documents(self, columns: str = '*', doc_types: List[str] = None, user_id: Any = None,
+                         after_id: int = None, pending: bool = None, content_hashes: List[str] = None,
+                         order: str = 'id', desc: bool = False, limit: int = None) -> List[Dict[str, Any]]:
+        query = self.supabase.table('documents').select(columns)
+        if doc_types:
+            query = query.eq('doc_type', doc_types[0]) if len(doc_types) == 1 else query.in_('doc_type', doc_types)
+        if user_id is not None:
+            query = query.eq('metadata->>user_id', str(user_id))
+        if after_id is not None:
+            query = query.gt('id', after_id)
+        if pending is not None:
+            query = query.eq('embedding_pending', pending)
+        if content_hashes is not None:
+            query = query.in_('content_hash', content_hashes)
+        query = query.order(order, desc=desc)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.execute().data or []
+
+    def upsert_rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        result = self.supabase.table('documents') \
+            .upsert(rows, on_conflict='doc_type,content_hash', ignore_duplicates=True) \
+            .execute()
+        return result.data or []
+
+    def upsert_document(self, content: str, metadata: Dict,
+                        embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        params = {'p_content': content, 'p_metadata': metadata}
+        if embedding is not None:
+            params['p_embedding'] = embedding
+        return self.supabase.rpc('upsert_document', params).execute().data or []
+
+    def set_embeddings(self, rows: List[Dict[str, Any]]) -> int:
+        return self.supabase.rpc('set_document_embeddings', {'p_rows': rows}).execute().data or 0
+
+    def match_documents(self, query_embedding: List[float], limit: int,
+                        similarity_threshold: float) -> List[Dict[str, Any]]:
+        return self.supabase.rpc('match_documents', {
+            'query_embedding': query_embedding,
+            'match_count': limit,
+            'similarity_threshold': similarity_threshold,
+            'ef_search': self.vector_ef_search
+        }).execute().data or []
+
+    def match_documents_filtered(self, query_embedding: List[float], limit: int, similarity_threshold: float,
+                                 doc_type: str = None, user_id: Any = None,
+                                 created_after: datetime = None,
+                                 created_before: datetime = None) -> List[Dict[str, Any]]:
+        """Busca filtrada, no índice compacto se EMBEDDING_QUANTIZATION estiver ativo"""
+        params = filtered_match_params(query_embedding, limit, similarity_threshold, doc_type,
+                                       user_id, created_after, created_before)
+        if self.embedding_quantization in ('halfvec', 'binary'):
+            return self.supabase.rpc('match_documents_quantized', {
+                **params,
+                'quantization': self.embedding_quantization,
+                'rescore_factor': self.embedding_rescore_factor
+            }).execute().data or []
+        return self.supabase.rpc('match_documents_filtered', {
+            **params,
+            'ef_search': self.vector_ef_search
+        }).execute().data or []
+
+    def purge_expired(self, batch_size: int) -> List[Dict[str, Any]]:
+        return self.supabase.rpc('purge_expired_documents', {'p_batch_size': batch_size}).execute().data or []
+
+    def memory_user_stats(self) -> List[Dict[str, Any]]:
+        return self.supabase.rpc('memory_user_stats', {}).execute().data or []
+
+    def consolidate_memories(self, keep_id: int, remove_ids: List[int]) -> int:
+        result = self.supabase.rpc('consolidate_memories', {
+            'p_keep_id': keep_id,
+            'p_remove_ids': remove_ids
+        }).execute()
+        return result.data or 0
@@ -1,14 +1,20 @@
-from supabase import create_client, Client
 import os
 import logging
 import json
-from typing import List, Dict, Any
+import importlib.util
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Union
 import requests
 from datetime import datetime
 import time
 import requests.exceptions
-import random
-from sentence_transformers import SentenceTransformer
+from .embedding_engine import get_embedding_engine
+from .embedding_router import EmbeddingRouter
+from .embedding_store import EmbeddingStore
+from .lexical_tier import LexicalTier
+from .storage import DocumentStore, create_document_store
+from .storage.base import document_hash
+from .request_context import RequestContext
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -17,59 +23,115 @@ file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(mes
 logger.addHandler(file_handler)
 
 class SupabaseRAG:
-    def __init__(self, redis_cache):
-        # Validate environment variables
-        supabase_url = os.getenv('SUPABASE_URL')
-        supabase_key = os.getenv('SUPABASE_KEY')
-        
-        if not all([supabase_url, supabase_key]):
-            raise ValueError("Missing required environment variables: SUPABASE_URL and/or SUPABASE_KEY")
-        
-        try:
-            self.supabase = create_client(supabase_url, supabase_key)
-            logger.info("Verificando conexão com Supabase...")
-            self.check_connection()
-        except Exception as e:
-            raise ConnectionError(f"Failed to initialize Supabase client: {e}")
+    # Tipos de documento indexados pela camada lexical
+    LEXICAL_DOC_TYPES = ['knowledge', 'search_result']
+
+    def __init__(self, redis_cache, metrics=None, store: DocumentStore = None):
+        # Linhas e busca vetorial ficam no armazenamento configurado em RAG_BACKEND
+        self.store = store or create_document_store()
             
         self.hf_api_key = os.getenv('HF_API_KEY')
         self.hf_api_url = "https://api-inference.huggingface.co/pipeline/feature-extraction/sentence-transformers/all-MiniLM-L6-v2"
         self.model_name = "sentence-transformers/all-MiniLM-L6-v2"
-        self.local_model = None  # Lazy loading do modelo local
-        
-        if not self.hf_api_key:
-            raise ValueError("HF_API_KEY não encontrada nas variáveis de ambiente")
+        # Modelo local compartilhado pelo processo, aquecido em background
+        self.embedding_engine = get_embedding_engine(self.model_name)
+        self.embedding_engine.start()
+
+        # Escolha entre API e modelo local por latência observada, com circuit breaker
+        self.metrics = metrics
+        self.embedding_router = EmbeddingRouter(metrics=metrics)
+        if self.hf_api_key:
+            self.embedding_router.register('api', self._generate_embeddings_api)
+            self.embedding_router.register('local', self._generate_embeddings_local,
+                                           is_available=lambda: self.embedding_engine.ready)
+        elif importlib.util.find_spec('sentence_transformers') is not None:
+            # Sem chave da API, o modelo local atende tudo (as chamadas aguardam o warmup)
+            logger.info("HF_API_KEY não definida: embeddings gerados apenas pelo modelo local")
+            self.embedding_router.register('local', self._generate_embeddings_local)
+        else:
+            raise ValueError("HF_API_KEY não encontrada nas variáveis de ambiente "
+                             "(necessária sem o sentence-transformers instalado)")
+        # Textos por requisição à API / por lote do encode local
+        self.embedding_batch_size = int(os.getenv('EMBEDDING_BATCH_SIZE', 32))
+
         self.setup_database()
         self.redis_cache = redis_cache
+        # Cache de embeddings endereçado por conteúdo, compartilhado entre processos
+        self.embedding_store = EmbeddingStore.from_env(
+            redis_cache.redis_binary,
+            self.model_name,
+            default_ttl=redis_cache.ttl_config['embedding']
+        )
+        # Camada BM25 local à frente da busca vetorial (base de conhecimento e resultados de pesquisa)
+        self.lexical_tier = LexicalTier.from_env(self, metrics) \
+            if os.getenv('LEXICAL_TIER_ENABLED', 'true').lower() == 'true' else None
 
     def check_connection(self) -> bool:
-        try:
-            self.supabase.table('documents').select('id').limit(1).execute()
-            return True
-        except Exception as e:
-            logger.error(f"Supabase connection check failed: {e}")
-            return False
+        return self.store.check_connection()
+
+    def get_memory_user_stats(self) -> List[Dict[str, Any]]:
+        """Usuários com memórias: [{'user_id', 'max_id', 'memory_count'}]"""
+        return self.store.memory_user_stats()
+
+    def consolidate_memories(self, keep_id: int, remove_ids: List[int]) -> int:
+        """Substitui memórias duplicadas pela memória mantida (ver migration 004); retorna as removidas"""
+        removed = self.store.consolidate_memories(keep_id, remove_ids)
+        if self.lexical_tier is not None:
+            self.lexical_tier.remove(remove_ids)
+        return removed
 
     def get_embedding(self, text: str) -> List[float]:
         """Gera embedding usando Hugging Face Inference API com cache e retry logic"""
+        return self.get_embeddings([text])[0]
+
+    def query_embedding(self, query: str, request: RequestContext = None) -> List[float]:
+        """Embedding de uma query, reaproveitado dentro da mensagem se houver request"""
+        if request is not None:
+            return request.embedding(query, self.get_embedding)
+        return self.get_embedding(query)
+
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera embeddings para vários textos de uma vez.
+
+        Textos repetidos são calculados uma única vez, o cache é consultado em lote (MGET) e
+        os ausentes são gerados em lotes de embedding_batch_size.
+
+        Args:
+            texts (List[str]): Textos a serem convertidos
+
+        Returns:
+            List[List[float]]: Embeddings na mesma ordem dos textos de entrada
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        if not unique_texts:
+            return []
+
+        # Verifica cache Redis primeiro
+        cached = self.embedding_store.get_many(unique_texts)
+        embeddings = {text: emb.tolist() for text, emb in zip(unique_texts, cached) if emb is not None}
+        missing = [text for text in unique_texts if text not in embeddings]
+        logger.info(f"Embeddings: {len(embeddings)} cache hits, {len(missing)} cache misses "
+                    f"({len(texts) - len(unique_texts)} duplicados), "
+                    f"cache local: {self.embedding_store.get_stats()}")
+
+        for start in range(0, len(missing), self.embedding_batch_size):
+            batch = missing[start:start + self.embedding_batch_size]
+            generated = dict(zip(batch, self._generate_embeddings_with_retry(batch)))
+            # Adiciona ao cache Redis
+            self.embedding_store.set_many(generated)
+            embeddings.update(generated)
+
+        return [embeddings[text] for text in texts]
+
+    def _generate_embeddings_with_retry(self, texts: List[str]) -> List[List[float]]:
+        """Gera um lote de embeddings com retry e backoff exponencial"""
         max_retries = 3
         retry_delay = 1  # seconds
-        
-        # Verifica cache Redis primeiro
-        embedding = self.redis_cache.get_embedding(text)
-        if embedding:
-            logger.info("Cache hit para embedding no Redis")
-            return embedding
-        
-        logger.info("Cache miss para embedding")
-        
-        # Se não está no cache, gera novo embedding com retry
+
         for attempt in range(max_retries):
             try:
-                embedding = self._generate_embedding(text)
-                # Adiciona ao cache Redis
-                self.redis_cache.set_embedding(text, embedding)
-                return embedding
+                return self._generate_embeddings(texts)
             except requests.exceptions.RequestException as e:
                 if attempt == max_retries - 1:
                     logger.error(f"Failed to generate embedding after {max_retries} attempts: {e}")
@@ -77,85 +139,39 @@ class SupabaseRAG:
                 logger.warning(f"Attempt {attempt + 1} failed, retrying in {retry_delay * (2 ** attempt)} seconds")
                 time.sleep(retry_delay * (2 ** attempt))  # Exponential backoff
 
-    def _load_local_model(self):
-        """Carrega o modelo local se ainda não foi carregado"""
-        if self.local_model is None:
-            logger.info("Carregando modelo local...")
-            try:
-                self.local_model = SentenceTransformer(self.model_name)
-                logger.info("Modelo local carregado com sucesso")
-            except Exception as e:
-                logger.error(f"Erro ao carregar modelo local: {e}")
-                raise
-
-    def _generate_embedding_api(self, text: str) -> List[float]:
-        """Gera embedding usando a API do HuggingFace"""
+    def _generate_embeddings_api(self, texts: List[str]) -> List[List[float]]:
+        """Gera embeddings usando a API do HuggingFace (um lote por requisição)"""
         headers = {
             "Authorization": f"Bearer {self.hf_api_key}",
             "Content-Type": "application/json"
         }
         response = requests.post(
             self.hf_api_url,
-            json={"inputs": text},
+            json={"inputs": texts},
             headers=headers,
             timeout=10
         )
         response.raise_for_status()
         return response.json()
 
-    def _generate_embedding_local(self, text: str) -> List[float]:
-        """Gera embedding usando o modelo local"""
-        self._load_local_model()
-        embeddings = self.local_model.encode([text], convert_to_tensor=False)[0]
-        return embeddings.tolist()
-
-    def _generate_embedding(self, text: str) -> List[float]:
-        """Gera embedding usando API ou modelo local de forma aleatória, com fallback"""
-        # 70% de chance de usar a API, 30% de usar o modelo local
-        use_api = random.random() < 0.7
-        
-        try:
-            if use_api:
-                logger.info("Tentando gerar embedding via API...")
-                return self._generate_embedding_api(text)
-            else:
-                logger.info("Usando modelo local para gerar embedding...")
-                return self._generate_embedding_local(text)
-        except Exception as e:
-            logger.warning(f"Erro ao gerar embedding com método {'API' if use_api else 'local'}: {e}")
-            
-            # Se falhou usando API, tenta com modelo local como fallback
-            if use_api:
-                logger.info("Usando modelo local como fallback...")
-                try:
-                    return self._generate_embedding_local(text)
-                except Exception as fallback_error:
-                    logger.error(f"Erro também no fallback local: {fallback_error}")
-                    raise
-            else:
-                # Se falhou usando modelo local, tenta API como fallback
-                logger.info("Tentando API como fallback...")
-                try:
-                    return self._generate_embedding_api(text)
-                except Exception as fallback_error:
-                    logger.error(f"Erro também no fallback da API: {fallback_error}")
-                    raise
+    def _generate_embeddings_local(self, texts: List[str]) -> List[List[float]]:
+        """Gera embeddings usando o modelo local (micro-lotes compartilhados com outras requisições)"""
+        return self.embedding_engine.encode(texts)
+
+    def _generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Gera embeddings no backend (API ou modelo local) com menor latência esperada, com fallback"""
+        return self.embedding_router.generate(texts)
 
     def get_user_messages(self, user_id: str, limit: int = 100) -> List[Dict[str, Any]]:
         """Busca mensagens do usuário ordenadas por data"""
         try:
-            # Busca direto do Supabase para garantir dados atualizados
-            response = self.supabase.table('documents') \
-                .select('*') \
-                .eq('metadata->>type', 'chat_history') \
-                .eq('metadata->>user_id', str(user_id)) \
-                .order('created_at', desc=True) \
-                .limit(limit) \
-                .execute()
+            # Busca direto do armazenamento para garantir dados atualizados
+            data = self.store.select_documents(doc_types=['chat_history'], user_id=user_id,
+                                          order='created_at', desc=True, limit=limit)
             
-            if response.data:
-                logger.info(f"Encontradas {len(response.data)} mensagens do usuário")
-                messages = list(reversed(response.data))
+            if data:
+                logger.info(f"Encontradas {len(data)} mensagens do usuário")
+                messages = list(reversed(data))
                 
                 # Atualiza o Redis com os dados mais recentes (desabilita por enquanto)
                 #self.redis_cache.clear_chat_history(user_id)  # Limpa cache antigo
@@ -176,87 +192,310 @@ class SupabaseRAG:
             #     return messages
             return []
 
+    def get_user_documents(self, user_id: str, doc_type: str = 'memory', after_id: int = 0,
+                           page_size: int = 1000) -> List[Dict[str, Any]]:
+        """
+        Busca todos os documentos de um tipo de um usuário, com embedding, em ordem de id.
+
+        Args:
+            user_id (str): Usuário dono dos documentos
+            doc_type (str): Valor de metadata.type
+            after_id (int): Retorna apenas documentos com id maior (carga incremental)
+            page_size (int): Linhas por página
+        """
+        documents = []
+        last_id = after_id
+        while True:
+            page = self.store.select_documents('id, content, metadata, embedding', doc_types=[doc_type],
+                                          user_id=user_id, after_id=last_id, limit=page_size)
+            documents.extend(page)
+            if len(page) < page_size:
+                return documents
+            last_id = page[-1]['id']
+
+    def get_lexical_documents(self, after_id: int = 0, page_size: int = 1000) -> List[Dict[str, Any]]:
+        """
+        Documentos indexados pela camada lexical (base de conhecimento e resultados de
+        pesquisa), em ordem de id, sem embedding.
+
+        Args:
+            after_id (int): Retorna apenas documentos com id maior (carga incremental)
+            page_size (int): Linhas por página
+        """
+        documents = []
+        last_id = after_id
+        while True:
+            page = self.store.select_documents('id, content, metadata', doc_types=self.LEXICAL_DOC_TYPES,
+                                          after_id=last_id, limit=page_size)
+            documents.extend(page)
+            if len(page) < page_size:
+                return documents
+            last_id = page[-1]['id']
+
     def add_document(self, content: str, metadata: Dict = None) -> Dict:
-        """Adiciona um documento com seu embedding e validação de JSON"""
+        """
+        Adiciona um documento com seu embedding, de forma idempotente pelo hash do conteúdo.
+
+        Se o embedding já estiver em cache, o upsert é feito em uma única chamada; caso
+        contrário, a primeira chamada apenas verifica se o conteúdo existe, evitando gerar
+        embedding para documentos repetidos.
+
+        Returns:
+            Dict: {'id', 'inserted'} ou None em caso de erro
+        """
         try:
-            # Verifica se o documento já existe
-            result = self.supabase.table('documents')\
-                .select('id')\
-                .eq('content', content)\
-                .execute()
-            
-            if result.data:
+            metadata = metadata or {}
+
+            cached = self.embedding_store.get(content)
+            if cached is None:
+                # Verifica se o documento já existe (busca indexada por content_hash)
+                existing = self.store.upsert_document(content, metadata)
+                if existing:
+                    logger.info(f"Documento já existe, pulando: {content[:100]}...")
+                    return existing[0]
+                embedding = self.get_embedding(content)
+            else:
+                embedding = cached.tolist()
+
+            document = self.store.upsert_document(content, metadata, embedding)[0]
+            if document['inserted']:
+                logger.info(f"Documento adicionado com sucesso: {document}")
+            else:
                 logger.info(f"Documento já existe, pulando: {content[:100]}...")
-                return result.data[0]
+            return document
                 
-            # Se não existe, adiciona normalmente
-            embedding = self.get_embedding(content)
-            data = {
+        except Exception as e:
+            logger.error(f"Erro ao adicionar documento: {e}")
+            return None
+
+    def add_document_deferred(self, content: str, metadata: Dict = None) -> Dict:
+        """
+        Grava um documento sem embedding (marcado como embedding_pending), em um único insert.
+        O embedding é gerado depois pelo EmbeddingBackfillWorker.
+
+        Returns:
+            Dict: Linha inserida, {} se o conteúdo já existia, ou None em caso de erro
+        """
+        try:
+            doc_type = self.document_type(metadata)
+            inserted = self.store.upsert_rows([{
+                'doc_type': doc_type,
                 'content': content,
                 'metadata': metadata or {},
-                'embedding': embedding
-            }
-            
-            result = self.supabase.table('documents').insert(data).execute()
-            logger.info(f"Documento adicionado com sucesso: {result.data}")
-
-            return result.data[0]
-                
+                'content_hash': document_hash(doc_type, content, metadata),
+                'embedding_pending': True
+            }])
+            return inserted[0] if inserted else {}
         except Exception as e:
-            logger.error(f"Erro ao adicionar documento: {e}")
+            logger.error(f"Erro ao adicionar documento sem embedding: {e}")
             return None
 
+    def get_pending_embeddings(self, limit: int = 256) -> List[Dict[str, Any]]:
+        """Documentos aguardando embedding, do mais antigo para o mais recente"""
+        return self.store.select_documents('id, content', pending=True, limit=limit)
+
+    def backfill_embeddings(self, limit: int = 256) -> int:
+        """
+        Gera e grava, em lote, os embeddings de documentos pendentes.
+
+        Returns:
+            int: Número de documentos atualizados
+        """
+        pending = self.get_pending_embeddings(limit)
+        if not pending:
+            return 0
+        embeddings = self.get_embeddings([row['content'] for row in pending])
+        updated = self.store.set_embeddings([{'id': row['id'], 'embedding': embedding}
+                                        for row, embedding in zip(pending, embeddings)])
+        logger.info(f"Backfill de embeddings: {updated} documentos atualizados")
+        return updated
+
+    @staticmethod
+    def document_type(metadata: Dict = None) -> str:
+        """Partição de um documento, idêntica à calculada pelo banco (document_type)"""
+        return (metadata or {}).get('type') or 'knowledge'
+
+    def add_documents(self, documents: Iterable[Union[str, Dict]], batch_size: int = 500) -> Dict[str, Any]:
+        """
+        Ingestão em massa: lê a entrada em lotes, descarta conteúdos já existentes com uma
+        consulta por lote (doc_type, content_hash), gera os embeddings em lote e insere com inserts
+        multi-linha. Falhas em um lote não interrompem os demais.
+
+        Args:
+            documents: Textos ou dicts {'content', 'metadata'}
+            batch_size (int): Documentos por lote
+
+        Returns:
+            Dict[str, Any]: Relatório com total, inserted, skipped, failed, errors, elapsed e docs_per_second
+        """
+        start_time = time.time()
+        report = {'total': 0, 'inserted': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+        iterator = iter(documents)
+
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                break
+            report['total'] += len(batch)
+
+            # Deduplica dentro do lote
+            rows = {}
+            for document in batch:
+                if isinstance(document, str):
+                    document = {'content': document}
+                content = document.get('content')
+                if not content:
+                    report['skipped'] += 1
+                    continue
+                metadata = document.get('metadata') or {}
+                doc_type = self.document_type(metadata)
+                key = (doc_type, document_hash(doc_type, content, metadata))
+                if key in rows:
+                    report['skipped'] += 1
+                    continue
+                rows[key] = {
+                    'doc_type': key[0],
+                    'content': content,
+                    'metadata': metadata,
+                    'content_hash': key[1]
+                }
+
+            try:
+                # Deduplica contra o banco (uma consulta por bloco de hashes, limitando o tamanho da URL)
+                hashes = list({content_hash for _, content_hash in rows})
+                for start in range(0, len(hashes), 100):
+                    existing = self.store.select_documents('doc_type, content_hash',
+                                                      content_hashes=hashes[start:start + 100])
+                    for row in existing:
+                        if rows.pop((row['doc_type'], row['content_hash']), None) is not None:
+                            report['skipped'] += 1
+
+                if not rows:
+                    continue
+                new_rows = list(rows.values())
+                embeddings = self.get_embeddings([row['content'] for row in new_rows])
+                for row, embedding in zip(new_rows, embeddings):
+                    row['embedding'] = embedding
+            except Exception as e:
+                logger.error(f"Erro ao preparar lote para ingestão: {e}")
+                report['failed'] += len(rows)
+                report['errors'].append(str(e))
+                continue
+
+            self._insert_rows(new_rows, report)
+
+        report['elapsed'] = time.time() - start_time
+        report['docs_per_second'] = report['total'] / report['elapsed'] if report['elapsed'] else 0.0
+        logger.info(f"Ingestão concluída: {report['inserted']} inseridos, {report['skipped']} já existentes, "
+                    f"{report['failed']} falhas em {report['elapsed']:.2f}s "
+                    f"({report['docs_per_second']:.1f} docs/s)")
+        return report
+
+    def _insert_rows(self, rows: List[Dict], report: Dict[str, Any], chunk_size: int = 100) -> None:
+        """Insere linhas em blocos multi-linha; se um bloco falhar, insere linha a linha para isolar a falha"""
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            try:
+                inserted = self.store.upsert_rows(chunk)
+            except Exception as e:
+                logger.warning(f"Falha no insert de {len(chunk)} documentos, tentando individualmente: {e}")
+            else:
+                report['inserted'] += len(inserted)
+                report['skipped'] += len(chunk) - len(inserted)
+                self._index_lexical(inserted)
+                continue
+
+            for row in chunk:
+                try:
+                    inserted = self.store.upsert_rows([row])
+                except Exception as e:
+                    report['failed'] += 1
+                    report['errors'].append(f"{row['content'][:80]}: {e}")
+                    continue
+                report['inserted' if inserted else 'skipped'] += 1
+                self._index_lexical(inserted)
+
+    def _index_lexical(self, rows: List[Dict[str, Any]]) -> None:
+        """Indexa na camada lexical os documentos inseridos dos tipos que ela atende"""
+        if self.lexical_tier is None:
+            return
+        for row in rows:
+            if row.get('doc_type') in self.LEXICAL_DOC_TYPES:
+                self.lexical_tier.add({'id': row['id'], 'content': row['content'], 'metadata': row.get('metadata')})
+
+    @staticmethod
+    def search_result_metadata(url: str, summary: str = None) -> Dict[str, Any]:
+        """Metadata de um resultado de busca"""
+        return {
+            'type': 'search_result',
+            'url': url,
+            'timestamp': datetime.now().isoformat(),
+            'summary': summary
+        }
+
     def add_search_result(self, url: str, content: str, summary: str = None) -> Dict:
         """Adiciona um resultado de busca com seu embedding"""
         try:
-            metadata = {
-                'type': 'search_result',
-                'url': url,
-                'timestamp': datetime.now().isoformat(),
-                'summary': summary
-            }
-            return self.add_document(content, metadata)
+            metadata = self.search_result_metadata(url, summary)
+            document = self.add_document(content, metadata)
+            if document and document.get('inserted') and self.lexical_tier is not None:
+                self.lexical_tier.add({'id': document['id'], 'content': content, 'metadata': metadata})
+            return document
         except Exception as e:
             logger.error(f"Erro ao adicionar resultado de busca: {e}")
             return None
 
-    def get_search_results(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+    def purge_expired_documents(self, batch_size: int = 5000) -> Dict[str, int]:
+        """
+        Remove documentos mais antigos que a retenção do seu tipo (tabela document_retention),
+        em lotes para não manter locks longos.
+
+        Returns:
+            Dict[str, int]: Documentos removidos por tipo
+        """
+        removed: Dict[str, int] = {}
+        while True:
+            rows = self.store.purge_expired(batch_size)
+            for row in rows:
+                removed[row['purged_type']] = removed.get(row['purged_type'], 0) + row['removed']
+            if not any(row['removed'] >= batch_size for row in rows):
+                break
+        if any(removed.values()):
+            logger.info(f"Retenção: documentos expirados removidos por tipo: {removed}")
+        # A retenção informa apenas contagens; o índice lexical é recarregado sem os removidos
+        if self.lexical_tier is not None and any(removed.get(doc_type) for doc_type in self.LEXICAL_DOC_TYPES):
+            self.lexical_tier.rebuild()
+        return removed
+
+    def get_search_results(self, query: str, limit: int = 5,
+                           request: RequestContext = None) -> List[Dict[str, Any]]:
         """Busca resultados de pesquisa similares à query"""
         try:
-            # Gera embedding da query
-            query_embedding = self.get_embedding(query)
-            
-            # Busca resultados similares usando match_documents
-            similar_results = self.supabase.rpc(
-                'match_documents',
-                {
-                    'query_embedding': query_embedding,
-                    'similarity_threshold': 0.9,  # Threshold mais alto para maior precisão
-                    'match_count': limit
-                }
-            ).execute()
-            
-            if similar_results.data:
-                # Filtra apenas os que são do tipo search_result
-                search_results = [
-                    r for r in similar_results.data 
-                    if r['metadata'].get('type') == 'search_result'
-                ]
-                if search_results:
-                    logger.info(f"Encontrados {len(search_results)} resultados de busca similares")
-                    return search_results
+            # Busca apenas resultados do tipo search_result
+            def vector_search():
+                return self.search_filtered(
+                    query,
+                    limit=limit,
+                    doc_type='search_result',
+                    similarity_threshold=0.9,  # Threshold mais alto para maior precisão
+                    request=request
+                )
+
+            if self.lexical_tier is not None:
+                search_results = self.lexical_tier.search(query, limit, vector_search, doc_type='search_result')
+            else:
+                search_results = vector_search()
+            if search_results:
+                logger.info(f"Encontrados {len(search_results)} resultados de busca similares")
+                return search_results
             
             # Se não encontrou resultados similares, retorna os mais recentes
-            response = self.supabase.table('documents') \
-                .select('*') \
-                .eq('metadata->>type', 'search_result') \
-                .order('created_at', desc=True) \
-                .limit(limit) \
-                .execute()
+            recent = self.store.select_documents(doc_types=['search_result'], order='created_at',
+                                            desc=True, limit=limit)
             
-            if response.data:
-                logger.info(f"Encontrados {len(response.data)} resultados de busca recentes")
-                return response.data
+            if recent:
+                logger.info(f"Encontrados {len(recent)} resultados de busca recentes")
+                return recent
             return []
                 
         except Exception as e:
@@ -265,26 +504,32 @@ class SupabaseRAG:
             logger.error(traceback.format_exc())
             return []
 
-    def search_similar(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
-        """Busca documentos similares usando pgvector"""
+    def search_similar(self, query: str, limit: int = 5, query_embedding: List[float] = None,
+                       request: RequestContext = None) -> List[Dict[str, Any]]:
+        """Busca documentos similares por similaridade vetorial"""
+        if request is not None:
+            # Uma busca por mensagem: a primeira já traz request.search_limit documentos
+            return request.retrieve(
+                ('similar', query), limit,
+                lambda count: self._search_similar(query, count, query_embedding, request),
+                fetch=request.search_limit
+            )
+        return self._search_similar(query, limit, query_embedding)
+
+    def _search_similar(self, query: str, limit: int, query_embedding: List[float] = None,
+                        request: RequestContext = None) -> List[Dict[str, Any]]:
         logger.debug(f"Buscando documentos similares para a query: {query}")
         try:
-            # Gera embedding para a query
-            query_embedding = self.get_embedding(query)
+            # Gera embedding para a query (se o chamador ainda não o tiver)
+            if query_embedding is None:
+                query_embedding = self.query_embedding(query, request)
             
-            # Busca documentos similares usando a função match_documents do Supabase
-            response = self.supabase.rpc(
-                'match_documents',
-                {
-                    'query_embedding': query_embedding,
-                    'match_count': limit,
-                    'similarity_threshold': 0.5
-                }
-            ).execute()
+            # Busca documentos similares usando a função match_documents
+            data = self.store.match_documents(query_embedding, limit, 0.5)
             
-            if response.data:
-                logger.info(f"Encontrados {len(response.data)} documentos similares")
-                return response.data
+            if data:
+                logger.info(f"Encontrados {len(data)} documentos similares")
+                return data
             else:
                 logger.info("Encontrados 0 documentos similares")
                 return ""
@@ -293,10 +538,66 @@ class SupabaseRAG:
             logger.error(f"Erro na busca: {e}")
             return ""
 
-    def get_context(self, query: str) -> str:
+    def search_filtered(self, query: str, limit: int = 5, doc_type: str = None,
+                        user_id: Any = None, created_after: datetime = None,
+                        created_before: datetime = None, similarity_threshold: float = 0.5,
+                        query_embedding: List[float] = None,
+                        request: RequestContext = None) -> List[Dict[str, Any]]:
+        """
+        Busca documentos similares aplicando filtros de metadata no banco, antes do LIMIT.
+
+        Args:
+            query (str): Texto da busca
+            limit (int): Número máximo de documentos
+            doc_type (str): Filtra por metadata.type (ex: 'memory', 'search_result')
+            user_id: Filtra por metadata.user_id
+            created_after (datetime): Apenas documentos criados a partir desta data
+            created_before (datetime): Apenas documentos criados antes desta data
+            similarity_threshold (float): Similaridade mínima
+            query_embedding (List[float]): Embedding da query, se já calculado
+            request (RequestContext): Reaproveita embedding e resultados dentro da mensagem
+
+        Returns:
+            List[Dict[str, Any]]: Documentos ordenados por similaridade
+        """
+        filters = {'doc_type': doc_type, 'user_id': user_id, 'created_after': created_after,
+                   'created_before': created_before, 'similarity_threshold': similarity_threshold}
+        if request is not None:
+            key = ('filtered', query, doc_type, None if user_id is None else str(user_id),
+                   created_after, created_before, similarity_threshold)
+            return request.retrieve(
+                key, limit,
+                lambda count: self._search_filtered(query, count, filters, query_embedding, request)
+            )
+        return self._search_filtered(query, limit, filters, query_embedding)
+
+    def _search_filtered(self, query: str, limit: int, filters: Dict[str, Any],
+                         query_embedding: List[float] = None,
+                         request: RequestContext = None) -> List[Dict[str, Any]]:
+        logger.debug(f"Buscando documentos similares (type={filters['doc_type']}, "
+                     f"user_id={filters['user_id']}) para a query: {query}")
+        try:
+            if query_embedding is None:
+                query_embedding = self.query_embedding(query, request)
+
+            data = self.store.match_documents_filtered(query_embedding, limit, **filters)
+
+            logger.info(f"Encontrados {len(data)} documentos similares com filtros")
+            return data
+
+        except Exception as e:
+            logger.error(f"Erro na busca filtrada: {e}")
+            return []
+
+    def get_context(self, query: str, request: RequestContext = None) -> str:
         """Recupera e formata o contexto para uma query"""
         try:
-            similar_docs = self.search_similar(query)
+            if self.lexical_tier is not None:
+                similar_docs = self.lexical_tier.search(
+                    query, 5, lambda: self.search_similar(query, request=request) or []
+                )
+            else:
+                similar_docs = self.search_similar(query, request=request)
             
             if not similar_docs:
                 return ""
@@ -321,8 +622,13 @@ class SupabaseRAG:
     def setup_database(self):
         """Configura a tabela de documentos se não existir"""
         try:
-            logger.info("Verificando conexão com Supabase...")
-            self.supabase.table('documents').select("*").limit(1).execute()
+            logger.info("Verificando conexão com o banco...")
+            self.store.select_documents('id', limit=1)
         except Exception as e:
-            logger.error(f"Erro ao configurar Supabase: {e}")
-            raise
\ No newline at end of file
+            logger.error(f"Erro ao configurar banco: {e}")
+            raise
+
+
+def create_rag(redis_cache, metrics=None) -> SupabaseRAG:
+    """Cria o RAG sobre o armazenamento configurado em RAG_BACKEND (ver core.storage)"""
+    return SupabaseRAG(redis_cache, metrics)
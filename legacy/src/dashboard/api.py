@@ -23,8 +23,6 @@ print(os.getenv('REDIS_PASSWORD', ''))
 
 from core.metrics_collector import MetricsCollector
 from core.llm_handler import LLMHandler
-from core.redis_cache import RedisCache
-from core.supabase_rag import SupabaseRAG
 
 app = FastAPI(title="Horus Bot Dashboard API")
 
@@ -40,6 +38,11 @@ app.add_middleware(
 # Initialize components
 metrics = MetricsCollector()
 
+@app.on_event("shutdown")
+def close_rag():
+    """Close the shared RAG's storage connections."""
+    metrics.close_rag()
+
 # Get database path from metrics collector
 DB_PATH = metrics.db_path
 
@@ -347,6 +350,23 @@ async def get_cache_metrics():
         logging.error(f"Error getting cache metrics: {e}")
         return []
 
+@app.get("/metrics/tokens")
+async def get_token_metrics(hours: int = 24):
+    """Get token usage aggregated per user and per hour."""
+    try:
+        return metrics.get_token_usage(hours)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics/tools")
+async def get_tool_metrics(hours: int = 24):
+    """Get per-tool call counts, latency histograms and payload sizes."""
+    try:
+        return metrics.get_tool_metrics(hours)
+    except Exception as e:
+        logging.error(f"Error getting tool metrics: {e}")
+        return []
+
 @app.get("/metrics/resources")
 async def get_resource_metrics(hours: int = 24):
     """Get detailed resource usage metrics."""
@@ -527,7 +547,7 @@ async def get_working_memory(user_id: str):
 async def get_long_term_memory(user_id: str):
     """Get long-term memories for a specific user from Supabase."""
     try:
-        rag = SupabaseRAG(metrics)
+        rag = metrics.get_rag()
         memories = rag.get_user_memories(user_id)
         return {"memories": memories}
     except Exception as e:
@@ -538,15 +558,9 @@ async def get_long_term_memory(user_id: str):
 async def get_similar_memories(query: str, user_id: str, limit: int = 10):
     """Get memories similar to a query."""
     try:
-        rag = SupabaseRAG(metrics)
-        memories = rag.search_similar(query, limit=limit)
-        # Filtra apenas memórias do usuário
-        relevant_memories = [
-            mem for mem in memories 
-            if mem.get('metadata', {}).get('type') == 'memory' 
-            and str(mem.get('metadata', {}).get('user_id')) == str(user_id)
-        ]
-        return {"memories": relevant_memories}
+        rag = metrics.get_rag()
+        memories = rag.search_filtered(query, limit=limit, doc_type='memory', user_id=user_id)
+        return {"memories": memories}
     except Exception as e:
         logger.error(f"Error getting similar memories: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -555,7 +569,7 @@ async def get_similar_memories(query: str, user_id: str, limit: int = 10):
 async def get_user_chat_history(user_id: str, limit: int = 80):
     """Get chat history for a specific user."""
     try:
-        rag = SupabaseRAG(metrics)
+        rag = metrics.get_rag()
         messages = rag.get_user_messages(user_id, limit)
         return {"messages": messages}
     except Exception as e:
@@ -396,6 +396,27 @@ app.layout = html.Div([
                     ])
                 ], className='dashboard-card'),
                 
+                # Telemetria de Tools
+                html.Div([
+                    html.H3('Telemetria de Tools'),
+                    dcc.Graph(id='tool-metrics-graph'),
+                    dash_table.DataTable(
+                        id='tool-metrics-table',
+                        columns=[
+                            {'name': 'Tool', 'id': 'tool_name'},
+                            {'name': 'Chamadas', 'id': 'calls'},
+                            {'name': 'Falhas', 'id': 'failures'},
+                            {'name': 'Cache Hits', 'id': 'cache_hits'},
+                            {'name': 'Latência Média (s)', 'id': 'avg_latency'},
+                            {'name': 'p95 (s)', 'id': 'p95_latency'},
+                            {'name': 'Tempo Total (s)', 'id': 'total_latency'},
+                            {'name': 'Resposta Média (bytes)', 'id': 'avg_response_bytes'}
+                        ],
+                        style_table={'overflowX': 'auto'},
+                        style_cell={'textAlign': 'left'}
+                    )
+                ], className='dashboard-card'),
+                
                 # Log de Operações
                 html.Div([
                     html.H3('Log de Operações'),
@@ -1085,6 +1106,61 @@ def update_cache_hit_ratio_graph(n):
         print(f"Error updating cache hit ratio graph: {e}")
         return {}
 
+@app.callback(
+    [Output('tool-metrics-graph', 'figure'),
+     Output('tool-metrics-table', 'data')],
+    Input('api-metrics-interval', 'n_intervals')
+)
+def update_tool_metrics(n):
+    """Update per-tool telemetry graph and table."""
+    try:
+        response = requests.get(f"{API_BASE_URL}/metrics/tools")
+        if response.status_code != 200:
+            return create_empty_graph("Erro ao carregar telemetria de tools"), []
+        
+        tools = response.json()
+        if not tools:
+            return create_empty_graph("Nenhuma execução de tool registrada"), []
+        
+        # Cria gráfico com subplots
+        fig = make_subplots(rows=1, cols=2,
+                          subplot_titles=('Tempo Total por Tool (s)',
+                                        'Histograma de Latência'))
+        
+        names = [tool['tool_name'] for tool in tools]
+        fig.add_trace(
+            go.Bar(x=names,
+                  y=[tool['total_latency'] for tool in tools],
+                  name='Tempo total'),
+            row=1, col=1
+        )
+        
+        for tool in tools:
+            fig.add_trace(
+                go.Bar(x=tool['latency_buckets'],
+                      y=tool['latency_histogram'],
+                      name=tool['tool_name']),
+                row=1, col=2
+            )
+        
+        fig.update_layout(height=400, showlegend=True, barmode='group')
+        
+        table = [{
+            'tool_name': tool['tool_name'],
+            'calls': tool['calls'],
+            'failures': tool['failures'],
+            'cache_hits': tool['cache_hits'],
+            'avg_latency': round(tool['avg_latency'], 3),
+            'p95_latency': tool['p95_latency'],
+            'total_latency': round(tool['total_latency'], 2),
+            'avg_response_bytes': round(tool['avg_response_bytes'])
+        } for tool in tools]
+        
+        return fig, table
+    except Exception as e:
+        print(f"Error updating tool metrics: {e}")
+        return create_empty_graph("Erro ao carregar telemetria de tools"), []
+
 @app.callback(
     Output('operations-log-table', 'data'),
     Input('memory-operations-interval', 'n_intervals')
@@ -10,8 +10,11 @@ from telegram.ext import (
     JobQueue,
 )
 from core.metrics_collector import MetricsCollector
-from core.supabase_rag import SupabaseRAG
+from core.supabase_rag import create_rag
 from core.redis_cache import RedisCache
+from core.embedding_backfill import EmbeddingBackfillWorker
+from core.memory_index import MemoryIndex
+from core.memory_consolidation import MemoryConsolidator
 from core.llm import (
     HorusAI,
     GeminiProvider,
@@ -20,6 +23,9 @@ from core.llm import (
     WebSearchProvider,
     DefaultMetricsProvider
 )
+from core.llm.horus import OWNER_USER_ID
+from core.llm.tools import create_tool_mediator
+from core.llm.providers.rate_limiter import RateLimiter, QuotaScheduler, parse_weights
 from dotenv import load_dotenv
 import asyncio
 from datetime import datetime, timedelta
@@ -39,15 +45,38 @@ class AssistentBot:
     def __init__(self):
         # Inicializa componentes base
         self.redis_cache = RedisCache()
-        self.rag = SupabaseRAG(redis_cache=self.redis_cache)
         self.metrics = MetricsCollector()
+        self.rag = create_rag(redis_cache=self.redis_cache, metrics=self.metrics)
+        self.backfill_worker = EmbeddingBackfillWorker(self.rag)
+        self.backfill_worker.start()
+        self.memory_index = MemoryIndex.from_env(self.rag)
+        self.memory_consolidator = MemoryConsolidator.from_env(self.rag, self.redis_cache, self.memory_index)
+        self.memory_consolidator.start()
+
+        # Cota do Gemini compartilhada por todas as instâncias do provider
+        weights = {str(OWNER_USER_ID): 4.0}
+        weights.update(parse_weights(os.getenv('QUOTA_USER_WEIGHTS')))
+        self.quota_scheduler = QuotaScheduler(
+            RateLimiter(tokens_per_second=float(os.getenv('GEMINI_RPM', 15)) / 60, burst=5),
+            user_tokens_per_second=float(os.getenv('GEMINI_USER_RPM', 6)) / 60,
+            user_burst=3,
+            weights=weights,
+            metrics=self.metrics,
+            token_limiter=RateLimiter(
+                tokens_per_second=float(os.getenv('GEMINI_TPM', 1000000)) / 60,
+                burst=int(os.getenv('GEMINI_TPM', 1000000))
+            )
+        )
+
+        # Tools compartilhadas, com cache de resultados no Redis
+        self.tool_mediator = create_tool_mediator(cache=self.redis_cache, metrics=self.metrics)
 
         # Inicializa HorusAI
         self.llm = HorusAI(
-            llm=GeminiProvider(),
-            memory=RAGMemoryProvider(self.rag, self.redis_cache),
-            chat_history=RAGChatHistoryProvider(self.rag, self.redis_cache),
-            search=WebSearchProvider(GeminiProvider(), self.redis_cache, self.rag),
+            llm=GeminiProvider(self.quota_scheduler, self.tool_mediator),
+            memory=RAGMemoryProvider(self.rag, self.redis_cache, self.memory_index),
+            chat_history=RAGChatHistoryProvider(self.rag, self.redis_cache, self.backfill_worker),
+            search=WebSearchProvider(GeminiProvider(self.quota_scheduler, self.tool_mediator), self.redis_cache, self.rag),
             metrics=DefaultMetricsProvider(self.metrics),
             system_prompt="""Você é Horus, um assistente pessoal avançado desenvolvido por Pedro Braga.
 
@@ -219,6 +248,24 @@ def main():
     application.add_handler(MessageHandler(filters.ALL, bot.handle_message))
     # iniciar o monitor de recursos dentro da jobqueue do proprio pacote do telegram
     application.job_queue.run_repeating(load_resources_monitor, interval=60)
+    # Remove documentos expirados conforme a retenção de cada tipo (chat, resultados de busca)
+    async def purge_expired_documents(ctx):
+        try:
+            await asyncio.to_thread(bot.rag.purge_expired_documents)
+        except Exception as e:
+            logger.error(f"Error purging expired documents: {e}")
+
+    retention_interval = int(os.getenv('DOCUMENT_RETENTION_INTERVAL', 3600))
+    if retention_interval > 0:
+        application.job_queue.run_repeating(purge_expired_documents, interval=retention_interval, first=60)
+    # Grava a janela de telemetria das tools mesmo quando não há novas execuções
+    tool_telemetry = bot.tool_mediator.telemetry
+    if tool_telemetry is not None:
+        async def flush_tool_telemetry(ctx):
+            await asyncio.to_thread(tool_telemetry.flush)
+
+        application.job_queue.run_repeating(flush_tool_telemetry, interval=tool_telemetry.flush_interval,
+                                            first=tool_telemetry.flush_interval)
     logger.info('Bot iniciado, aguardando mensagens...')
     
     # Configura e executa o event loop manualmente
@@ -240,6 +287,9 @@ def main():
     except KeyboardInterrupt:
         loop.run_until_complete(application.stop())
     finally:
+        # Grava a última janela de telemetria antes de encerrar
+        if tool_telemetry is not None:
+            tool_telemetry.flush()
         loop.close()
 
 async def setup_knowledge_base(rag):
@@ -248,11 +298,11 @@ async def setup_knowledge_base(rag):
         knowledge_path = 'initial_knowledge.txt'
         if os.path.exists(knowledge_path):
             with open(knowledge_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line:  # Ignora linhas vazias
-                        rag.add_document(line)
-            logger.info(f"Knowledge base loaded from {knowledge_path}")
+                # Ignora linhas vazias
+                report = rag.add_documents(line.strip() for line in f if line.strip())
+            logger.info(f"Knowledge base loaded from {knowledge_path}: {report['inserted']} inserted, "
+                        f"{report['skipped']} skipped, {report['failed']} failed "
+                        f"({report['docs_per_second']:.1f} docs/s)")
         else:
             logger.warning(f"Knowledge base file not found at {knowledge_path}")
     except Exception as e:
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos do bot são importados a partir de src/ (como em main.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
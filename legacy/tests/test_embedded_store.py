@@ -0,0 +1,118 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from core.storage.embedded_store import EmbeddedDocumentStore
+
+DIMENSION = 8
+
+def unit_vector(index: int):
+    vector = [0.0] * DIMENSION
+    vector[index] = 1.0
+    return vector
+
+def document(content: str, doc_type: str = 'memory', user_id: str = '1', embedding=None):
+    return {'content': content, 'metadata': {'type': doc_type, 'user_id': user_id},
+            'embedding': embedding, 'embedding_pending': embedding is None}
+
+@pytest.fixture
+def store(tmp_path):
+    store = EmbeddedDocumentStore(str(tmp_path))
+    yield store
+    store.conn.close()
+
+def segment_rows(store: EmbeddedDocumentStore) -> int:
+    return os.path.getsize(store.vectors_path) // (DIMENSION * 4)
+
+def test_upsert_rows_deduplicates_by_type_and_content(store):
+    inserted = store.upsert_rows([document('a', embedding=unit_vector(0)), document('a', embedding=unit_vector(0))])
+    assert [row['content'] for row in inserted] == ['a']
+
+    assert store.upsert_rows([document('a', embedding=unit_vector(1))]) == []
+    # O mesmo conteúdo em outro tipo é outro documento
+    assert len(store.upsert_rows([document('a', 'search_result', embedding=unit_vector(1))])) == 1
+
+    assert len(store.select_documents('id')) == 2
+    assert segment_rows(store) == 2
+
+def test_match_documents_filtered(store):
+    store.upsert_rows([
+        document('memória do 1', user_id='1', embedding=unit_vector(0)),
+        document('memória do 2', user_id='2', embedding=unit_vector(0)),
+        document('pesquisa', 'search_result', user_id='1', embedding=unit_vector(0)),
+        document('memória distante', user_id='1', embedding=unit_vector(1)),
+    ])
+
+    results = store.match_documents_filtered(unit_vector(0), 5, 0.5, doc_type='memory', user_id='1')
+    assert [row['content'] for row in results] == ['memória do 1']
+    assert results[0]['similarity'] == pytest.approx(1.0)
+    assert set(results[0]) == {'id', 'content', 'metadata', 'similarity', 'created_at'}
+
+    results = store.match_documents_filtered(unit_vector(0), 5, 0.5, user_id='1')
+    assert sorted(row['content'] for row in results) == ['memória do 1', 'pesquisa']
+
+    now = datetime.now(timezone.utc)
+    assert store.match_documents_filtered(unit_vector(0), 5, 0.5, created_after=now + timedelta(minutes=1)) == []
+    assert len(store.match_documents_filtered(unit_vector(0), 5, 0.5,
+                                              created_before=now + timedelta(minutes=1))) == 3
+
+def test_tombstones_are_removed_by_compact(store, tmp_path):
+    inserted = store.upsert_rows([document('a'), document('b'), document('c')])
+    ids = {row['content']: row['id'] for row in inserted}
+    assert store.set_embeddings([{'id': ids[c], 'embedding': unit_vector(i)} for i, c in enumerate('abc')]) == 3
+    assert store.select_documents('id', pending=True) == []
+
+    # Substituir um embedding e remover uma memória deixam lápides no segmento
+    store.set_embeddings([{'id': ids['a'], 'embedding': unit_vector(3)}])
+    store.consolidate_memories(ids['c'], [ids['b']])
+    assert segment_rows(store) == 4
+    assert np.count_nonzero(store._row_ids) == 2
+
+    store.compact()
+    assert segment_rows(store) == 2
+    assert [row['content'] for row in store.match_documents(unit_vector(3), 5, 0.5)] == ['a']
+    assert [row['content'] for row in store.match_documents(unit_vector(2), 5, 0.5)] == ['c']
+    assert store.match_documents(unit_vector(0), 5, 0.5) == []
+
+    # O mapa linha -> documento compactado é o mesmo ao reabrir
+    store.conn.close()
+    reopened = EmbeddedDocumentStore(str(tmp_path))
+    try:
+        assert [row['content'] for row in reopened.match_documents(unit_vector(3), 5, 0.5)] == ['a']
+        assert reopened.select_documents('content, embedding', doc_types=['memory'])[0]['embedding'] == unit_vector(3)
+    finally:
+        reopened.conn.close()
+
+def test_partial_write_is_truncated_on_open(store, tmp_path):
+    store.upsert_rows([document('a', embedding=unit_vector(0)), document('b', embedding=unit_vector(1))])
+    store.conn.close()
+
+    # Escrita interrompida no meio de um vetor
+    with open(store.vectors_path, 'ab') as f:
+        f.write(np.asarray(unit_vector(2), dtype=np.float32).tobytes()[:DIMENSION * 2])
+
+    reopened = EmbeddedDocumentStore(str(tmp_path))
+    try:
+        assert os.path.getsize(reopened.vectors_path) == 2 * DIMENSION * 4
+        assert [row['content'] for row in reopened.match_documents(unit_vector(1), 5, 0.5)] == ['b']
+        # Novos vetores continuam alinhados depois da truncagem
+        reopened.upsert_rows([document('c', embedding=unit_vector(2))])
+        assert [row['content'] for row in reopened.match_documents(unit_vector(2), 5, 0.5)] == ['c']
+    finally:
+        reopened.conn.close()
+
+def test_repeated_chat_messages_are_kept(store):
+    def message(timestamp, user_id='1'):
+        return {'content': 'ok', 'embedding_pending': True,
+                'metadata': {'type': 'chat_history', 'role': 'user', 'user_id': user_id, 'timestamp': timestamp}}
+
+    inserted = store.upsert_rows([message('2026-01-01T10:00:00'), message('2026-01-01T10:05:00'),
+                                  message('2026-01-01T10:00:00', user_id='2')])
+    assert len(inserted) == 3
+    # A mesma mensagem gravada de novo (mesmo usuário e horário) continua deduplicada
+    assert store.upsert_rows([message('2026-01-01T10:00:00')]) == []
+
+    # Nos demais tipos a deduplicação segue só pelo conteúdo
+    assert len(store.upsert_rows([document('ok', user_id='1'), document('ok', user_id='2')])) == 1
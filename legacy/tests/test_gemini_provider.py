@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from core.llm.providers import gemini
+from core.llm.providers.gemini import GeminiProvider
+from core.llm.providers.rate_limiter import QuotaScheduler, RateLimiter
+
+ERROR_MESSAGE = "Desculpe, ocorreu um erro ao processar sua solicitação."
+
+class FakeResponse:
+    usage_metadata = None
+    candidates = []
+
+class FakeModel:
+    """GenerativeModel falso; registra a system instruction de cada mensagem enviada"""
+    barrier = None
+    fail = False
+    created = []
+    sent = {}
+
+    def __init__(self, model_name=None, system_instruction=None, **kwargs):
+        self.system_instruction = system_instruction
+        FakeModel.created.append(self)
+
+    def start_chat(self):
+        return self
+
+    def send_message(self, prompt):
+        if self.barrier is not None:
+            # Mantém as chamadas em andamento ao mesmo tempo
+            self.barrier.wait(5)
+        if self.fail:
+            raise RuntimeError('falha na API')
+        FakeModel.sent[prompt] = self.system_instruction
+        return FakeResponse()
+
+@pytest.fixture
+def scheduler():
+    return QuotaScheduler(RateLimiter(tokens_per_second=100, burst=100),
+                          user_tokens_per_second=100, user_burst=100,
+                          token_limiter=RateLimiter(tokens_per_second=0.001, burst=10000))
+
+@pytest.fixture
+def provider(monkeypatch, scheduler):
+    monkeypatch.setenv('GEMINI_API_KEY', 'teste')
+    monkeypatch.setattr(gemini.genai, 'GenerativeModel', FakeModel)
+    monkeypatch.setattr(FakeModel, 'created', [])
+    monkeypatch.setattr(FakeModel, 'sent', {})
+    return GeminiProvider(scheduler, tool_mediator=object())
+
+def instruction(text):
+    return {'parts': {'text': text}}
+
+def test_concurrent_calls_use_their_own_model(provider, monkeypatch):
+    default_model = provider.model
+    monkeypatch.setattr(FakeModel, 'barrier', threading.Barrier(2))
+
+    threads = [threading.Thread(target=provider.generate_text, args=(user, instruction(f'contexto de {user}')))
+               for user in ('ana', 'bruno')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert FakeModel.sent == {'ana': 'contexto de ana', 'bruno': 'contexto de bruno'}
+    assert provider.model is default_model
+
+def test_failed_call_releases_token_reservation(provider, monkeypatch, scheduler):
+    monkeypatch.setattr(FakeModel, 'fail', True)
+    before = scheduler.token_limiter.tokens
+
+    assert provider.generate_text('oi', instruction('contexto')) == ERROR_MESSAGE
+    assert scheduler.token_limiter.tokens == pytest.approx(before, abs=1)
+
+def test_denied_quota_skips_the_call(provider, monkeypatch, scheduler):
+    monkeypatch.setattr(scheduler, 'acquire', lambda **kwargs: False)
+    models = len(FakeModel.created)
+
+    assert provider.generate_text('oi', instruction('contexto')) == ERROR_MESSAGE
+    assert len(FakeModel.created) == models
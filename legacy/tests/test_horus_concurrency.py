@@ -0,0 +1,75 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from core.llm.horus import HorusAI
+from core.llm.providers.rate_limiter import QuotaScheduler, RateLimiter, current_quota_user
+
+MESSAGES_PER_USER = 6
+
+class QuotaLLM:
+    """LLM falso que só aguarda cota no escalonador e registra a ordem das concessões"""
+
+    def __init__(self, scheduler: QuotaScheduler):
+        self.scheduler = scheduler
+        self.granted = []
+        self._lock = threading.Lock()
+
+    def generate_text(self, prompt, system_instruction=None):
+        assert self.scheduler.acquire(timeout=10)
+        with self._lock:
+            self.granted.append(current_quota_user.get())
+        return 'ok'
+
+class NullMemory:
+    def get_memories(self, user_info):
+        return []
+
+    def update_working_memory(self, text, user_info, request=None):
+        pass
+
+class NullChatHistory:
+    def get_history(self, user_info):
+        return []
+
+    def store_message(self, role, content, user_info):
+        pass
+
+class NullMetrics:
+    def record_interaction(self, **kwargs):
+        pass
+
+@pytest.fixture
+def scheduler():
+    # Bucket global esvaziado: nenhuma concessão até que todas as mensagens estejam na fila
+    global_limiter = RateLimiter(tokens_per_second=20, burst=1)
+    global_limiter.acquire()
+    return QuotaScheduler(global_limiter, user_tokens_per_second=1000, user_burst=100,
+                          weights={'1': 3, '2': 1})
+
+@pytest.fixture
+def horus(scheduler):
+    HorusAI._instance = None
+    horus = HorusAI(QuotaLLM(scheduler), NullMemory(), NullChatHistory(), None, NullMetrics(), 'teste')
+    yield horus
+    HorusAI._instance = None
+
+def test_concurrent_users_interleave_by_weight(horus):
+    async def run():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=2 * MESSAGES_PER_USER))
+        # Todas as mensagens do usuário 1 são agendadas antes das do usuário 2; se as chamadas
+        # ao LLM bloqueassem o event loop, o usuário 2 só seria atendido depois do usuário 1
+        messages = [horus.process_text('oi', {'id': 1}) for _ in range(MESSAGES_PER_USER)]
+        messages += [horus.process_text('oi', {'id': 2}) for _ in range(MESSAGES_PER_USER)]
+        return await asyncio.gather(*messages)
+
+    assert asyncio.run(run()) == ['ok'] * (2 * MESSAGES_PER_USER)
+
+    granted = horus.llm.granted
+    # Peso 3:1: enquanto os dois disputam a cota, o usuário 1 recebe três concessões por uma do 2
+    assert granted[:8].count('1') == 6
+    assert granted[:8].count('2') == 2
+    assert '2' in granted[:4]
+    assert granted[8:] == ['2'] * 4
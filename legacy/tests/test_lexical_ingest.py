@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from core.lexical_tier import LexicalTier
+from core.storage.embedded_store import EmbeddedDocumentStore
+from core.supabase_rag import SupabaseRAG
+
+class OfflineRAG(SupabaseRAG):
+    """SupabaseRAG sobre o armazenamento embarcado, com embeddings fixos (sem Redis nem modelo)"""
+
+    def __init__(self, store):
+        self.store = store
+        self.lexical_tier = LexicalTier(self)
+
+    def get_embeddings(self, texts):
+        return [[1.0, 0.0, 0.0, 0.0] for _ in texts]
+
+@pytest.fixture
+def rag(tmp_path):
+    store = EmbeddedDocumentStore(str(tmp_path))
+    yield OfflineRAG(store)
+    store.conn.close()
+
+def test_bulk_ingest_feeds_lexical_tier(rag):
+    report = rag.add_documents([
+        {'content': 'o telescópio james webb observa no infravermelho'},
+        {'content': 'receita de pão de queijo mineiro', 'metadata': {'type': 'search_result', 'url': 'x'}},
+        {'content': 'usuário gosta de café', 'metadata': {'type': 'memory', 'user_id': '1'}},
+    ])
+    assert report['inserted'] == 3
+
+    # Apenas base de conhecimento e resultados de pesquisa vão para o índice BM25
+    assert sorted(document['content'] for document in rag.lexical_tier.documents) == [
+        'o telescópio james webb observa no infravermelho',
+        'receita de pão de queijo mineiro',
+    ]
+    results = rag.lexical_tier.search_lexical('telescópio webb', 1)
+    assert results[0]['content'] == 'o telescópio james webb observa no infravermelho'
+
+    # Documentos já existentes não são indexados de novo
+    assert rag.add_documents(['o telescópio james webb observa no infravermelho'])['skipped'] == 1
+    assert len(rag.lexical_tier.documents) == 2
+
+def test_purged_documents_leave_lexical_tier(rag):
+    rag.add_documents([
+        {'content': 'resultado antigo sobre marte', 'metadata': {'type': 'search_result', 'url': 'a'}},
+        {'content': 'resultado recente sobre vênus', 'metadata': {'type': 'search_result', 'url': 'b'}},
+    ])
+    with rag.store.conn:
+        rag.store.conn.execute("UPDATE documents SET created_at = '2000-01-01T00:00:00.000000+00:00' "
+                               "WHERE content = 'resultado antigo sobre marte'")
+
+    assert rag.purge_expired_documents()['search_result'] == 1
+    assert [document['content'] for document in rag.lexical_tier.documents] == ['resultado recente sobre vênus']
+    assert rag.lexical_tier.search_lexical('marte', 3, doc_type='search_result') == []
+
+def test_remove_drops_documents_from_index(rag):
+    rag.add_documents(['gatos dormem muito', 'cachorros gostam de passear'])
+    cat_id = next(document['id'] for document in rag.lexical_tier.documents if 'gatos' in document['content'])
+    with rag.store.conn:
+        rag.store.conn.execute('DELETE FROM documents WHERE id = ?', (cat_id,))
+
+    assert rag.lexical_tier.remove([cat_id, 999]) == 1
+    assert rag.lexical_tier.search_lexical('gatos', 3) == []
+    assert rag.lexical_tier.search_lexical('cachorros', 3)[0]['content'] == 'cachorros gostam de passear'
+
+def test_refresh_does_not_block_searches(rag):
+    rag.add_documents(['o telescópio james webb observa no infravermelho'])
+    tier = rag.lexical_tier
+    fetching, release = threading.Event(), threading.Event()
+
+    def slow_fetch(after_id=0, page_size=1000):
+        fetching.set()
+        release.wait(5)
+        return []
+
+    rag.get_lexical_documents = slow_fetch
+    refresh = threading.Thread(target=tier.refresh, kwargs={'force': True})
+    refresh.start()
+    try:
+        assert fetching.wait(5)
+        start = time.time()
+        assert tier.search_lexical('telescópio', 1)[0]['content'].startswith('o telescópio')
+        assert time.time() - start < 1
+    finally:
+        release.set()
+        refresh.join()
@@ -0,0 +1,52 @@
+import threading
+import time
+
+from core.memory_index import MemoryIndex
+
+class SlowRAG:
+    """Fonte de memórias em que a carga do usuário 'lento' fica presa até ser liberada"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_user_documents(self, user_id, doc_type=None, after_id=0):
+        with self.lock:
+            self.calls.append(user_id)
+        if user_id == 'lento':
+            self.release.wait(5)
+        return [{'id': 1, 'content': f'memória de {user_id}',
+                 'metadata': {'timestamp': '2026-01-01'}, 'embedding': [1.0, 0.0, 0.0, 0.0]}]
+
+def test_slow_load_does_not_block_other_users():
+    rag = SlowRAG()
+    index = MemoryIndex(rag, dim=4)
+    slow = threading.Thread(target=index.get, args=('lento',))
+    slow.start()
+    while 'lento' not in rag.calls:
+        time.sleep(0.01)
+
+    started = time.monotonic()
+    assert len(index.get('rapido')) == 1
+    index.add('lento', 2, {'content': 'x', 'metadata': {'timestamp': '2026-01-01'}}, [0.0, 1.0, 0.0, 0.0])
+    assert time.monotonic() - started < 1.0
+
+    rag.release.set()
+    slow.join(5)
+    assert len(index.get('lento')) == 1
+
+def test_concurrent_gets_load_user_once():
+    rag = SlowRAG()
+    index = MemoryIndex(rag, dim=4)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(index.get('lento'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    rag.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert rag.calls == ['lento']
+    assert len({id(result) for result in results}) == 1
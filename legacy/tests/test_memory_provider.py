@@ -0,0 +1,39 @@
+from core.llm.providers.memory import RAGMemoryProvider
+
+class FakeRAG:
+    def query_embedding(self, query, request=None):
+        return [1.0, 0.0] if query == 'a' else [0.0, 1.0]
+
+    def search_filtered(self, query, limit, doc_type, user_id, query_embedding, request):
+        return [{'content': f'memória de {user_id}', 'metadata': {'timestamp': '2026-01-01'},
+                 'similarity': 0.8}]
+
+class FakeCache:
+    def __init__(self):
+        self.full_updates = []
+
+    def touch_memories(self, user_id):
+        return True
+
+    def update_memories(self, user_id, memories, limit):
+        self.full_updates.append(user_id)
+
+    def apply_memory_diff(self, user_id, added, removed):
+        pass
+
+def test_working_state_is_bounded_lru():
+    cache = FakeCache()
+    provider = RAGMemoryProvider(FakeRAG(), cache, max_users=2)
+    provider.update_working_memory('a', {'id': 1})
+    provider.update_working_memory('a', {'id': 2})
+    # Reaproveitar o usuário 1 o torna o mais recente; o 2 é descartado na entrada do 3
+    provider.update_working_memory('a', {'id': 1})
+    provider.update_working_memory('a', {'id': 3})
+
+    assert list(provider._working_state) == ['1', '3']
+    assert cache.full_updates == ['1', '2', '3']
+
+    # Usuário descartado volta a fazer a busca completa
+    provider.update_working_memory('a', {'id': 2})
+    assert cache.full_updates == ['1', '2', '3', '2']
+    assert list(provider._working_state) == ['3', '2']
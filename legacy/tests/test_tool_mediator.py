@@ -0,0 +1,35 @@
+import threading
+import time
+
+from core.llm import tools
+from core.llm.tools import ToolMediator
+
+def blocking_tool(release: threading.Event, calls: list):
+    def command():
+        calls.append(time.time())
+        release.wait(5)
+        return 'ok'
+    return command
+
+def test_slot_wait_is_bounded(monkeypatch):
+    monkeypatch.setattr(tools, 'SLOT_WAIT_TIMEOUT', 0.2)
+    release, calls = threading.Event(), []
+    mediator = ToolMediator()
+    mediator.register('slow', blocking_tool(release, calls), timeout=30, max_concurrency=1)
+
+    holder = threading.Thread(target=mediator.execute, args=('slow',))
+    holder.start()
+    while not calls:
+        time.sleep(0.01)
+
+    try:
+        start = time.time()
+        result = mediator.execute('slow')
+        assert result['error'] == 'busy'
+        assert time.time() - start < 1
+        assert len(calls) == 1
+    finally:
+        release.set()
+        holder.join()
+
+    assert mediator.execute('slow')['ok'] is True